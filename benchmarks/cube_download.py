@@ -0,0 +1,276 @@
+"""
+Benchmarks of the cube download path, run against the in-process fake Geocube (see geocube.testing).
+
+Targets:
+- cube_iterator:     decoding of an in-memory GetCube stream by CubeIterator (no gRPC)
+- client.get_cube:   Client.get_cube through gRPC
+- sdk.get_cube:      sdk.get_cube (new client, callbacks, stacking of the timeseries)
+- downloader.get_cube: Client.get_cube through a Downloader (DownloadCube)
+- xarray:            xarray backend (skipped if it cannot be imported)
+
+Each case varies the image shape, dtype, number of slices, number of parts per slice (chunk size), compression
+and file format (Raw or GTiff) and reports MB/s (size of the decoded cube in the requested dtype, whatever the
+target returns), slices/s, peak RSS and the peak of allocations (tracemalloc). Each case runs in a fresh process,
+so that the peak RSS of a case does not depend on the others.
+
+Usage:
+    python benchmarks/cube_download.py --quick -o results.json
+    python benchmarks/cube_download.py -o new.json --compare results.json --threshold 0.1
+"""
+import argparse
+import dataclasses
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+os.environ.setdefault("GRPC_ENABLE_FORK_SUPPORT", "1")
+# Benchmark the working tree rather than an installed version
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TARGETS = ["cube_iterator", "client.get_cube", "sdk.get_cube", "downloader.get_cube", "xarray"]
+
+
+@dataclasses.dataclass
+class Case:
+    target: str
+    shape: Tuple[int, int] = (512, 512)
+    dtype: str = "float32"
+    slices: int = 20
+    chunk_size: int = 1024 * 1024
+    compression: int = 0
+    file_format: str = "Raw"
+
+    @property
+    def name(self) -> str:
+        return f"{self.target}[{self.shape[0]}x{self.shape[1]}-{self.dtype}-{self.slices}slices-" \
+               f"{self.chunk_size // 1024}kB-c{self.compression}-{self.file_format}]"
+
+
+def cases(quick: bool) -> List[Case]:
+    if quick:
+        matrix = dict(shape=[(256, 256), (1024, 1024)], dtype=["uint8", "float32"], slices=[10],
+                      chunk_size=[1024 * 1024], compression=[0, 1], file_format=["Raw"])
+    else:
+        matrix = dict(shape=[(256, 256), (1024, 1024), (2048, 2048)], dtype=["uint8", "uint16", "float32"],
+                      slices=[10, 50], chunk_size=[64 * 1024, 1024 * 1024, 3 * 1024 * 1024],
+                      compression=[0, 1, 6], file_format=["Raw", "GTiff"])
+    result = []
+    for target in TARGETS:
+        for values in itertools.product(*matrix.values()):
+            case = Case(target, **dict(zip(matrix.keys(), values)))
+            if case.file_format == "GTiff" and target not in ("cube_iterator", "client.get_cube"):
+                continue
+            if target == "xarray" and (case.compression != 0 or case.chunk_size != matrix["chunk_size"][-1]):
+                continue
+            result.append(case)
+    return result
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _Stream:
+    """ In-memory GetCube stream, with the cancel() method expected by CubeIterator """
+    def __init__(self, responses):
+        self._it = iter(responses)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._it)
+
+    def cancel(self):
+        pass
+
+
+def _setup(case: Case, server, tmpdir: str):
+    """ Returns a function running the case once and returning the number of decoded bytes """
+    import numpy as np
+    import geocube
+    from geocube import entities, sdk
+    from geocube.testing import FakeCube
+
+    width, height = case.shape
+    decoded_bytes = case.slices * width * height * np.dtype(case.dtype).itemsize
+    file_format = geocube.FileFormatGTiff if case.file_format == "GTiff" else geocube.FileFormatRaw
+    file_pattern = os.path.join(tmpdir, "{#}.tif")
+
+    if case.target == "cube_iterator":
+        responses = FakeCube(slices=case.slices, dtype=case.dtype, chunk_size=case.chunk_size) \
+            .responses(width, height, case.compression)
+
+        def run():
+            for _, _, err in entities.CubeIterator(_Stream(responses), file_format, file_pattern):
+                assert err is None, err
+            return decoded_bytes
+        return run
+
+    client = geocube.Client(server.uri, verbose=False)
+    records = [f"record-{i}" for i in range(case.slices)]
+    params = entities.CubeParams.from_records(records, "epsg:3857", entities.geo_transform(0, 0, 10), case.shape,
+                                              "instance-0")
+
+    def _bytes(images) -> int:
+        assert len(images) == case.slices
+        return decoded_bytes
+
+    if case.target == "client.get_cube":
+        if file_format == geocube.FileFormatGTiff:
+            def run():
+                for _, _, err in client.get_cube_it(params, compression=case.compression, file_format=file_format,
+                                                    file_pattern=file_pattern):
+                    assert err is None, err
+                return decoded_bytes
+            return run
+        return lambda: _bytes(client.get_cube(params, compression=case.compression, verbose=False)[0])
+
+    if case.target == "downloader.get_cube":
+        client.use_downloader(geocube.Downloader(server.uri, verbose=False))
+        return lambda: _bytes(client.get_cube(params, verbose=False)[0])
+
+    if case.target == "sdk.get_cube":
+        connection_params = sdk.ConnectionParams(server.uri)
+        return lambda: _bytes(sdk.get_cube(connection_params, params, compression=case.compression)[0])
+
+    if case.target == "xarray":
+        from geocube.sdk.xarray import open_geocube
+        collection = sdk.Collection.from_tile(params.tile, records=[[r] for r in records], instances=["instance-0"])
+
+        def run():
+            open_geocube(collection, sdk.ConnectionParams(server.uri)).load()
+            return decoded_bytes
+        return run
+
+    raise ValueError(f"unknown target {case.target}")
+
+
+def run_case(case: Case, repeat: int) -> Dict:
+    """ Run a case (in the current process) and returns its measures """
+    from geocube.testing import FakeCube, FakeGeocube, FakeServer, FakeCatalog
+
+    result = {"name": case.name, "params": dataclasses.asdict(case)}
+    cube = FakeCube(slices=case.slices, dtype=case.dtype, chunk_size=case.chunk_size)
+    with FakeServer(FakeGeocube(cube, FakeCatalog(dtype=case.dtype, records=case.slices))) as server, \
+            tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            run = _setup(case, server, tmpdir)
+        except ImportError as e:
+            result["skipped"] = str(e)
+            return result
+        try:
+            run()  # warm-up
+            rss_before = _rss_mb()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                nbytes = run()
+                times.append(time.perf_counter() - start)
+            peak_rss = _peak_rss_mb()
+
+            tracemalloc.start()
+            run()
+            _, alloc_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            return result
+
+    best = min(times)
+    result.update({
+        "seconds": best,
+        "median_seconds": sorted(times)[len(times) // 2],
+        "mb": nbytes / 2 ** 20,
+        "mb_per_s": nbytes / 2 ** 20 / best,
+        "slices_per_s": case.slices / best,
+        "peak_rss_mb": peak_rss,
+        "rss_delta_mb": peak_rss - rss_before,
+        "alloc_peak_mb": alloc_peak / 2 ** 20,
+    })
+    return result
+
+
+def _run_case_in_subprocess(args) -> Dict:
+    case, repeat = args
+    return run_case(case, repeat)
+
+
+def _metadata() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"date": datetime.datetime.now().isoformat(), "python": sys.version.split()[0],
+            "platform": platform.platform(), "cpu_count": os.cpu_count(), "commit": commit}
+
+
+def compare(results: List[Dict], baseline: List[Dict], threshold: float) -> List[str]:
+    """ Returns the regressions: cases whose throughput decreased by more than threshold (ratio) """
+    baseline = {r["name"]: r for r in baseline if "mb_per_s" in r}
+    regressions = []
+    for r in results:
+        base = baseline.get(r["name"])
+        if base is None or "mb_per_s" not in r:
+            continue
+        ratio = r["mb_per_s"] / base["mb_per_s"]
+        if ratio < 1 - threshold:
+            regressions.append(f"{r['name']}: {base['mb_per_s']:.1f} -> {r['mb_per_s']:.1f} MB/s ({ratio - 1:+.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the cube download path")
+    parser.add_argument("-o", "--output", help="json file to store the results")
+    parser.add_argument("--quick", action="store_true", help="run a reduced matrix of parameters")
+    parser.add_argument("--filter", default="", help="only run the cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=3, help="number of measured runs per case")
+    parser.add_argument("--compare", help="json file of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.1, help="tolerated decrease of throughput")
+    args = parser.parse_args(argv)
+
+    selected = [c for c in cases(args.quick) if args.filter in c.name]
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    for case in selected:
+        with ctx.Pool(1) as pool:
+            r = pool.map(_run_case_in_subprocess, [(case, args.repeat)])[0]
+        results.append(r)
+        if "mb_per_s" in r:
+            print(f"{r['name']:<80} {r['mb_per_s']:9.1f} MB/s {r['slices_per_s']:8.1f} slices/s "
+                  f"peak RSS {r['peak_rss_mb']:7.1f} MB  alloc {r['alloc_peak_mb']:7.1f} MB", flush=True)
+        else:
+            print(f"{r['name']:<80} {'skipped: ' + r['skipped'] if 'skipped' in r else 'error: ' + r['error']}",
+                  flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": _metadata(), "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)["results"], args.threshold)
+        for r in regressions:
+            print("REGRESSION", r)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,21 @@
-from geocube.downloader import Downloader
-from geocube.client import Client, FileFormatRaw, FileFormatGTiff
-from geocube.consolidater import Consolidater
-from geocube.admin import Admin
+import typing
+
+from geocube._lazy import lazy_attributes
+
+# Attributes are imported lazily (PEP 562), so that "import geocube" does not load the heavy dependencies
+__getattr__, __dir__, __all__ = lazy_attributes(__name__, {
+    ".downloader": ["Downloader", "DownloaderPool"],
+    ".local_downloader": ["LocalDownloader"],
+    ".predownload": ["PredownloadPlanner", "PredownloadDecision"],
+    ".client": ["Client", "FileFormatRaw", "FileFormatGTiff"],
+    ".consolidater": ["Consolidater"],
+    ".admin": ["Admin"],
+})
+
+if typing.TYPE_CHECKING:
+    from geocube.downloader import Downloader, DownloaderPool
+    from geocube.local_downloader import LocalDownloader
+    from geocube.predownload import PredownloadPlanner, PredownloadDecision
+    from geocube.client import Client, FileFormatRaw, FileFormatGTiff
+    from geocube.consolidater import Consolidater
+    from geocube.admin import Admin
@@ -0,0 +1,33 @@
+import importlib
+from typing import Callable, Dict, List, Tuple
+
+
+def lazy_attributes(package: str, attributes: Dict[str, List[str]]) -> Tuple[Callable, Callable, List[str]]:
+    """
+    Returns the module-level __getattr__ and __dir__ functions and __all__ (PEP 562) of a package
+    whose attributes are imported from their submodule the first time they are accessed.
+
+    Args:
+        package: name of the package (__name__)
+        attributes: {submodule: [attributes]}
+    """
+    modules = {name: module for module, names in attributes.items() for name in names}
+    namespace = importlib.import_module(package).__dict__
+
+    def __getattr__(name):
+        if name in modules:
+            value = getattr(importlib.import_module(modules[name], package), name)
+        else:
+            try:
+                value = importlib.import_module(f"{package}.{name}")
+            except ModuleNotFoundError as e:
+                if e.name != f"{package}.{name}":
+                    raise
+                raise AttributeError(f"module {package!r} has no attribute {name!r}") from None
+        namespace[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(namespace) | set(modules))
+
+    return __getattr__, __dir__, list(modules)
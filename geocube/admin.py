@@ -19,7 +19,11 @@ class Admin(Consolidater):
             verbose: display the version of the Geocube Server
         """
         super().__init__(uri, secure, api_key, verbose)
-        self.admin_stub = Stub(admin_pb2_grpc.AdminStub(self._channel))
+        self.admin_stub = Stub(admin_pb2_grpc.AdminStub(self._channel), limiter=self.stub.limiter)
+
+    def use_limiter(self, limiter):
+        super().use_limiter(limiter)
+        self.admin_stub.limiter = limiter
 
     def set_timeout(self, timeout_sec: float):
         super().set_timeout(timeout_sec)
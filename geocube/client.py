@@ -3,25 +3,43 @@ from __future__ import annotations
 import os
 import typing
 import warnings
+from concurrent import futures
 from datetime import datetime
 from typing import Dict, List, Tuple, Union, Optional
 
 import grpc
 import numpy as np
-import parse
-import rasterio
 from geocube.entities import cubeiterator
 from shapely import geometry
 
 from geocube.pb import records_pb2, operations_pb2, catalog_pb2, layouts_pb2, \
     geocube_pb2_grpc as geocube_grpc, variables_pb2, version_pb2
 from geocube import entities, utils, Downloader
+from geocube.limiter import ConcurrencyLimiter
 from geocube.stub import Stub
 
 FileFormatRaw = catalog_pb2.Raw
 FileFormatGTiff = catalog_pb2.GTiff
 
 
+def _serialize_request(request) -> bytes:
+    """ Serializer of the requests that can also be sent already serialized (see entities.CubeTemplate) """
+    return request if isinstance(request, bytes) else request.SerializeToString()
+
+
+class _GeocubeStub(geocube_grpc.GeocubeStub):
+    """
+    GeocubeStub whose GetCube also accepts a serialized GetCubeRequest
+    and CreateGrid serialized CreateGridRequests (see entities.Grid.iter_create_requests)
+    """
+    def __init__(self, channel):
+        super().__init__(channel)
+        self.GetCube = channel.unary_stream('/geocube.Geocube/GetCube', request_serializer=_serialize_request,
+                                            response_deserializer=catalog_pb2.GetCubeResponse.FromString)
+        self.CreateGrid = channel.stream_unary('/geocube.Geocube/CreateGrid', request_serializer=_serialize_request,
+                                               response_deserializer=layouts_pb2.CreateGridResponse.FromString)
+
+
 class Client:
     def __init__(self, uri: str, secure: bool = False, api_key: str = "", verbose: bool = True):
         """
@@ -35,6 +53,7 @@ class Client:
         """
         assert uri is not None and uri != "", "geocube.Client: Cannot connect: uri is not defined"
         self.pid = os.getpid()
+        self.uri = uri
         if secure:
             credentials = grpc.ssl_channel_credentials()
             if api_key != "":
@@ -43,11 +62,13 @@ class Client:
             self._channel = grpc.secure_channel(uri, credentials)
         else:
             self._channel = grpc.insecure_channel(uri)
-        self.stub = Stub(geocube_grpc.GeocubeStub(self._channel))
+        self.stub = Stub(_GeocubeStub(self._channel))
         self.verbose = verbose
         if verbose:
             print("Connected to Geocube v" + self.version())
         self.downloader = None
+        self.aoi_index = utils.AOIIndex(uri=uri)
+        self._layouts = {}
 
     def is_pid_ok(self) -> bool:
         return self.pid == os.getpid()
@@ -55,6 +76,25 @@ class Client:
     def use_downloader(self, downloader: Downloader):
         self.downloader = downloader
 
+    def use_aoi_index(self, aoi_index: utils.AOIIndex):
+        """
+        Use an index (possibly persisted) to resolve known AOIs locally (see create_aoi(exist_ok=True)).
+        The index must come from the same Geocube (AOIIndex.uri).
+        """
+        if aoi_index.uri is not None and aoi_index.uri != self.uri:
+            raise ValueError(f"The AOI index comes from another Geocube ({aoi_index.uri} != {self.uri})")
+        self.aoi_index = aoi_index
+
+    def use_limiter(self, limiter: Optional[ConcurrencyLimiter]):
+        """
+        Limit the number of calls in flight with this limiter (by default, the calls are not limited).
+        Use ConcurrencyLimiter.shared() to share the limits between all the clients of the process,
+        or None to disable the limits.
+        A stream keeps its permit until it is exhausted or cancelled: set a timeout (set_timeout) so that
+        iterating more than max_streams streams at the same time fails instead of blocking.
+        """
+        self.stub.limiter = limiter
+
     def set_timeout(self, timeout_sec: float):
         self.stub.timeout = timeout_sec
 
@@ -131,6 +171,9 @@ class Client:
         Create a new AOI. Raise an error if an AOI with the same coordinates already exists.
         The id of the AOI can be retrieved from the details of the error.
 
+        If exist_ok, the AOI is first looked up in the local index (see use_aoi_index) and it is only sent to the
+        Geocube if it is unknown.
+
         Args:
             aoi: in geographic coordinates
             exist_ok: (optional): if already exists, do not raise an error and return the aoi_id
@@ -140,6 +183,27 @@ class Client:
         """
         return self._create_aoi(aoi, exist_ok)
 
+    def create_aois(self, aois: List[Union[geometry.Polygon, geometry.MultiPolygon]], exist_ok: bool = False,
+                    max_workers: int = 8) -> List[str]:
+        """
+        Create a list of AOIs (see create_aoi). The AOIs that are not in the local index are created concurrently.
+
+        Args:
+            aois: in geographic coordinates
+            exist_ok: (optional): if already exists, do not raise an error and return the aoi_id
+            max_workers: maximum number of concurrent requests
+
+        Returns:
+            the ids of the AOIs
+        """
+        ids = [self.aoi_index.get(aoi) if exist_ok else None for aoi in aois]
+        missing = [i for i, aoi_id in enumerate(ids) if aoi_id is None]
+        if len(missing) > 0:
+            with futures.ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as executor:
+                for i, aoi_id in zip(missing, executor.map(lambda j: self._create_aoi(aois[j], exist_ok), missing)):
+                    ids[i] = aoi_id
+        return ids
+
     def create_record(self, aoi_id: str, name: str, tags: Dict[str, str], date: datetime, exist_ok: bool = False) \
             -> str:
         """
@@ -215,6 +279,20 @@ class Client:
         """
         return self._list_records(name, tags, from_time, to_time, aoi, limit, page, with_aoi)
 
+    def list_record_table(self, name: str = "", tags: Dict[str, str] = None,
+                          from_time: datetime = None, to_time: datetime = None,
+                          aoi: geometry.MultiPolygon = None,
+                          limit: int = 0, page: int = 0) -> entities.RecordTable:
+        """
+        List records given filters (see list_records) as a column-oriented table.
+        No entities.Record is created, which makes it suitable for millions of records.
+        The AOIs of the records are not returned.
+
+        Returns:
+            a RecordTable
+        """
+        return self._list_record_table(name, tags, from_time, to_time, aoi, limit, page)
+
     def load_aoi(self, aoi_id: Union[str, entities.Record]) -> geometry.MultiPolygon:
         """
         Load the geometry of the AOI of the given record
@@ -299,17 +377,18 @@ class Client:
         """
         return self._index_dataset(uri, record, instance, dformat, bands, min_out, max_out, exponent, managed)
 
-    def get_cube_metadata(self, params: entities.CubeParams) -> entities.CubeMetadata:
+    def get_cube_metadata(self, params: Union[entities.CubeParams, entities.CubeTemplate]) -> entities.CubeMetadata:
         return self._get_cube_metadata(params)
 
-    def get_cube(self, params: entities.CubeParams, *,
+    def get_cube(self, params: Union[entities.CubeParams, entities.CubeTemplate], *,
                  resampling_alg: entities.Resampling = entities.Resampling.undefined,
                  headers_only: bool = False, compression: int = 0, verbose: bool = None) \
             -> Tuple[List[np.array], List[entities.GroupedRecords]]:
         """ Get a cube given a CubeParameters
 
         Args:
-            params: CubeParams (see entities.CubeParams)
+            params: CubeParams (see entities.CubeParams) or CubeTemplate to request many tiles
+                (see entities.CubeTemplate)
             resampling_alg: if defined, overwrite the variable.Resampling used for reprojection.
             headers_only: Only returns the header of each image (gives an overview of the query)
             compression: define a level of compression to speed up the transfer.
@@ -348,14 +427,15 @@ class Client:
 
         return images, grouped_records
 
-    def get_cube_it(self, params: entities.CubeParams, *,
+    def get_cube_it(self, params: Union[entities.CubeParams, entities.CubeTemplate], *,
                     resampling_alg: entities.Resampling = entities.Resampling.undefined,
                     headers_only: bool = False, compression: int = 0,
                     file_format=FileFormatRaw, file_pattern: str = None) -> entities.CubeIterator:
         """ Returns a cube iterator over the requested images
 
         Args:
-            params: CubeParams (see entities.CubeParams)
+            params: CubeParams (see entities.CubeParams) or CubeTemplate to request many tiles
+                (see entities.CubeTemplate)
 
             resampling_alg: if defined, overwrite the variable.Resampling used for reprojection.
             headers_only : returns only the header of the dataset (use this option to control the output of get_cube)
@@ -390,9 +470,14 @@ class Client:
                  layout_name: Optional[str] = None,
                  layout: Optional[entities.Layout] = None,
                  resolution: Optional[float] = None,
-                 crs: Optional[str] = None, shape: Optional[Tuple[int, int]] = None) -> List[entities.Tile]:
+                 crs: Optional[str] = None, shape: Optional[Tuple[int, int]] = None,
+                 local: bool = True) -> entities.TileSet:
         """
-        Tile an AOI
+        Tile an AOI.
+        The tiles of regular and singlecell layouts are computed locally (see entities.Layout.tile_aoi),
+        the other layouts are tiled by the Geocube.
+        The layouts fetched by name are cached by the client (the cache is updated by create_layout and
+        delete_layout, use local=False if the layout may have been modified by another client).
 
         Args:
             aoi: AOI to be tiled in **geographic coordinates**
@@ -401,14 +486,16 @@ class Client:
             shape: shape of each tile
             layout_name: use a defined layout.
             layout: use a customer defined layout
+            local: if False, the Geocube always tiles the AOI
 
         Returns:
-            a list of Tiles covering the AOI in the given CRS at the given resolution
+            the Tiles covering the AOI in the given CRS at the given resolution (see entities.TileSet)
         """
-        return self._tile_aoi(aoi, layout_name, layout, resolution, crs, shape)
+        return self._tile_aoi(aoi, layout_name, layout, resolution, crs, shape, local)
 
     def get_xyz_tile(self, instance: Union[str, entities.VariableInstance],
-                     records: List[Union[str, entities.Record]], x: int, y: int, z: int, file: str):
+                     records: List[Union[str, entities.Record]], x: int, y: int, z: int,
+                     file: str = None) -> Optional[bytes]:
         """
         Create a PNG file covering the (X,Y,Z) web-mercator tile, using the palette of the variable.
 
@@ -418,10 +505,34 @@ class Client:
             x: coordinate of the web-mercator XYZ tile
             y: coordinate of the web-mercator XYZ tile
             z: coordinate of the web-mercator XYZ tile
-            file: output PNG file
+            file: (optional) output PNG file
+
+        Returns:
+            the PNG image if file is None
         """
         return self._get_xyz_tile(instance, records, x, y, z, file)
 
+    def get_xyz_tiles(self, instance: Union[str, entities.VariableInstance],
+                      records: List[Union[str, entities.Record]], tiles: List[Tuple[int, int, int]],
+                      concurrency: int = 8, cache: utils.MBTilesCache = None, return_data: bool = True) \
+            -> Dict[Tuple[int, int, int], bytes]:
+        """
+        Fetch a list of PNG (X,Y,Z) web-mercator tiles concurrently, using the palette of the variable.
+        If a cache is provided, the tiles already in the cache are not requested and the new tiles are added to it.
+
+        Args:
+            instance: instance of the variable
+            records: list of records
+            tiles: list of (x, y, z) coordinates of web-mercator XYZ tiles
+            concurrency: maximum number of concurrent requests
+            cache: (optional) cache of tiles (see utils.MBTilesCache)
+            return_data: if False, the tiles are not returned (e.g. to seed a cache)
+
+        Returns:
+            a dictionary (x, y, z) => PNG image
+        """
+        return self._get_xyz_tiles(instance, records, tiles, concurrency, cache, return_data)
+
     def create_layout(self, layout: entities.Layout, exist_ok=False):
         """ Create a layout in the Geocube
         exist_ok: (optional, see warning): if already exists, do not raise an error. !!! WARNING: it does not mean that
@@ -456,9 +567,16 @@ class Client:
         """ Delete a layout from the Geocube """
         return self._delete_layout(name)
 
-    def create_grid(self, grid: entities.Grid):
-        """ Create a grid in the Geocube"""
-        return self._create_grid(grid)
+    def create_grid(self, grid: entities.Grid, max_request_bytes: int = 3 * 1024 * 1024):
+        """
+        Create a grid in the Geocube.
+        The cells are encoded on the fly and streamed in requests of at most max_request_bytes.
+
+        Args:
+            grid: the grid to be created (see entities.Grid.from_geodataframe to create a grid of millions of cells)
+            max_request_bytes: maximum size of each request (it is reduced if the Geocube refuses the request)
+        """
+        return self._create_grid(grid, max_request_bytes)
 
     def list_grids(self, name_like: str = "") -> List[entities.Grid]:
         """
@@ -529,14 +647,21 @@ class Client:
 
     @utils.catch_rpc_error
     def _create_aoi(self, aoi: Union[geometry.Polygon, geometry.MultiPolygon], exist_ok: bool) -> str:
+        if exist_ok:
+            aoi_id = self.aoi_index.get(aoi)
+            if aoi_id is not None:
+                return aoi_id
         try:
             req = records_pb2.CreateAOIRequest(aoi=entities.aoi_to_pb(aoi))
-            return self.stub.CreateAOI(req).id
+            aoi_id = self.stub.CreateAOI(req).id
         except grpc.RpcError as e:
             e = utils.GeocubeError.from_rpc(e)
             if e.is_already_exists() and exist_ok:
-                return e.details[e.details.rindex(' ') + 1:]
-            raise
+                aoi_id = e.details[e.details.rindex(' ') + 1:]
+            else:
+                raise
+        self.aoi_index.add(aoi, aoi_id)
+        return aoi_id
 
     @utils.catch_rpc_error
     def _create_records(self, aoi_ids: List[str], names: List[str],
@@ -562,21 +687,32 @@ class Client:
     @utils.catch_rpc_error
     def _list_records(self, name: str, tags: Dict[str, str], from_time: datetime, to_time: datetime,
                       aoi: geometry.MultiPolygon, limit: int, page: int, with_aoi: bool) -> List[entities.Record]:
+        req = self._list_records_request(name, tags, from_time, to_time, aoi, limit, page, with_aoi)
+        records = [entities.Record.from_pb(resp.record) for resp in self.stub.ListRecords(req)]
+        if limit != 0 and len(records) == limit:
+            warnings.warn("Maximum number of records reached. Call list_records(..., page=) or "
+                          "list_records(..., limit=) to get more records.")
+
+        return records
+
+    @utils.catch_rpc_error
+    def _list_record_table(self, name: str, tags: Dict[str, str], from_time: datetime, to_time: datetime,
+                           aoi: geometry.MultiPolygon, limit: int, page: int) -> entities.RecordTable:
+        req = self._list_records_request(name, tags, from_time, to_time, aoi, limit, page, False)
+        return entities.RecordTable.from_pb(resp.record for resp in self.stub.ListRecords(req))
+
+    @staticmethod
+    def _list_records_request(name: str, tags: Dict[str, str], from_time: datetime, to_time: datetime,
+                              aoi: geometry.MultiPolygon, limit: int, page: int, with_aoi: bool) \
+            -> records_pb2.ListRecordsRequest:
         req = records_pb2.ListRecordsRequest(name=name, tags=tags,
                                              aoi=entities.aoi_to_pb(aoi),
                                              limit=limit, page=page, with_aoi=with_aoi)
-
         if from_time is not None:
             req.from_time.FromDatetime(from_time)
         if to_time is not None:
             req.to_time.FromDatetime(to_time)
-
-        records = [entities.Record.from_pb(resp.record) for resp in self.stub.ListRecords(req)]
-        if limit != 0 and len(records) == limit:
-            warnings.warn("Maximum number of records reached. Call list_records(..., page=) or "
-                          "list_records(..., limit=) to get more records.")
-
-        return records
+        return req
 
     @utils.catch_rpc_error
     def _load_aoi(self, aoi_id: Union[str, entities.Record]) -> geometry.MultiPolygon:
@@ -638,6 +774,7 @@ class Client:
         ds_dtype = "u1"
         if isinstance(record, tuple) or dformat is None:
             try:
+                import rasterio
                 with rasterio.open(uri) as ds:
                     tile = entities.Tile.from_geotransform(ds.transform, ds.crs, ds.shape[::-1])
                     ds_dtype = ds.dtypes[0]
@@ -663,12 +800,12 @@ class Client:
         return self.index(cs)
 
     @utils.catch_rpc_error
-    def _get_cube_metadata(self, params: entities.CubeParams) -> entities.CubeMetadata:
+    def _get_cube_metadata(self, params: Union[entities.CubeParams, entities.CubeTemplate]) -> entities.CubeMetadata:
         cube_it = self._get_cube_it(params, headers_only=True)
         return cube_it.metadata()
 
     @utils.catch_rpc_error
-    def _get_cube_it(self, params: entities.CubeParams, *,
+    def _get_cube_it(self, params: Union[entities.CubeParams, entities.CubeTemplate], *,
                      resampling_alg: entities.Resampling = entities.Resampling.undefined,
                      headers_only: bool = False, compression: int = 0,
                      file_format = FileFormatRaw, file_pattern: str = None) -> entities.CubeIterator:
@@ -679,32 +816,10 @@ class Client:
             return self.downloader.get_cube_it(metadata, file_format=file_format, file_pattern=file_pattern,
                                                predownload=self.downloader.always_predownload)
 
-        common = {
-            "instances_id": [params.instance],
-            "crs": params.crs,
-            "pix_to_crs": layouts_pb2.GeoTransform(
-                a=params.transform.c, b=params.transform.a, c=params.transform.b,
-                d=params.transform.f, e=params.transform.d, f=params.transform.e),
-            "size": layouts_pb2.Size(width=params.shape[0], height=params.shape[1]),
-            "compression_level": compression,
-            "headers_only": headers_only,
-            "format": file_format,
-            "resampling_alg": typing.cast(int, resampling_alg.value) - 1
-        }
-        if params.records is not None:
-            req = catalog_pb2.GetCubeRequest(**common, grouped_records=records_pb2.GroupedRecordIdsList(
-                records=[records_pb2.GroupedRecordIds(ids=rs) for rs in params.records]
-            ))
-        else:
-            from_time_pb = utils.pb_null_timestamp()
-            if params.from_time is not None:
-                from_time_pb.FromDatetime(params.from_time)
-            to_time_pb = utils.pb_null_timestamp()
-            if params.to_time is not None:
-                to_time_pb.FromDatetime(params.to_time)
-            req = catalog_pb2.GetCubeRequest(**common, filters=records_pb2.RecordFilters(
-                tags=params.tags, from_time=from_time_pb, to_time=to_time_pb
-            ))
+        if not isinstance(params, entities.CubeTemplate):
+            params = entities.CubeTemplate(params)
+        req = params.serialize(resampling_alg=resampling_alg, headers_only=headers_only, compression=compression,
+                               file_format=file_format)
         return entities.CubeIterator(self.stub.GetCube(req), file_format, file_pattern)
 
     @utils.catch_rpc_error
@@ -712,32 +827,78 @@ class Client:
                   layout_name: Optional[str],
                   layout: Optional[entities.Layout],
                   resolution: Optional[float],
-                  crs: Optional[str], shape: Optional[Tuple[int, int]]) -> List[entities.Tile]:
+                  crs: Optional[str], shape: Optional[Tuple[int, int]], local: bool) -> entities.TileSet:
         """ TODO: use Grid or GridName """
+        if layout_name is not None:
+            if local:
+                if layout_name not in self._layouts:
+                    self._layouts[layout_name] = self.layout(layout_name)
+                layout = self._layouts[layout_name]
+        elif layout is None:
+            layout = entities.Layout.regular("", crs, shape, resolution)
+
+        if local and layout.can_tile_locally():
+            return layout.tile_aoi(aoi)
+
         aoi = entities.aoi_to_pb(aoi)
         if layout_name is not None:
             req = layouts_pb2.TileAOIRequest(aoi=aoi, layout_name=layout_name)
         else:
-            if layout is None:
-                layout = entities.Layout.regular("", crs, shape, resolution)
             req = layouts_pb2.TileAOIRequest(aoi=aoi, layout=layout.to_pb())
 
-        return [entities.Tile.from_pb(tile) for resp in self.stub.TileAOI(req) for tile in resp.tiles]
+        return entities.TileSet.from_pb([tile for resp in self.stub.TileAOI(req) for tile in resp.tiles])
 
     @utils.catch_rpc_error
     def _get_xyz_tile(self, instance: Union[str, entities.VariableInstance],
-                      records: List[Union[str, entities.Record]], x: int, y: int, z: int, file: str):
+                      records: List[Union[str, entities.Record]], x: int, y: int, z: int,
+                      file: Optional[str]) -> Optional[bytes]:
+        data = self._xyz_tile_data(entities.get_id(instance), entities.get_ids(records), x, y, z)
+        if file is None:
+            return data
+        with open(file, "wb") as f:
+            f.write(data)
+
+    @utils.catch_rpc_error
+    def _get_xyz_tiles(self, instance: Union[str, entities.VariableInstance],
+                       records: List[Union[str, entities.Record]], tiles: List[Tuple[int, int, int]],
+                       concurrency: int, cache: Optional[utils.MBTilesCache], return_data: bool) \
+            -> Dict[Tuple[int, int, int], bytes]:
+        instance_id, record_ids = entities.get_id(instance), entities.get_ids(records)
+        layer = utils.xyz_layer(instance_id, record_ids)
+        tiles = list(dict.fromkeys(tuple(t) for t in tiles))
+        results = cache.get_many(layer, tiles) if cache is not None else {}
+        missing = [t for t in tiles if t not in results]
+        if not return_data:
+            results = {}
+        if len(missing) == 0:
+            return results
+
+        with futures.ThreadPoolExecutor(max_workers=min(concurrency, len(missing))) as executor:
+            fs = {executor.submit(self._xyz_tile_data, instance_id, record_ids, *t): t for t in missing}
+            try:
+                for future in futures.as_completed(fs):
+                    data = future.result()
+                    if cache is not None:
+                        cache.put(layer, *fs[future], data)
+                    if return_data:
+                        results[fs[future]] = data
+            except Exception:
+                for future in fs:
+                    future.cancel()
+                raise
+        return results
+
+    @utils.catch_rpc_error
+    def _xyz_tile_data(self, instance_id: str, record_ids: List[str], x: int, y: int, z: int) -> bytes:
         req = catalog_pb2.GetTileRequest(
-            records=records_pb2.GroupedRecordIds(ids=entities.get_ids(records)),
-            instance_id=entities.get_id(instance),
+            records=records_pb2.GroupedRecordIds(ids=record_ids),
+            instance_id=instance_id,
             x=x, y=y, z=z)
-        resp = self.stub.GetXYZTile(req)
-        f = open(file, "wb")
-        f.write(resp.image.data)
-        f.close()
+        return self.stub.GetXYZTile(req).image.data
 
     @utils.catch_rpc_error
     def _create_layout(self, layout: entities.Layout, exist_ok):
+        self._layouts.pop(layout.name, None)
         try:
             self.stub.CreateLayout(layouts_pb2.CreateLayoutRequest(layout=layout.to_pb()))
         except grpc.RpcError as e:
@@ -783,22 +944,22 @@ class Client:
 
     @utils.catch_rpc_error
     def _delete_layout(self, name: str):
+        self._layouts.pop(name, None)
         self.stub.DeleteLayout(layouts_pb2.DeleteLayoutRequest(name=name))
 
     @utils.catch_rpc_error
-    def _create_grid(self, grid: entities.Grid):
-        max_cells = min(len(grid.cells), 10000000)
+    def _create_grid(self, grid: entities.Grid, max_request_bytes: int):
         while True:
             try:
-                req = [layouts_pb2.CreateGridRequest(grid=grid.to_pb(max_cells * i, max_cells * (i + 1)))
-                       for i in range((len(grid.cells) - 1) // max_cells + 1)]
-                return self.stub.CreateGrid(iter(req))
+                # Requests are serialized by Grid.iter_create_requests
+                return self.stub.CreateGrid(grid.iter_create_requests(max_request_bytes))
             except grpc.RpcError as e:
                 e = utils.GeocubeError.from_rpc(e)
-                if e.codename != "RESOURCE_EXHAUSTED":
+                if e.codename != "RESOURCE_EXHAUSTED" or max_request_bytes < 1024:
                     raise
+                import parse
                 r = parse.search("({volume:d} vs. {max:d})", e.details)
-                max_cells //= max(r["volume"] // r["max"], 2)
+                max_request_bytes //= max(r["volume"] // r["max"], 2) if r is not None else 2
 
     @utils.catch_rpc_error
     def _list_grids(self, name_like: str) -> List[entities.Grid]:
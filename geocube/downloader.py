@@ -1,7 +1,14 @@
 from __future__ import annotations
 
+import collections
+import itertools
+import threading
+import time
 import typing
-from typing import List, Tuple
+from concurrent import futures
+import dataclasses
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 
 import grpc
 import numpy as np
@@ -10,6 +17,9 @@ from geocube.entities import cubeiterator
 from geocube.pb import records_pb2, catalog_pb2, layouts_pb2, geocubeDownloader_pb2_grpc as downloader_grpc, \
     datasetMeta_pb2, version_pb2
 from geocube import entities, utils
+from geocube.limiter import ConcurrencyLimiter
+from geocube.predownload import PredownloadPlanner
+from geocube.stub import Stub
 
 FileFormatRaw = catalog_pb2.Raw
 FileFormatGTiff = catalog_pb2.GTiff
@@ -35,10 +45,16 @@ class Downloader:
             self._channel = grpc.secure_channel(uri, credentials)
         else:
             self._channel = grpc.insecure_channel(uri)
-        self.stub = downloader_grpc.GeocubeDownloaderStub(self._channel)
+        self.stub = Stub(downloader_grpc.GeocubeDownloaderStub(self._channel))
         if verbose:
             print("Connected to Geocube Downloader v" + self.version())
-        self.always_predownload = False
+        # True, False or None to let the planner choose (see PredownloadPlanner)
+        self.always_predownload: Optional[bool] = False
+        self.planner = PredownloadPlanner()
+
+    def use_limiter(self, limiter: typing.Optional[ConcurrencyLimiter]):
+        """ Limit the number of calls in flight with this limiter (see Client.use_limiter) """
+        self.stub.limiter = limiter
 
     @utils.catch_rpc_error
     def version(self) -> str:
@@ -46,7 +62,8 @@ class Downloader:
         return self.stub.Version(version_pb2.GetVersionRequest()).Version
 
     @utils.catch_rpc_error
-    def get_cube(self, metadata: entities.CubeMetadata, *, predownload: bool = False, verbose: bool = True) \
+    def get_cube(self, metadata: entities.CubeMetadata, *, predownload: Optional[bool] = False,
+                 verbose: bool = True) \
             -> Tuple[List[np.array], List[entities.GroupedRecords]]:
         """
         Get a cube given a CubeParameters
@@ -55,6 +72,7 @@ class Downloader:
             metadata: CubeMetadata (see entities.CubeMetadata and entities.CubeIterator)
             predownload: Predownload the datasets before merging them. When the dataset is remote and all the
                 dataset is required, it is more efficient to predownload it.
+                None to let self.planner choose (see PredownloadPlanner).
             verbose: add information during the transfer
 
         Returns:
@@ -86,7 +104,7 @@ class Downloader:
 
     @utils.catch_rpc_error
     def get_cube_it(self, metadata: entities.CubeMetadata, *, file_format=FileFormatRaw, file_pattern: str = None,
-                    predownload: bool = False)\
+                    predownload: Optional[bool] = False)\
             -> entities.CubeIterator:
         """
         Returns a cube iterator over the requested images
@@ -98,6 +116,7 @@ class Downloader:
                 {#} will be replaced by the number of image, {date} and {id} by the value of the record
             predownload: Predownload the datasets before merging them. When the dataset is remote and all the
                 dataset is required, it is more efficient to predownload it.
+                None to let self.planner choose (see PredownloadPlanner).
 
         Returns:
             an iterator yielding an image, its associated records, an error (or None) and the size of the image
@@ -105,21 +124,221 @@ class Downloader:
         return self._get_cube_it(metadata, file_format, file_pattern, predownload=predownload)
 
     def _get_cube_it(self, metadata: entities.CubeMetadata, file_format=FileFormatRaw, file_pattern: str = None,
-                     predownload: bool = False)\
+                     predownload: Optional[bool] = False)\
             -> entities.CubeIterator:
-        req = catalog_pb2.GetCubeMetadataRequest(
-            grouped_records=[records_pb2.GroupedRecords(records=[r.to_pb() for r in s.grouped_records])
-                             for s in metadata.slices],
-            datasets_meta=[datasetMeta_pb2.DatasetMeta(internalsMeta=s.metadata) for s in metadata.slices],
-            ref_dformat=metadata.dformat.to_pb(),
-            resampling_alg=typing.cast(int, metadata.resampling_alg.value)-1,
-            crs=metadata.crs,
-            pix_to_crs=layouts_pb2.GeoTransform(
-                a=metadata.transform.c, b=metadata.transform.a, c=metadata.transform.b,
-                d=metadata.transform.f, e=metadata.transform.d, f=metadata.transform.e),
-            size=layouts_pb2.Size(width=metadata.shape[0], height=metadata.shape[1]),
-            format=file_format,
-            predownload=predownload
-        )
-
-        return entities.CubeIterator(self.stub.DownloadCube(req), file_format, file_pattern)
+        if predownload is None:
+            predownload = self.planner.decide(metadata).predownload
+        req = _download_cube_request(metadata, metadata.slices, file_format, predownload)
+        stream = _TimedStream(self.stub.DownloadCube(req), self.planner, predownload)
+        return entities.CubeIterator(stream, file_format, file_pattern)
+
+
+class DownloaderPool(Downloader):
+    """
+    Pool of replicas of the Geocube Downloader, that can be used as a Downloader (see Client.use_downloader).
+    The slices of a cube are split into batches that are downloaded concurrently from the least-loaded replicas
+    and merged back in order into a single CubeIterator. A batch that fails on a replica is retried on another one.
+    If predownload is None, self.planner chooses it for each batch (see PredownloadPlanner).
+
+    Each batch is received entirely before it is yielded (so that it can be retried): at most
+    len(uris) * batches_per_replica batches are held in memory.
+
+    >>> client.use_downloader(DownloaderPool(["downloader-0:8080", "downloader-1:8080"]))
+    """
+    def __init__(self, uris: List[str], secure: bool = False, api_key: str = "", verbose: bool = True,
+                 batch_size: int = 8, batches_per_replica: int = 2, max_attempts: int = 3):
+        """
+        Args:
+            uris: of the replicas of the Geocube Downloader
+            secure: True to use a TLS Connexion
+            api_key: (optional) API Key if Geocube Server is secured using a bearer authentication
+            verbose: display the version of the Geocube Server
+            batch_size: number of slices downloaded by each DownloadCube call
+            batches_per_replica: number of concurrent DownloadCube calls per replica
+            max_attempts: number of replicas tried for each batch before giving up
+        """
+        assert len(uris) > 0, "geocube.DownloaderPool: Cannot connect: no uri"
+        self.replicas = [_Replica(uri, Downloader(uri, secure, api_key, verbose)) for uri in uris]
+        self.batch_size = max(batch_size, 1)
+        self.batches_per_replica = max(batches_per_replica, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.always_predownload: Optional[bool] = False
+        self.planner = PredownloadPlanner()
+        self._lock = threading.Lock()
+
+    @property
+    def stub(self) -> Stub:
+        return self.replicas[0].downloader.stub
+
+    def use_limiter(self, limiter: typing.Optional[ConcurrencyLimiter]):
+        for replica in self.replicas:
+            replica.downloader.use_limiter(limiter)
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        """ Returns the number of batches in flight, downloaded and failed of each replica """
+        with self._lock:
+            return {r.uri: {"in_flight": r.in_flight, "batches": r.batches, "failures": r.failures}
+                    for r in self.replicas}
+
+    def _get_cube_it(self, metadata: entities.CubeMetadata, file_format=FileFormatRaw, file_pattern: str = None,
+                     predownload: Optional[bool] = False) -> entities.CubeIterator:
+        batches = [metadata.slices[i:i + self.batch_size] for i in range(0, len(metadata.slices), self.batch_size)]
+        header = _global_header(metadata)
+        requests = [_download_cube_request(metadata, batch, file_format, predownload if predownload is not None else
+                                           self.planner.decide(dataclasses.replace(metadata, slices=batch)).predownload)
+                    for batch in batches]
+        return entities.CubeIterator(_PooledStream(self, header, requests), file_format, file_pattern)
+
+    def _acquire(self, excluded: typing.Set[str]) -> _Replica:
+        """ Returns the least-loaded replica, avoiding the excluded ones if possible """
+        with self._lock:
+            candidates = [r for r in self.replicas if r.uri not in excluded] or self.replicas
+            replica = min(candidates, key=lambda r: r.in_flight)
+            replica.in_flight += 1
+            return replica
+
+    def _release(self, replica: _Replica, failed: bool):
+        with self._lock:
+            replica.in_flight -= 1
+            if failed:
+                replica.failures += 1
+            else:
+                replica.batches += 1
+
+    def _download(self, request: catalog_pb2.GetCubeMetadataRequest, cancelled: threading.Event) \
+            -> List[catalog_pb2.GetCubeMetadataResponse]:
+        """ Downloads a batch (without its global header), trying another replica if it fails """
+        excluded = set()
+        for attempt in range(self.max_attempts):
+            replica = self._acquire(excluded)
+            failed = True
+            try:
+                start = time.perf_counter()
+                stream = replica.downloader.stub.DownloadCube(request)
+                responses = []
+                for resp in stream:
+                    if cancelled.is_set():
+                        stream.cancel()
+                        break
+                    responses.append(resp)
+                failed = False
+                self.planner.record(request.predownload, sum(_response_bytes(r) for r in responses),
+                                    time.perf_counter() - start)
+                return responses[1:]
+            except grpc.RpcError as e:
+                excluded.add(replica.uri)
+                if cancelled.is_set() or attempt + 1 == self.max_attempts \
+                        or (hasattr(e, "code") and e.code() == grpc.StatusCode.INVALID_ARGUMENT):
+                    raise
+            finally:
+                self._release(replica, failed)
+
+
+@dataclass
+class _Replica:
+    uri: str
+    downloader: Downloader
+    in_flight: int = 0
+    batches: int = 0
+    failures: int = 0
+
+
+class _PooledStream:
+    """ Stream of DownloadCube responses merged from the batches downloaded concurrently by a DownloaderPool """
+    def __init__(self, pool: DownloaderPool, header: catalog_pb2.GetCubeMetadataResponse,
+                 requests: List[catalog_pb2.GetCubeMetadataRequest]):
+        self._cancelled = threading.Event()
+        self._executor = futures.ThreadPoolExecutor(len(pool.replicas) * pool.batches_per_replica)
+        self._futures = collections.deque()
+        self._requests = iter(requests)
+        for request in itertools.islice(self._requests, len(pool.replicas) * pool.batches_per_replica):
+            self._futures.append(self._executor.submit(pool._download, request, self._cancelled))
+        self._pool = pool
+        self._responses = iter([header])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> catalog_pb2.GetCubeMetadataResponse:
+        while True:
+            try:
+                return next(self._responses)
+            except StopIteration:
+                if not self._futures:
+                    self._executor.shutdown(wait=False)
+                    raise
+            future = self._futures.popleft()
+            try:
+                self._responses = iter(future.result())
+            except BaseException:
+                self.cancel()
+                raise
+            request = next(self._requests, None)
+            if request is not None:
+                self._futures.append(self._executor.submit(self._pool._download, request, self._cancelled))
+
+    def cancel(self):
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+
+class _TimedStream:
+    """ Stream of DownloadCube responses, recording its throughput in a PredownloadPlanner once it is exhausted """
+    def __init__(self, stream, planner: PredownloadPlanner, predownload: bool):
+        self._stream = stream
+        self._planner = planner
+        self._predownload = predownload
+        self._bytes = 0
+        self._seconds = 0.
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> catalog_pb2.GetCubeMetadataResponse:
+        start = time.perf_counter()
+        try:
+            resp = next(self._stream)
+        except StopIteration:
+            self._planner.record(self._predownload, self._bytes, self._seconds + time.perf_counter() - start)
+            raise
+        self._seconds += time.perf_counter() - start
+        self._bytes += _response_bytes(resp)
+        return resp
+
+    def cancel(self):
+        self._stream.cancel()
+
+
+def _response_bytes(resp: catalog_pb2.GetCubeMetadataResponse) -> int:
+    return len(resp.header.data) + len(resp.chunk.data)
+
+
+def _global_header(metadata: entities.CubeMetadata) -> catalog_pb2.GetCubeMetadataResponse:
+    """ Returns the global header of the DownloadCube stream of this cube """
+    return catalog_pb2.GetCubeMetadataResponse(global_header=catalog_pb2.GetCubeResponseHeader(
+        count=len(metadata.slices), nb_datasets=sum(len(s.metadata) for s in metadata.slices),
+        ref_dformat=metadata.dformat.to_pb(), resampling_alg=typing.cast(int, metadata.resampling_alg.value) - 1,
+        geotransform=layouts_pb2.GeoTransform(
+            a=metadata.transform.c, b=metadata.transform.a, c=metadata.transform.b,
+            d=metadata.transform.f, e=metadata.transform.d, f=metadata.transform.e),
+        crs=metadata.crs))
+
+
+def _download_cube_request(metadata: entities.CubeMetadata, slices: List[entities.SliceMetadata], file_format,
+                           predownload: bool) -> catalog_pb2.GetCubeMetadataRequest:
+    return catalog_pb2.GetCubeMetadataRequest(
+        grouped_records=[records_pb2.GroupedRecords(records=[r.to_pb() for r in s.grouped_records])
+                         for s in slices],
+        datasets_meta=[datasetMeta_pb2.DatasetMeta(internalsMeta=s.metadata) for s in slices],
+        ref_dformat=metadata.dformat.to_pb(),
+        resampling_alg=typing.cast(int, metadata.resampling_alg.value)-1,
+        crs=metadata.crs,
+        pix_to_crs=layouts_pb2.GeoTransform(
+            a=metadata.transform.c, b=metadata.transform.a, c=metadata.transform.b,
+            d=metadata.transform.f, e=metadata.transform.d, f=metadata.transform.e),
+        size=layouts_pb2.Size(width=metadata.shape[0], height=metadata.shape[1]),
+        format=file_format,
+        predownload=predownload
+    )
@@ -1,16 +1,43 @@
-from geocube.entities.enums import Compression, pb_compression, Resampling, pb_resampling
-from geocube.entities.dataformat import DataFormat
-from geocube.entities.consolidation_params import ConsolidationParams
-from geocube.entities.variable import Variable, VariableInstance, Palette
-from geocube.entities.record import aoi_from_pb, aoi_to_pb, Record,\
-    GroupByKeyFunc, RecordIdentifiers, GroupedRecords, GroupedRecordIds
-from geocube.entities.container import Container, Dataset
-from geocube.entities.tile import Tile, geo_transform
-from geocube.entities.cube_metadata import CubeMetadata, SliceMetadata
-from geocube.entities.cube_params import CubeParams
-from geocube.entities.cubeiterator import CubeIterator
-from geocube.entities.job import ExecutionLevel, Job
-from geocube.entities.layout import Layout, MUCOGPattern, COGPattern
-from geocube.entities.grid import Grid, Cell
-from geocube.entities.utils import get_ids, get_id
+import typing
 
+from geocube._lazy import lazy_attributes
+
+# Entities are imported lazily (PEP 562): geopandas, pyproj... are only loaded when an entity that needs them is used
+__getattr__, __dir__, __all__ = lazy_attributes(__name__, {
+    ".enums": ["Compression", "pb_compression", "Resampling", "pb_resampling"],
+    ".dataformat": ["DataFormat"],
+    ".consolidation_params": ["ConsolidationParams"],
+    ".variable": ["Variable", "VariableInstance", "Palette"],
+    ".record": ["aoi_from_pb", "aoi_to_pb", "Record", "GroupByKeyFunc", "RecordIdentifiers", "GroupedRecords",
+                "GroupedRecordIds"],
+    ".record_table": ["RecordTable", "RecordRow"],
+    ".container": ["Container", "Dataset"],
+    ".tile": ["Tile", "geo_transform"],
+    ".tileset": ["TileSet"],
+    ".cube_metadata": ["CubeMetadata", "SliceMetadata"],
+    ".cube_params": ["CubeParams", "CubeTemplate"],
+    ".cubeiterator": ["CubeIterator"],
+    ".job": ["ExecutionLevel", "Job"],
+    ".layout": ["Layout", "MUCOGPattern", "COGPattern"],
+    ".grid": ["Grid", "Cell", "Cells"],
+    ".utils": ["get_ids", "get_id"],
+})
+
+if typing.TYPE_CHECKING:
+    from geocube.entities.enums import Compression, pb_compression, Resampling, pb_resampling
+    from geocube.entities.dataformat import DataFormat
+    from geocube.entities.consolidation_params import ConsolidationParams
+    from geocube.entities.variable import Variable, VariableInstance, Palette
+    from geocube.entities.record import aoi_from_pb, aoi_to_pb, Record,\
+        GroupByKeyFunc, RecordIdentifiers, GroupedRecords, GroupedRecordIds
+    from geocube.entities.record_table import RecordTable, RecordRow
+    from geocube.entities.container import Container, Dataset
+    from geocube.entities.tile import Tile, geo_transform
+    from geocube.entities.tileset import TileSet
+    from geocube.entities.cube_metadata import CubeMetadata, SliceMetadata
+    from geocube.entities.cube_params import CubeParams, CubeTemplate
+    from geocube.entities.cubeiterator import CubeIterator
+    from geocube.entities.job import ExecutionLevel, Job
+    from geocube.entities.layout import Layout, MUCOGPattern, COGPattern
+    from geocube.entities.grid import Grid, Cell, Cells
+    from geocube.entities.utils import get_ids, get_id
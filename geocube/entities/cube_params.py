@@ -1,13 +1,15 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Tuple, Dict, Union
-import geopandas as gpd
+import copy
+import typing
+from dataclasses import dataclass, field
+from typing import List, Tuple, Dict, Optional, Union
 from datetime import datetime
 
 import affine
 
-from geocube import entities
+from geocube import entities, utils
+from geocube.pb import catalog_pb2, layouts_pb2, records_pb2
 
 Tuple6Float = Tuple[float, float, float, float, float, float]
 
@@ -22,6 +24,10 @@ class CubeParams:
     from_time: Union[datetime, None]
     to_time: Union[datetime, None]
 
+    # GroupedRecordIdsList, when the records are given as a protobuf message (e.g. RecordTable.grouped_records_pb).
+    # Compared with the records of the other CubeParams in __eq__
+    _records_pb: Optional[records_pb2.GroupedRecordIdsList] = field(default=None, compare=False, repr=False)
+
     @classmethod
     def from_tags(cls, crs: str, transform: Union[affine.Affine, Tuple6Float],
                   shape: Tuple[int, int],
@@ -77,7 +83,8 @@ class CubeParams:
         Args:
             tile: defining the Cube to be retrieved (images will be reprojected on the fly if necessary)
             instance: of the requested data
-            records: (optional) to be retrieved
+            records: (optional) to be retrieved. A list of RecordIdentifiers (one per slice),
+                a RecordTable (one record per slice) or a GroupedRecordIdsList (see RecordTable.grouped_records_pb)
             tags: of the records to be requested
             from_time: (optional) to filter the records
             to_time: (optional) to filter the records
@@ -86,10 +93,18 @@ class CubeParams:
             A CubeParams to be passed as a parameter of a get_cube request
 
         """
-        return cls(tile=tile,
-                   _instance_id=entities.get_id(instance) if instance else None,
-                   _records_id=CubeParams._parse_grouped_record_ids(records),
-                   tags=tags, from_time=from_time, to_time=to_time)
+        params = cls(tile=tile, _instance_id=entities.get_id(instance) if instance else None, _records_id=None,
+                     tags=tags, from_time=from_time, to_time=to_time)
+        params.records = records
+        return params
+
+    def __eq__(self, other):
+        # The records are compared whatever their representation (list of ids or GroupedRecordIdsList)
+        if not isinstance(other, CubeParams):
+            return NotImplemented
+        return (self._instance_id, self.tile, self.tags, self.from_time, self.to_time) == \
+            (other._instance_id, other.tile, other.tags, other.from_time, other.to_time) \
+            and self.records_pb() == other.records_pb()
 
     @property
     def crs(self) -> str:
@@ -105,11 +120,33 @@ class CubeParams:
 
     @property
     def records(self) -> List[entities.GroupedRecordIds]:
+        if self._records_id is None and self._records_pb is not None:
+            # The list may be modified in place: the protobuf message is not valid anymore
+            self._records_id, self._records_pb = [list(g.ids) for g in self._records_pb.records], None
         return self._records_id
 
     @records.setter
-    def records(self, records: List[entities.RecordIdentifiers]):
-        self._records_id = CubeParams._parse_grouped_record_ids(records)
+    def records(self, records: Union[List[entities.RecordIdentifiers], entities.RecordTable,
+                                     records_pb2.GroupedRecordIdsList, None]):
+        # records can be a list of RecordIdentifiers (one per slice), a RecordTable (one record per slice)
+        # or a GroupedRecordIdsList (see RecordTable.grouped_records_pb)
+        if isinstance(records, entities.RecordTable):
+            records = records.grouped_records_pb()
+        if isinstance(records, records_pb2.GroupedRecordIdsList):
+            self._records_id, self._records_pb = None, records
+        else:
+            self._records_id, self._records_pb = CubeParams._parse_grouped_record_ids(records), None
+
+    def records_pb(self) -> Optional[records_pb2.GroupedRecordIdsList]:
+        """ Returns the records as a GroupedRecordIdsList, or None if the records are not defined """
+        if self._records_pb is not None:
+            return self._records_pb
+        if self._records_id is None:
+            return None
+        pb = records_pb2.GroupedRecordIdsList()
+        for ids in self._records_id:
+            pb.records.add().ids.extend(ids)
+        return pb
 
     @property
     def instance(self) -> str:
@@ -126,6 +163,65 @@ class CubeParams:
 
     @staticmethod
     def _parse_record_ids(records: entities.RecordIdentifiers) -> List[str]:
-        if isinstance(records, gpd.GeoDataFrame):
-            return list(records['id'])
         return entities.get_ids(records)
+
+
+class CubeTemplate:
+    """
+    GetCube request whose instance and records (or filters) are serialized once, to request the same records
+    on many tiles: only the geometry (crs, transform, shape) and the options are serialized for each tile.
+    A CubeTemplate can be used instead of a CubeParams in Client.get_cube, get_cube_it and get_cube_metadata.
+
+    The template is not updated if the CubeParams it was created from is modified.
+
+    >>> template = entities.CubeTemplate(cube_params)
+    >>> for tile in tiles:
+    ...     images, records = client.get_cube(template.on(tile))
+    """
+    def __init__(self, params: CubeParams, tile: entities.Tile = None):
+        self.tile = params.tile if tile is None else tile
+        self._params = params
+        self._common = self._serialize_common(params)
+
+    def on(self, tile: entities.Tile) -> CubeTemplate:
+        """ Returns the same request on another tile (the serialized part is shared) """
+        template = copy.copy(self)
+        template.tile = tile
+        return template
+
+    def cube_params(self) -> CubeParams:
+        """ Returns the CubeParams of the template on its tile """
+        params = copy.copy(self._params)
+        params.tile = self.tile
+        return params
+
+    def serialize(self, *, resampling_alg: entities.Resampling = entities.Resampling.undefined,
+                  headers_only: bool = False, compression: int = 0, file_format: int = catalog_pb2.Raw) -> bytes:
+        """ Returns the serialized GetCubeRequest on the tile of the template """
+        t = self.tile.transform
+        # Concatenating two serialized messages is equivalent to merging them (the fields are disjoint)
+        return self._common + catalog_pb2.GetCubeRequest(
+            crs=self.tile.crs,
+            pix_to_crs=layouts_pb2.GeoTransform(a=t.c, b=t.a, c=t.b, d=t.f, e=t.d, f=t.e),
+            size=layouts_pb2.Size(width=self.tile.shape[0], height=self.tile.shape[1]),
+            compression_level=compression,
+            headers_only=headers_only,
+            format=file_format,
+            resampling_alg=typing.cast(int, resampling_alg.value) - 1
+        ).SerializeToString()
+
+    @staticmethod
+    def _serialize_common(params: CubeParams) -> bytes:
+        req = catalog_pb2.GetCubeRequest(instances_id=[params.instance])
+        records = params.records_pb()
+        if records is not None:
+            req.grouped_records.CopyFrom(records)
+        else:
+            req.filters.tags.update(params.tags or {})
+            req.filters.from_time.CopyFrom(utils.pb_null_timestamp())
+            if params.from_time is not None:
+                req.filters.from_time.FromDatetime(params.from_time)
+            req.filters.to_time.CopyFrom(utils.pb_null_timestamp())
+            if params.to_time is not None:
+                req.filters.to_time.FromDatetime(params.to_time)
+        return req.SerializeToString()
@@ -45,6 +45,11 @@ class CubeIterator:
     def __len__(self):
         return self.count
 
+    @property
+    def dformat(self) -> entities.DataFormat:
+        """ Data format of the images of the cube (including its no_data) """
+        return self._cube_metadata.dformat
+
     def __iter__(self):
         self.index = -1
         return self
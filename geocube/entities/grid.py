@@ -1,8 +1,13 @@
+from __future__ import annotations
+
 from dataclasses import dataclass
-from typing import Union, List
+from typing import Union, List, Iterator, Sequence, Tuple
 
+import numpy as np
+import shapely
 from shapely import geometry
 
+from geocube.entities.tile import to_crs
 from geocube.pb import layouts_pb2, records_pb2
 
 
@@ -20,19 +25,230 @@ class Cell:
                 points=[records_pb2.Coord(lon=x, lat=y) for x, y in zip(*self.coordinates.xy)]),
         )
 
-    def from_pb(self):
-        raise NotImplementedError
+    @classmethod
+    def from_pb(cls, pb: layouts_pb2.Cell):
+        return cls(pb.id, pb.crs, geometry.LinearRing(_pb_ring_coordinates(pb.coordinates)))
 
     @classmethod
     def from_geom(cls, id_: str, crs: str, geom: Union[geometry.Polygon, geometry.LinearRing]):
         return cls(id_, crs, geom.exterior if isinstance(geom, geometry.Polygon) else geom)
 
 
+# Wire format of a repeated Coord (field 1 of LinearRing): tag, length, lon (float, field 1), lat (float, field 2)
+_pb_point_dtype = np.dtype([('tag', 'u1'), ('len', 'u1'), ('lon_tag', 'u1'), ('lon', '<f4'),
+                            ('lat_tag', 'u1'), ('lat', '<f4')])
+
+
+class Cells:
+    """
+    Array-backed list of cells, to handle grids of millions of cells.
+    Cells received from the Geocube are decoded lazily, on first access.
+    A spatial index is built on demand to find the cells intersecting a geometry or containing a point.
+
+    Attributes:
+        ids:         ids of the cells (numpy array of str)
+        crs_list:    distinct CRS of the cells
+        crs_codes:   index of the CRS of each cell in crs_list
+        coordinates: (N, 2) coordinates of the rings of all the cells
+        offsets:     the ring of the i-th cell is coordinates[offsets[i]:offsets[i+1]]
+    """
+    def __init__(self, ids: Sequence[str], crs_list: List[str], crs_codes: np.ndarray,
+                 coordinates: np.ndarray, offsets: np.ndarray):
+        self._pb_cells = None
+        self._ids = np.asarray(ids, dtype=str)
+        self._crs_list = list(crs_list)
+        self._crs_codes = np.asarray(crs_codes, dtype=np.int32)
+        self._coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        if len(self._offsets) != len(self._ids) + 1 or len(self._crs_codes) != len(self._ids):
+            raise ValueError("Cells: ids, crs_codes and offsets must have consistent lengths")
+        self._polygons = None
+        self._trees = {}
+
+    @classmethod
+    def from_pb(cls, pb_cells: Sequence[layouts_pb2.Cell]) -> Cells:
+        """ Create cells from protobuf cells. They are decoded on first access. """
+        cells = cls([], [], [], np.empty((0, 2)), [0])
+        cells._pb_cells = pb_cells
+        return cells
+
+    @property
+    def ids(self) -> np.ndarray:
+        self._load()
+        return self._ids
+
+    @property
+    def crs_list(self) -> List[str]:
+        self._load()
+        return self._crs_list
+
+    @property
+    def crs_codes(self) -> np.ndarray:
+        self._load()
+        return self._crs_codes
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        self._load()
+        return self._coordinates
+
+    @property
+    def offsets(self) -> np.ndarray:
+        self._load()
+        return self._offsets
+
+    @classmethod
+    def from_arrays(cls, ids: Sequence[str], crs: Union[str, Sequence[str]],
+                    rings: Sequence[np.ndarray]) -> Cells:
+        """
+        Create cells from arrays
+
+        Args:
+            ids: ids of the cells
+            crs: CRS of all the cells or a list with the CRS of each cell
+            rings: list of (n_i, 2) coordinates of the exterior ring of each cell
+        """
+        lengths = np.fromiter((len(r) for r in rings), dtype=np.int64, count=len(rings))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        coordinates = np.concatenate(rings) if len(rings) > 0 else np.empty((0, 2))
+        return cls(ids, *_crs_to_codes(crs, len(ids)), coordinates, offsets)
+
+    @classmethod
+    def from_geometries(cls, ids: Sequence[str], crs: Union[str, Sequence[str]],
+                        geometries: Sequence[Union[geometry.Polygon, geometry.LinearRing]]) -> Cells:
+        """ Create cells from polygons (only the exterior ring is kept) or linear rings """
+        geometries = np.asarray(geometries, dtype=object)
+        polygons = shapely.get_type_id(geometries) == shapely.GeometryType.POLYGON
+        # Not in place: geometries may be the array of the caller (e.g. GeoSeries.values)
+        geometries = np.where(polygons, shapely.get_exterior_ring(geometries), geometries)
+        coordinates, index = shapely.get_coordinates(geometries, return_index=True)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(index, minlength=len(geometries)))])
+        return cls(ids, *_crs_to_codes(crs, len(ids)), coordinates, offsets)
+
+    @classmethod
+    def from_geodataframe(cls, gdf, id_column: str = "id", crs_column: str = None) -> Cells:
+        """
+        Create cells from a GeoDataFrame of polygons
+
+        Args:
+            gdf: GeoDataFrame with a column of ids
+            id_column: name of the column of ids
+            crs_column: (optional) name of the column defining the crs of each cell. By default, gdf.crs is used.
+        """
+        crs = list(gdf[crs_column]) if crs_column is not None else gdf.crs.to_string()
+        return cls.from_geometries(gdf[id_column].astype(str).values, crs, gdf.geometry.values)
+
+    @classmethod
+    def from_cells(cls, cells: List[Cell]) -> Cells:
+        return cls.from_geometries([c.id for c in cells], [c.crs for c in cells], [c.coordinates for c in cells])
+
+    def __len__(self):
+        return len(self._pb_cells) if self._pb_cells is not None else len(self._ids)
+
+    def __getitem__(self, item) -> Union[Cell, Cells]:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                raise IndexError("Cells: only contiguous slices are supported")
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop+1]
+            return Cells(self.ids[start:stop], self.crs_list, self.crs_codes[start:stop],
+                         self.coordinates[offsets[0]:offsets[-1]], offsets - offsets[0])
+        return Cell(str(self.ids[item]), self.crs(item), geometry.LinearRing(self.ring(item)))
+
+    def __iter__(self) -> Iterator[Cell]:
+        return (self[i] for i in range(len(self)))
+
+    def take(self, indices: Sequence[int]) -> Cells:
+        """ Returns a subset of the cells """
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.offsets[indices+1] - self.offsets[indices]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        points = np.repeat(self.offsets[indices] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return Cells(self.ids[indices], self.crs_list, self.crs_codes[indices], self.coordinates[points], offsets)
+
+    def polygons(self) -> np.ndarray:
+        """ Returns the cells as an array of shapely polygons (in the crs of each cell) """
+        if self._polygons is None:
+            index = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+            self._polygons = shapely.polygons(shapely.linearrings(self.coordinates, indices=index))
+        return self._polygons
+
+    def intersecting(self, geom: geometry.base.BaseGeometry, crs: Union[str, int] = 4326) -> np.ndarray:
+        """
+        Returns the indices of the cells intersecting the geometry
+
+        Args:
+            geom: geometry in the given crs
+            crs: crs of the geometry (by default: geographic coordinates)
+        """
+        return self._query(geom, crs, "intersects")
+
+    def containing(self, x: float, y: float, crs: Union[str, int] = 4326) -> Union[int, None]:
+        """
+        Returns the index of the cell containing the point (or None if no cell contains the point).
+        If several cells contain the point, the first one is returned.
+        """
+        indices = self._query(geometry.Point(x, y), crs, "within")
+        return int(indices[0]) if len(indices) > 0 else None
+
+    def _query(self, geom, crs, predicate: str) -> np.ndarray:
+        indices = []
+        for code, cell_crs in enumerate(self.crs_list):
+            tree, tree_indices = self._tree(code)
+            indices.append(tree_indices[tree.query(to_crs(geom, crs, cell_crs), predicate=predicate)])
+        return np.sort(np.concatenate(indices)) if len(indices) > 0 else np.empty(0, dtype=np.int64)
+
+    def _tree(self, crs_code: int) -> Tuple[shapely.STRtree, np.ndarray]:
+        if crs_code not in self._trees:
+            indices = np.flatnonzero(self.crs_codes == crs_code)
+            self._trees[crs_code] = shapely.STRtree(self.polygons()[indices]), indices
+        return self._trees[crs_code]
+
+    def _load(self):
+        if self._pb_cells is None:
+            return
+        pb_cells, self._pb_cells = self._pb_cells, None
+        rings = [_pb_ring_coordinates(c.coordinates) for c in pb_cells]
+        ids, crs = [c.id for c in pb_cells], [c.crs for c in pb_cells]
+        loaded = Cells.from_arrays(ids, crs, rings)
+        self._ids, self._crs_list, self._crs_codes = loaded._ids, loaded._crs_list, loaded._crs_codes
+        self._coordinates, self._offsets = loaded._coordinates, loaded._offsets
+
+    def crs(self, i: int) -> str:
+        return self.crs_list[self.crs_codes[i]]
+
+    def ring(self, i: int) -> np.ndarray:
+        return self.coordinates[self.offsets[i]:self.offsets[i+1]]
+
+    def iter_pb_bytes(self, block_size: int = 65536) -> Iterator[bytes]:
+        """
+        Yields the serialized layouts_pb2.Cell of each cell.
+        The coordinates are encoded per block of cells with numpy.
+        """
+        crs_bytes = [_pb_string(2, crs) for crs in self.crs_list]
+        for start in range(0, len(self), block_size):
+            stop = min(start + block_size, len(self))
+            offsets = self.offsets[start:stop+1]
+            points = np.empty(offsets[-1] - offsets[0], dtype=_pb_point_dtype)
+            points['tag'], points['len'] = 0x0a, 0x0a
+            points['lon_tag'], points['lat_tag'] = 0x0d, 0x15
+            points['lon'] = self.coordinates[offsets[0]:offsets[-1], 0]
+            points['lat'] = self.coordinates[offsets[0]:offsets[-1], 1]
+            data = points.tobytes()
+            bounds = ((offsets - offsets[0]) * _pb_point_dtype.itemsize).tolist()
+            ids = self.ids[start:stop].tolist()
+            codes = self.crs_codes[start:stop].tolist()
+            for i in range(stop - start):
+                ring = data[bounds[i]:bounds[i+1]]
+                yield b"".join((_pb_string(1, ids[i]), crs_bytes[codes[i]], b"\x1a", _varint(len(ring)), ring))
+
+
 @dataclass
 class Grid:
     name:        str
     description: str
-    cells:       List[Cell]
+    cells:       Union[List[Cell], Cells]
 
     def to_pb(self, from_cell=None, to_cell=None):
         return layouts_pb2.Grid(
@@ -46,8 +262,89 @@ class Grid:
         return cls(
             name=pb_grid.name,
             description=pb_grid.description,
-            cells=[Cell.from_pb(cell) for cell in pb_grid.cells]
+            cells=Cells.from_pb(pb_grid.cells)
         )
 
+    @classmethod
+    def from_geodataframe(cls, name: str, description: str, gdf, id_column: str = "id", crs_column: str = None):
+        """ Create a grid from a GeoDataFrame of polygons (see Cells.from_geodataframe) """
+        return cls(name, description, Cells.from_geodataframe(gdf, id_column, crs_column))
+
+    def iter_create_requests(self, max_bytes: int) -> Iterator[bytes]:
+        """
+        Lazily yields the serialized layouts_pb2.CreateGridRequest to stream the grid to the Geocube.
+        Each request is at most max_bytes (unless a single cell is bigger than max_bytes).
+        """
+        cells = self.cells if isinstance(self.cells, Cells) else Cells.from_cells(self.cells)
+        header = _pb_string(1, self.name) + _pb_string(2, self.description)
+        chunk, size = [header], len(header)
+        for cell in cells.iter_pb_bytes():
+            entry = b"".join((b"\x1a", _varint(len(cell)), cell))
+            if size + len(entry) > max_bytes and len(chunk) > 1:
+                yield _pb_create_grid_request(chunk, size)
+                chunk, size = [header], len(header)
+            chunk.append(entry)
+            size += len(entry)
+        yield _pb_create_grid_request(chunk, size)
+
+    def cells_intersecting(self, aoi: geometry.base.BaseGeometry, crs: Union[str, int] = 4326) -> Cells:
+        """ Returns the cells intersecting the aoi (in geographic coordinates by default) """
+        return self._array_cells().take(self._array_cells().intersecting(aoi, crs))
+
+    def cell_containing(self, x: float, y: float, crs: Union[str, int] = 4326) -> Union[Cell, None]:
+        """ Returns the cell containing the point (in geographic coordinates by default) or None """
+        i = self._array_cells().containing(x, y, crs)
+        return self._array_cells()[i] if i is not None else None
+
+    def _array_cells(self) -> Cells:
+        if not isinstance(self.cells, Cells):
+            self.cells = Cells.from_cells(self.cells)
+        return self.cells
+
     def __str__(self):
         return "Grid '{}': {}".format(self.name, self.description)
+
+
+def _pb_ring_coordinates(pb_ring: records_pb2.LinearRing) -> np.ndarray:
+    """ Decode the points of a ring, directly from the wire format if possible """
+    data = pb_ring.SerializeToString()
+    if len(data) % _pb_point_dtype.itemsize == 0:
+        points = np.frombuffer(data, dtype=_pb_point_dtype)
+        if np.all((points['tag'] == 0x0a) & (points['len'] == 0x0a) &
+                  (points['lon_tag'] == 0x0d) & (points['lat_tag'] == 0x15)):
+            return np.stack([points['lon'], points['lat']], axis=1).astype(np.float64)
+    return np.array([(p.lon, p.lat) for p in pb_ring.points], dtype=np.float64).reshape(-1, 2)
+
+
+def _crs_to_codes(crs: Union[str, Sequence[str]], count: int):
+    if isinstance(crs, str):
+        return [crs], np.zeros(count, dtype=np.int32)
+    crs_list, crs_codes = np.unique(np.asarray(crs, dtype=str), return_inverse=True)
+    return [str(c) for c in crs_list], crs_codes
+
+
+# Varints of 1 or 2 bytes
+_small_varints = [bytes((i,)) if i < 0x80 else bytes(((i & 0x7f) | 0x80, i >> 7)) for i in range(1 << 14)]
+
+
+def _varint(value: int) -> bytes:
+    if value < len(_small_varints):
+        return _small_varints[value]
+    value = int(value)
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _pb_string(field_number: int, value: str) -> bytes:
+    value = value.encode()
+    if len(value) == 0:
+        return b""
+    return b"".join((_varint(field_number << 3 | 2), _varint(len(value)), value))
+
+
+def _pb_create_grid_request(chunk: List[bytes], size: int) -> bytes:
+    return b"".join((b"\x0a", _varint(size), *chunk))
@@ -4,9 +4,7 @@ from datetime import datetime
 from enum import Enum
 from typing import List
 
-import parse
 from shapely import geometry
-import geopandas as gpd
 
 from geocube import utils
 from geocube.pb import operations_pb2, geocube_pb2_grpc as geocube_grpc
@@ -97,6 +95,7 @@ class Job:
         return self
 
     def tasks_from_logs(self) -> List[Task]:
+        import parse
         tasks = {}
         for i, log in enumerate(self.logs):
             log_task = parse.search("Prepare {container:d} container(s) with {records:d} record(s) "
@@ -122,6 +121,7 @@ class Job:
         return list(tasks.values())
 
     def deletion_job_from_logs(self) -> str:
+        import parse
         for log in self.logs:
             deletion_job = parse.search("Create a deletion job to delete {nb_datasets:d} dataset(s): {name:S}", log)
             if deletion_job is not None:
@@ -129,6 +129,7 @@ class Job:
         return ""
 
     def plot_tasks(self):
+        import geopandas as gpd
         tasks = self.tasks_from_logs()
         if len(tasks) == 0:
             raise ValueError("Tasks not found from logs. Cannot display")
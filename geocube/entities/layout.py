@@ -3,6 +3,11 @@ import pprint
 from dataclasses import dataclass, field
 from typing import Tuple, List, Dict, Union
 
+import numpy as np
+import shapely
+from shapely import geometry
+
+from geocube import entities
 from geocube.pb import layouts_pb2
 
 
@@ -102,6 +107,66 @@ class Layout:
         ox, oy, resolution = -earth_perimeter/2, earth_perimeter/2, earth_perimeter/(256*(1 << z_level))
         return Layout.regular(name, "epsg:3857", cell_size=cell_size, resolution=resolution, origin=(ox, oy), **kwargs)
 
+    def can_tile_locally(self) -> bool:
+        """ Returns True if the cells of the layout can be computed locally, using the grid_parameters """
+        grid = self.grid_parameters.get("grid")
+        if grid == "regular":
+            return all(size > 0 for size in self._cell_sizes())
+        return grid == "singlecell"
+
+    def _cell_sizes(self) -> Tuple[int, int]:
+        """ Returns the size (x, y) of the cells of a regular grid (0 if it is not defined) """
+        default = self.grid_parameters.get("cell_size", 0)
+        return (int(self.grid_parameters.get("cell_x_size", default)),
+                int(self.grid_parameters.get("cell_y_size", default)))
+
+    def tile_aoi(self, aoi: Union[geometry.Polygon, geometry.MultiPolygon],
+                 max_segment_length: float = 0.1) -> entities.TileSet:
+        """
+        Compute locally the cells of a regular or singlecell layout covering the AOI (see Client.tile_aoi)
+
+        Args:
+            aoi: AOI to be tiled in **geographic coordinates**
+            max_segment_length: the AOI is densified (in degrees) before being reprojected in the crs of the layout
+
+        Returns:
+            the tiles covering the AOI in the crs of the layout
+        """
+        if not self.can_tile_locally():
+            raise ValueError(f"Layout '{self.name}': the cells of a '{self.grid_parameters.get('grid')}' grid cannot "
+                             f"be computed locally (unknown grid or undefined cell size)")
+        crs = self.grid_parameters["crs"]
+        resolution = float(self.grid_parameters["resolution"])
+        aoi = entities.tile.to_crs(shapely.segmentize(aoi, max_segment_length), 4326, crs)
+
+        if self.grid_parameters["grid"] == "singlecell":
+            return entities.TileSet.from_tiles([entities.Tile.from_bbox(aoi.bounds, crs, resolution)])
+
+        cell_x, cell_y = self._cell_sizes()
+        ox, oy = float(self.grid_parameters.get("ox", 0)), float(self.grid_parameters.get("oy", 0))
+        size_x, size_y = cell_x * resolution, cell_y * resolution
+
+        # The cell (i, j) has its top-left corner at (ox + i*size_x, oy - j*size_y).
+        # For each row of cells, only the cells between the bounds of the AOI inside the row are tested.
+        shapely.prepare(aoi)
+        xmin, ymin, xmax, ymax = aoi.bounds
+        columns, rows = [], []
+        for j in range(math.floor((oy - ymax) / size_y), math.ceil((oy - ymin) / size_y)):
+            row = shapely.clip_by_rect(aoi, xmin, oy - (j + 1) * size_y, xmax, oy - j * size_y)
+            if row.is_empty:
+                continue
+            rxmin, _, rxmax, _ = row.bounds
+            i = np.arange(math.floor((rxmin - ox) / size_x), math.ceil((rxmax - ox) / size_x))
+            cells = shapely.box(ox + i * size_x, oy - (j + 1) * size_y, ox + (i + 1) * size_x, oy - j * size_y)
+            i = i[shapely.intersects(aoi, cells) & ~shapely.touches(aoi, cells)]
+            columns.append(i)
+            rows.append(np.full(len(i), j))
+        i, j = (np.concatenate(columns), np.concatenate(rows)) if columns else (np.empty(0), np.empty(0))
+        transforms = np.zeros((len(i), 6))
+        transforms[:, 0], transforms[:, 4] = resolution, -resolution
+        transforms[:, 2], transforms[:, 5] = ox + i * size_x, oy - j * size_y
+        return entities.TileSet(crs, transforms, np.tile([cell_x, cell_y], (len(i), 1)))
+
     def __repr__(self):
         return f"Layout '{self.name}'"
 
@@ -1,17 +1,30 @@
 from __future__ import annotations
 
 import pprint
-from datetime import datetime
+import typing
+from datetime import datetime, timedelta
 
-from typing import Dict, List, Union, Callable, Any
+from typing import Dict, List, Optional, Union, Callable, Any
 from dataclasses import dataclass
 
-import geopandas as gpd
+import numpy as np
 from shapely import geometry
 
 from geocube import utils
 from geocube.pb import records_pb2
 
+if typing.TYPE_CHECKING:
+    import geopandas as gpd
+    from geocube import entities
+
+
+def _group_by_column(column: str):
+    """ Tags a key function with the column of entities.RecordTable it is equivalent to (used to vectorise group_by) """
+    def decorator(func):
+        func.group_by_column = column
+        return func
+    return decorator
+
 
 def aoi_from_pb(geom: records_pb2.AOI) -> geometry.MultiPolygon:
     polygons = []
@@ -94,6 +107,7 @@ class Record:
         return pb
 
     def geodataframe(self) -> gpd.GeoDataFrame:
+        import geopandas as gpd
         self._check_aoi()
         return gpd.GeoDataFrame(
             {
@@ -129,17 +143,41 @@ class Record:
                "    aoi      {}\n".format(self.aoi if not self._aoi.is_empty else "(not loaded)")
 
     @staticmethod
+    @_group_by_column("date")
     def key_date(r: Record):
         """ Returns the date of the record (without time).
          It's a GroupByKeyFunc, thus it can be used to group_by."""
         return r.datetime.date()
 
     @staticmethod
+    @_group_by_column("datetime")
     def key_datetime(r: Record):
         """ Returns the datetime of the record.
         It's a GroupByKeyFunc, thus it can be used to group_by."""
         return r.datetime
 
+    @staticmethod
+    @_group_by_column("week")
+    def key_week(r: Record):
+        """ Returns the first day (monday) of the week of the record.
+        It's a GroupByKeyFunc, thus it can be used to group_by."""
+        return r.datetime.date() - timedelta(days=r.datetime.weekday())
+
+    @staticmethod
+    @_group_by_column("month")
+    def key_month(r: Record):
+        """ Returns the first day of the month of the record.
+        It's a GroupByKeyFunc, thus it can be used to group_by."""
+        return r.datetime.date().replace(day=1)
+
+    @staticmethod
+    def key_tag(key: str) -> GroupByKeyFunc:
+        """ Returns a GroupByKeyFunc returning the value of the tag (or None if the record does not have the tag) """
+        @_group_by_column(f"tag:{key}")
+        def key_tag(r: Record):
+            return r.tags.get(key)
+        return key_tag
+
     @staticmethod
     def group_by(records: List[Union[Record, GroupedRecords]], func_key: GroupByKeyFunc) -> List[GroupedRecords]:
         """
@@ -151,6 +189,7 @@ class Record:
                 If records is a list of list, records is flattened.
             func_key : function taking a record and returning a key
                 (e.g. entities.Record.key_date, lambda r:r.datetime)
+                Grouping by Record.key_week or Record.key_month is vectorised.
 
         Returns:
             A list of grouped records (which is actually a list of records)
@@ -158,9 +197,16 @@ class Record:
         if len(records) == 0:
             return records
 
-        if isinstance(records[0], list):
+        while isinstance(records[0], list):
             records = [r for rs in records for r in rs]
-            return Record.group_by(records, func_key)
+
+        keys = Record._vectorised_keys(records, func_key)
+        if keys is not None:
+            from geocube.entities.record_table import group_order
+            order, bounds = group_order(keys)
+            records = [records[i] for i in order.tolist()]
+            bounds = bounds.tolist()
+            return [records[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
 
         dict_rs = {}
         for r in records:
@@ -171,8 +217,30 @@ class Record:
                 dict_rs[k].append(r)
         return list(dict_rs.values())
 
+    @staticmethod
+    def _vectorised_keys(records: List[Record], func_key: GroupByKeyFunc) -> Optional[np.ndarray]:
+        """
+        Returns the keys of the records as an array if func_key is Record.key_week or Record.key_month,
+        None otherwise (hashing the date, the datetime or the tag of each record is already faster than
+        extracting the column, see RecordTable to group large catalogues)
+        """
+        column = getattr(func_key, "group_by_column", None)
+        if column not in ("week", "month"):
+            return None
+        import pandas as pd
+        from geocube.entities import record_table
+        try:
+            datetimes = pd.DatetimeIndex([r.datetime for r in records])
+        except ValueError:  # mix of aware and naive datetimes
+            return None
+        if datetimes.tz is not None:
+            # the vectorised keys would be computed in UTC, whereas the key functions use the local date
+            return None
+        return record_table.time_keys(datetimes.values.astype("datetime64[us]"), column)
+
     @staticmethod
     def list_to_geodataframe(records: List[Record]) -> gpd.GeoDataFrame:
+        import geopandas as gpd
         return gpd.GeoDataFrame(
             {
                 "id": [r.id for r in records],
@@ -195,5 +263,5 @@ class Record:
 
 GroupedRecords = List[Record]
 GroupedRecordIds = List[str]
-RecordIdentifiers = Union[str, Record, GroupedRecordIds, GroupedRecords, gpd.GeoDataFrame]
+RecordIdentifiers = Union[str, Record, GroupedRecordIds, GroupedRecords, "gpd.GeoDataFrame", "entities.RecordTable"]
 GroupByKeyFunc = Callable[[Record], Any]
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import fnmatch
+import sys
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from geocube import entities
+from geocube.pb import records_pb2
+
+GroupByKey = Union[str, np.ndarray, Callable]
+_COLUMNS = ("date", "datetime", "week", "month", "year", "name", "aoi_id")
+
+
+def to_datetime64(datetimes: Sequence[Union[datetime, np.datetime64]]) -> np.ndarray:
+    """ Converts datetimes to a datetime64[us] array. Aware datetimes are converted to UTC """
+    if isinstance(datetimes, np.ndarray) and datetimes.dtype.kind == "M":
+        return datetimes.astype("datetime64[us]")
+    if len(datetimes) == 0:
+        return np.array([], dtype="datetime64[us]")
+    # numpy converts the python datetimes one by one, pandas is an order of magnitude faster
+    import pandas as pd
+    return pd.to_datetime(datetimes, utc=True).tz_convert(None).values.astype("datetime64[us]")
+
+
+def time_keys(datetimes: np.ndarray, by: str) -> np.ndarray:
+    """
+    Returns the keys of the datetimes for the time bucket "date", "datetime", "week" (starting on monday),
+    "month" or "year", as a datetime64 array
+    """
+    if by == "datetime":
+        return datetimes
+    if by == "date":
+        return datetimes.astype("datetime64[D]")
+    if by == "week":
+        # 1970-01-01 is a thursday: shift by 3 days to start the weeks on monday
+        days = datetimes.astype("datetime64[D]").astype(np.int64)
+        return ((days + 3) // 7 * 7 - 3).astype("datetime64[D]")
+    if by == "month":
+        return datetimes.astype("datetime64[M]")
+    if by == "year":
+        return datetimes.astype("datetime64[Y]")
+    raise ValueError(f"unknown time bucket {by}")
+
+
+def group_order(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the order of the elements sorted by group of equal keys, the groups being
+    in the order of their first element (as entities.Record.group_by), and the (n_groups+1,) boundaries of the groups
+    """
+    if len(keys) == 0:
+        return np.array([], dtype=np.int64), np.array([0], dtype=np.int64)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    groups = rank[inverse.reshape(-1)]
+    order = np.argsort(groups, kind="stable")
+    return order, np.concatenate([[0], np.flatnonzero(np.diff(groups[order])) + 1, [len(keys)]])
+
+
+def group_indices(keys: np.ndarray) -> List[np.ndarray]:
+    """
+    Returns the indices of the elements of each group of equal keys,
+    in the order of the first element of each group (as entities.Record.group_by).
+    """
+    order, bounds = group_order(keys)
+    return [order[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def grouped_record_ids_pb(ids: np.ndarray, groups: List[np.ndarray]) -> records_pb2.GroupedRecordIdsList:
+    """ Returns the GroupedRecordIdsList of the ids of each group of indices """
+    pb = records_pb2.GroupedRecordIdsList()
+    for idx in groups:
+        pb.records.add().ids.extend(ids[idx].tolist())
+    return pb
+
+
+class Categorical:
+    """
+    Column of repeated strings, stored as the distinct values (categories) and, for each row,
+    the index of its value in the categories (-1 if the value is missing).
+    """
+    __slots__ = ("categories", "codes")
+
+    def __init__(self, categories: np.ndarray, codes: np.ndarray):
+        self.categories = categories
+        self.codes = codes
+
+    @classmethod
+    def from_values(cls, values: Sequence[Optional[str]]) -> Categorical:
+        """ None values are considered as missing """
+        values = np.asarray(values, dtype=object).reshape(-1)
+        present = np.not_equal(values, None)
+        if not present.any():
+            return cls.missing(len(values))
+        codes = np.full(len(values), -1, dtype=np.int32)
+        categories, inverse = np.unique(values[present].astype(str), return_inverse=True)
+        codes[present] = inverse
+        return cls(categories, codes)
+
+    @classmethod
+    def missing(cls, n: int) -> Categorical:
+        """ Returns a column of n missing values """
+        return cls(np.array([], dtype=str), np.full(n, -1, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, item) -> Union[Optional[str], Categorical]:
+        if isinstance(item, (int, np.integer)):
+            code = self.codes[item]
+            return str(self.categories[code]) if code >= 0 else None
+        return Categorical(self.categories, self.codes[item])
+
+    def values(self) -> np.ndarray:
+        """ Returns the values as an (N,) object array (None if the value is missing) """
+        values = np.empty(len(self.codes), dtype=object)
+        present = self.codes >= 0
+        values[present] = self.categories[self.codes[present]]
+        return values
+
+    def match(self, pattern: str) -> np.ndarray:
+        """ Returns the mask of the rows whose value matches the pattern (* and ? are supported) """
+        matching = [i for i, c in enumerate(self.categories) if fnmatch.fnmatchcase(c, pattern)]
+        return np.isin(self.codes, matching)
+
+    @staticmethod
+    def concat(columns: Sequence[Categorical]) -> Categorical:
+        categories = np.unique(np.concatenate([c.categories for c in columns])) if columns else np.array([], str)
+        codes = []
+        for c in columns:
+            remap = np.append(np.searchsorted(categories, c.categories), -1).astype(np.int32)
+            codes.append(remap[c.codes])
+        return Categorical(categories, np.concatenate(codes) if codes else np.array([], dtype=np.int32))
+
+
+class RecordRow:
+    """
+    Lightweight view of a row of a RecordTable, with the same attributes as entities.Record (except the AOI)
+    """
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table: RecordTable, index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def id(self) -> str:
+        return str(self._table.ids[self._index])
+
+    @property
+    def name(self) -> str:
+        return self._table.names_column[self._index]
+
+    @property
+    def datetime(self) -> datetime:
+        return self._table.datetimes[self._index].astype(datetime)
+
+    @property
+    def aoi_id(self) -> str:
+        return self._table.aoi_ids_column[self._index]
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        tags = {}
+        for key, column in self._table.tags.items():
+            value = column[self._index]
+            if value is not None:
+                tags[key] = value
+        return tags
+
+    def to_record(self) -> entities.Record:
+        return entities.Record(id=self.id, name=self.name, datetime=self.datetime, tags=self.tags,
+                               aoi_id=self.aoi_id)
+
+    def __repr__(self):
+        return "Record {} ({})".format(self.name, self.id)
+
+
+class RecordTable:
+    """
+    Column-oriented table of records, for catalogues of millions of records.
+    Names, AOI ids and tag values are stored as Categorical, tag keys are interned and the AOIs are not stored.
+    Filtering and grouping are vectorised. Iterating (or indexing with an integer) yields RecordRow.
+    A RecordTable can be used as CubeParams.records (one record per slice) and with entities.get_ids.
+
+    Attributes:
+        ids:            (N,) ids of the records
+        datetimes:      (N,) datetime64[us] of the records
+        names_column:   (N,) names of the records
+        aoi_ids_column: (N,) aoi ids of the records
+        tags:           tag key -> (N,) tag values of the records (None if the record does not have the tag)
+    """
+    def __init__(self, ids: Sequence[str], names: Union[Sequence[str], Categorical],
+                 datetimes: Sequence[Union[datetime, np.datetime64]], aoi_ids: Union[Sequence[str], Categorical],
+                 tags: Dict[str, Union[Sequence[Optional[str]], Categorical]] = None):
+        self.ids = np.asarray(ids, dtype=str).reshape(-1)
+        self.datetimes = to_datetime64(datetimes).reshape(-1)
+        self.names_column = names if isinstance(names, Categorical) else Categorical.from_values(names)
+        self.aoi_ids_column = aoi_ids if isinstance(aoi_ids, Categorical) else Categorical.from_values(aoi_ids)
+        self.tags = {sys.intern(k): v if isinstance(v, Categorical) else Categorical.from_values(v)
+                     for k, v in (tags or {}).items()}
+        n = len(self.ids)
+        if len(self.datetimes) != n or len(self.names_column) != n or len(self.aoi_ids_column) != n \
+                or any(len(v) != n for v in self.tags.values()):
+            raise ValueError("RecordTable: all the columns must have the same length")
+
+    @classmethod
+    def from_records(cls, records: Union[RecordTable, Sequence[entities.Record]]) -> RecordTable:
+        if isinstance(records, RecordTable):
+            return records
+        return cls._from_rows(((r.id, r.name, r.datetime, r.aoi_id, r.tags) for r in records), len(records))
+
+    @classmethod
+    def from_pb(cls, pb_records: Iterable[records_pb2.Record]) -> RecordTable:
+        """ Creates a table from protobuf records, without creating the intermediate entities.Record """
+        pb_records = list(pb_records)
+        micros = np.fromiter((r.time.seconds * 1000000 + r.time.nanos // 1000 for r in pb_records),
+                             dtype=np.int64, count=len(pb_records))
+        return cls._from_rows(((r.id, r.name, None, r.aoi_id, r.tags) for r in pb_records), len(pb_records),
+                              micros.astype("datetime64[us]"))
+
+    @classmethod
+    def _from_rows(cls, rows: Iterable[Tuple], n: int, datetimes: np.ndarray = None) -> RecordTable:
+        ids, names, aoi_ids, dts = [None] * n, [None] * n, [None] * n, [None] * n
+        tags: Dict[str, List[Optional[str]]] = {}
+        for i, (_id, name, dt, aoi_id, record_tags) in enumerate(rows):
+            ids[i], names[i], dts[i], aoi_ids[i] = _id, name, dt, aoi_id
+            for k, v in record_tags.items():
+                if k not in tags:
+                    tags[k] = [None] * n
+                tags[k][i] = v
+        return cls(ids, names, dts if datetimes is None else datetimes, aoi_ids, tags)
+
+    @classmethod
+    def concat(cls, tables: Sequence[RecordTable]) -> RecordTable:
+        keys = list(dict.fromkeys(k for t in tables for k in t.tags))
+        return cls(np.concatenate([t.ids for t in tables]) if tables else [],
+                   Categorical.concat([t.names_column for t in tables]),
+                   np.concatenate([t.datetimes for t in tables]) if tables else [],
+                   Categorical.concat([t.aoi_ids_column for t in tables]),
+                   {k: Categorical.concat([t.tags[k] if k in t.tags else Categorical.missing(len(t)) for t in tables])
+                    for k in keys})
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item) -> Union[RecordRow, RecordTable]:
+        if isinstance(item, (int, np.integer)):
+            return RecordRow(self, int(item) if item >= 0 else len(self) + int(item))
+        return RecordTable(self.ids[item], self.names_column[item], self.datetimes[item], self.aoi_ids_column[item],
+                           {k: v[item] for k, v in self.tags.items()})
+
+    def __iter__(self) -> Iterator[RecordRow]:
+        return (RecordRow(self, i) for i in range(len(self)))
+
+    def __repr__(self):
+        return f"RecordTable of {len(self)} records"
+
+    @property
+    def names(self) -> np.ndarray:
+        return self.names_column.values()
+
+    @property
+    def aoi_ids(self) -> np.ndarray:
+        return self.aoi_ids_column.values()
+
+    def tag(self, key: str) -> np.ndarray:
+        """ Returns the (N,) values of the tag (None if the record does not have the tag) """
+        if key not in self.tags:
+            return np.full(len(self), None, dtype=object)
+        return self.tags[key].values()
+
+    def filter(self, name: str = None, aoi_id: str = None, tags: Dict[str, str] = None,
+               from_time: datetime = None, to_time: datetime = None) -> RecordTable:
+        """
+        Returns the records matching all the filters
+
+        Args:
+            name: pattern of the name. * and ? are supported to match all or any character.
+            aoi_id: id of the aoi
+            tags: mandatory tags. Support the same pattern as name.
+            from_time: filter by date (included)
+            to_time: filter by date (included)
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if name is not None:
+            mask &= self.names_column.match(name)
+        if aoi_id is not None:
+            mask &= self.aoi_ids_column.match(aoi_id)
+        for k, v in (tags or {}).items():
+            mask &= self.tags[k].match(v) if k in self.tags else False
+        if from_time is not None:
+            mask &= self.datetimes >= np.datetime64(from_time, "us")
+        if to_time is not None:
+            mask &= self.datetimes <= np.datetime64(to_time, "us")
+        return self[mask]
+
+    def group_indices(self, by: GroupByKey) -> List[np.ndarray]:
+        """
+        Returns the indices of the records of each group, in the order of the first record of each group
+        (as entities.Record.group_by). See group_by.
+        """
+        return group_indices(self._group_keys(by))
+
+    def group_by(self, by: GroupByKey) -> List[RecordTable]:
+        """
+        Groups the records by key
+
+        Args:
+            by: "date", "datetime", "week", "month", "year", "name", "aoi_id", "tag:<key>",
+                a key function of entities.Record (key_date, key_datetime, key_week, key_month, key_tag(key))
+                or an (N,) array of keys
+
+        Returns:
+            A list of tables, in the order of the first record of each group
+        """
+        return [self[idx] for idx in self.group_indices(by)]
+
+    def grouped_ids(self, by: Optional[GroupByKey] = None) -> List[entities.GroupedRecordIds]:
+        """
+        Returns the ids of the records, grouped by key (see group_by) or one record per group if by is None.
+        The result can be used as CubeParams.records.
+        """
+        if by is None:
+            return [[i] for i in self.ids.tolist()]
+        return [self.ids[idx].tolist() for idx in self.group_indices(by)]
+
+    def grouped_records_pb(self, by: Optional[GroupByKey] = None) -> records_pb2.GroupedRecordIdsList:
+        """
+        Same as grouped_ids, but returns the protobuf message sent with GetCube.
+        The result can be used as CubeParams.records.
+        """
+        if by is None:
+            return grouped_record_ids_pb(self.ids, np.arange(len(self)).reshape(-1, 1))
+        return grouped_record_ids_pb(self.ids, self.group_indices(by))
+
+    def to_records(self) -> List[entities.Record]:
+        return [row.to_record() for row in self]
+
+    def dataframe(self):
+        """ Returns the table as a pandas.DataFrame, with a column per tag key """
+        import pandas as pd
+        return pd.DataFrame({"id": self.ids, "name": self.names, "datetime": self.datetimes,
+                             "aoi_id": self.aoi_ids, **{f"tag:{k}": v.values() for k, v in self.tags.items()}})
+
+    def _group_keys(self, by: GroupByKey) -> np.ndarray:
+        if callable(by):
+            if not hasattr(by, "group_by_column"):
+                raise ValueError("RecordTable.group_by: only the key functions of entities.Record are supported")
+            by = by.group_by_column
+        if not isinstance(by, str):
+            keys = np.asarray(by)
+            if len(keys) != len(self):
+                raise ValueError("RecordTable.group_by: keys must have the same length as the table")
+            return keys
+        if by in ("date", "datetime", "week", "month", "year"):
+            return time_keys(self.datetimes, by)
+        if by == "name":
+            return self.names_column.codes
+        if by == "aoi_id":
+            return self.aoi_ids_column.codes
+        if by.startswith("tag:"):
+            key = by[len("tag:"):]
+            return self.tags[key].codes if key in self.tags else Categorical.missing(len(self)).codes
+        raise ValueError(f"RecordTable.group_by: unknown key {by} (expecting one of {_COLUMNS} or tag:<key>)")
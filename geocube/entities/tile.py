@@ -1,17 +1,22 @@
 from __future__ import annotations
 
+import functools
 import math
+import typing
 from dataclasses import dataclass
 from typing import Tuple, Union, List
 
 import affine
+import numpy as np
+import shapely
 from shapely import geometry
-import pandas as pd
-import geopandas as gpd
 
 from geocube import entities, utils
 from geocube.pb import layouts_pb2
 
+if typing.TYPE_CHECKING:
+    import geopandas as gpd
+
 
 def geo_transform(offset_x: float, offset_y: float, scale: Union[float, Tuple[float, float]]) -> affine.Affine:
     """ Return a geo_transform (if scale is a float: north-up convention)"""
@@ -34,6 +39,21 @@ def crs_to_str(crs: Union[str, int]) -> str:
     return str(crs)
 
 
+@functools.lru_cache(maxsize=64)
+def _transformer(crs_from: str, crs_to: str):
+    import pyproj
+    return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def to_crs(geom: geometry.base.BaseGeometry, crs_from: Union[str, int], crs_to: Union[str, int]):
+    """ Reproject a shapely geometry (or an array of geometries) from crs_from to crs_to """
+    crs_from, crs_to = crs_to_str(crs_from), crs_to_str(crs_to)
+    if crs_from.lower() == crs_to.lower():
+        return geom
+    t = _transformer(crs_from, crs_to)
+    return shapely.transform(geom, lambda xy: np.stack(t.transform(xy[:, 0], xy[:, 1]), axis=1))
+
+
 @dataclass
 class Tile:
     crs:       str
@@ -115,7 +135,7 @@ class Tile:
         Returns:
             A new tile
         """
-        return Tile.from_bbox(gpd.GeoSeries(aoi, crs=4326).to_crs(crs).total_bounds, crs=crs, resolution=resolution)
+        return Tile.from_bbox(to_crs(aoi, 4326, crs).bounds, crs=crs, resolution=resolution)
 
     def __str__(self):
         return "Tile {}\n" \
@@ -132,6 +152,7 @@ class Tile:
         return self.__str__()
 
     def geoseries(self) -> gpd.GeoSeries:
+        import geopandas as gpd
         x1, y1 = self.transform*(0, 0)
         x2, y2 = self.transform*self.shape
         p = geometry.Polygon([[x1, y1], [x1, y2], [x2, y2], [x2, y1], [x1, y1]])
@@ -157,11 +178,11 @@ class Tile:
         return affine.Affine.from_gdal(*transform)
 
     @staticmethod
-    def to_geoseries(tiles: List[Tile]):
+    def to_geoseries(tiles: Union[List[Tile], entities.TileSet]):
         """ return list of Tiles as geoseries """
-        return gpd.GeoSeries(pd.concat([t.geoseries().to_crs("epsg:4326") for t in tiles]))
+        return entities.TileSet.from_tiles(tiles).geoseries("epsg:4326")
 
     @staticmethod
-    def plot(tiles: List[Tile], **kwargs):
+    def plot(tiles: Union[List[Tile], entities.TileSet], **kwargs):
         """ kwargs: additional arguments for utils.plot_aoi """
         return utils.plot_aoi(Tile.to_geoseries(tiles), **kwargs)
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import Iterator, List, Sequence, Union
+
+import affine
+import numpy as np
+import shapely
+
+from geocube import entities
+from geocube.pb import layouts_pb2
+
+
+class TileSet:
+    """
+    Array-backed list of tiles, returned by Client.tile_aoi.
+    Bounds, footprints and reprojection are computed for all the tiles at once.
+    Iterating (or indexing with an integer) yields entities.Tile.
+
+    Attributes:
+        crs:        (N,) CRS of each tile
+        transforms: (N, 6) pixel-to-crs transforms (a, b, c, d, e, f as in affine.Affine)
+        shapes:     (N, 2) shapes of the tiles in pixels (width, height) (@warning transpose of numpy shape)
+    """
+    def __init__(self, crs: Union[str, Sequence[str]], transforms: np.ndarray, shapes: np.ndarray):
+        self.transforms = np.asarray(transforms, dtype=np.float64).reshape(-1, 6)
+        self.shapes = np.asarray(shapes, dtype=np.int64).reshape(-1, 2)
+        if isinstance(crs, str):
+            crs = [crs] * len(self.transforms)
+        self.crs = np.asarray(crs, dtype=str).reshape(-1)
+        if len(self.crs) != len(self.transforms) or len(self.shapes) != len(self.transforms):
+            raise ValueError("TileSet: crs, transforms and shapes must have the same length")
+
+    @classmethod
+    def from_tiles(cls, tiles: Union[TileSet, List[entities.Tile]]) -> TileSet:
+        if isinstance(tiles, TileSet):
+            return tiles
+        return cls([entities.tile.crs_to_str(t.crs) for t in tiles],
+                   np.array([tuple(t.transform)[:6] for t in tiles]).reshape(-1, 6),
+                   np.array([t.shape for t in tiles]).reshape(-1, 2))
+
+    @classmethod
+    def from_pb(cls, pb_tiles: Sequence[layouts_pb2.Tile]) -> TileSet:
+        return cls([t.crs for t in pb_tiles],
+                   np.array([(t.transform.b, t.transform.c, t.transform.a,
+                              t.transform.e, t.transform.f, t.transform.d) for t in pb_tiles]).reshape(-1, 6),
+                   np.array([(t.size_px.width, t.size_px.height) for t in pb_tiles]).reshape(-1, 2))
+
+    @classmethod
+    def concat(cls, tilesets: List[TileSet]) -> TileSet:
+        return cls(np.concatenate([ts.crs for ts in tilesets]) if tilesets else [],
+                   np.concatenate([ts.transforms for ts in tilesets]) if tilesets else [],
+                   np.concatenate([ts.shapes for ts in tilesets]) if tilesets else [])
+
+    def __len__(self):
+        return len(self.transforms)
+
+    def __getitem__(self, item) -> Union[entities.Tile, TileSet]:
+        if isinstance(item, (int, np.integer)):
+            w, h = self.shapes[item]
+            return entities.Tile(str(self.crs[item]), affine.Affine(*self.transforms[item]), (int(w), int(h)))
+        return TileSet(self.crs[item], self.transforms[item], self.shapes[item])
+
+    def __iter__(self) -> Iterator[entities.Tile]:
+        return (self[i] for i in range(len(self)))
+
+    def __repr__(self):
+        return f"TileSet of {len(self)} tiles"
+
+    def corners(self) -> np.ndarray:
+        """ Returns the (N, 4, 2) coordinates of the corners (0, 0), (0, h), (w, h), (w, 0) in the crs of each tile """
+        w, h = self.shapes[:, 0:1].astype(np.float64), self.shapes[:, 1:2].astype(np.float64)
+        cols = np.concatenate([np.zeros_like(w), np.zeros_like(w), w, w], axis=1)
+        rows = np.concatenate([np.zeros_like(h), h, h, np.zeros_like(h)], axis=1)
+        a, b, c, d, e, f = (self.transforms[:, i:i+1] for i in range(6))
+        return np.stack([a * cols + b * rows + c, d * cols + e * rows + f], axis=2)
+
+    def bounds(self) -> np.ndarray:
+        """ Returns the (N, 4) bounds (xmin, ymin, xmax, ymax) of the tiles in the crs of each tile """
+        corners = self.corners()
+        return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+    def footprints(self) -> np.ndarray:
+        """ Returns the footprints of the tiles as an array of shapely polygons (in the crs of each tile) """
+        corners = self.corners()
+        return shapely.polygons(np.concatenate([corners, corners[:, :1]], axis=1))
+
+    def geoseries(self, to_crs: Union[str, int, None] = None):
+        """
+        Returns the footprints of the tiles as a GeoSeries.
+        The footprints are reprojected to to_crs, once per distinct crs of the tiles.
+        If to_crs is None, all the tiles must have the same crs.
+        """
+        import geopandas as gpd
+        crs_list = np.unique(self.crs)
+        if to_crs is None:
+            if len(crs_list) > 1:
+                raise ValueError("TileSet.geoseries: tiles have different crs, to_crs must be defined")
+            return gpd.GeoSeries(self.footprints(), crs=crs_list[0] if len(crs_list) > 0 else None)
+        to_crs = entities.tile.crs_to_str(to_crs)
+        footprints = self.footprints()
+        for crs in crs_list:
+            mask = self.crs == crs
+            footprints[mask] = gpd.GeoSeries(footprints[mask], crs=str(crs)).to_crs(to_crs).values
+        return gpd.GeoSeries(footprints, crs=to_crs)
+
+    def expand(self, overlap: int, center: bool = False) -> TileSet:
+        """
+        Returns new tiles expanded by overlap pixels in width and height
+
+        Args:
+            overlap: number of pixels added to the width and the height of each tile
+            center: if True, the tiles are expanded by overlap/2 pixels on each side.
+                Otherwise, they are expanded on the right and at the bottom.
+        """
+        transforms = self.transforms.copy()
+        if center:
+            a, b, _, d, e, _ = self.transforms.T
+            transforms[:, 2] -= (a + b) * overlap / 2
+            transforms[:, 5] -= (d + e) * overlap / 2
+        return TileSet(self.crs, transforms, self.shapes + overlap)
+
+    def to_list(self) -> List[entities.Tile]:
+        return list(self)
@@ -1,16 +1,24 @@
+import sys
 from typing import Union, List
-import geopandas as gpd
 
 from geocube import entities
 
 
-EntityIdable = Union[str, entities.Record, entities.VariableInstance, entities.Layout, entities.Job, gpd.GeoDataFrame]
+EntityIdable = Union[str, "entities.Record", "entities.RecordRow", "entities.VariableInstance", "entities.Layout",
+                     "entities.Job", "gpd.GeoDataFrame"]
+
+
+def is_geodataframe(obj) -> bool:
+    """ Returns True if obj is a GeoDataFrame (without importing geopandas, as it cannot be one otherwise) """
+    return "geopandas" in sys.modules and isinstance(obj, sys.modules["geopandas"].GeoDataFrame)
 
 
 def get_ids(ents: Union[EntityIdable, List[EntityIdable]]) -> List[str]:
     """ Returns a list of ids given something that have an id """
-    if isinstance(ents, gpd.GeoDataFrame):
+    if is_geodataframe(ents):
         return list(ents['id'])
+    if isinstance(ents, entities.RecordTable):
+        return ents.ids.tolist()
     try:
         return [get_id(ents)]
     except TypeError:
@@ -21,12 +29,12 @@ def get_id(entity: EntityIdable) -> str:
     """ Returns an id given something that have an id """
     if isinstance(entity, str):
         return entity
-    if isinstance(entity, entities.Record) or isinstance(entity, entities.Job):
+    if isinstance(entity, (entities.Record, entities.RecordRow, entities.Job)):
         return entity.id
     if isinstance(entity, entities.Layout):
         return entity.name
     if isinstance(entity, entities.VariableInstance):
         return entity.instance_id
-    if isinstance(entity, gpd.GeoDataFrame) and len(entity.index) == 1:
+    if is_geodataframe(entity) and len(entity.index) == 1:
         return entity["id"].iloc[0]
     raise TypeError
@@ -0,0 +1,160 @@
+import collections
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+UNARY = "unary"
+STREAM = "stream"
+
+
+class _Budget:
+    """
+    Fair (FIFO) semaphore whose limit is adapted with an AIMD policy:
+    the limit is increased by 1/limit after each success and halved on overload
+    (at most once per decrease_interval).
+    """
+    def __init__(self, limit: int, min_limit: int, latency_factor: Optional[float], decrease_interval: float):
+        self.max_limit = max(limit, 1)
+        self.min_limit = max(min(min_limit, self.max_limit), 1)
+        self.limit = float(self.max_limit)
+        self.latency_factor = latency_factor
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self.waiters = collections.deque()
+        self.lock = threading.Lock()
+        self.baselines: Dict[str, float] = {}  # Average latency of each method
+        self.last_decrease = 0.
+        self.stats = collections.Counter()
+        self.wait_time = 0.
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self.lock:
+            if not self.waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                self.stats["acquired"] += 1
+                return True
+            if timeout is not None and timeout <= 0:
+                return False
+            event = threading.Event()
+            self.waiters.append(event)
+            self.stats["queued"] += 1
+        start = time.monotonic()
+        granted = event.wait(timeout)
+        with self.lock:
+            self.wait_time += time.monotonic() - start
+            if not granted and not event.is_set():
+                self.waiters.remove(event)
+                self.stats["timeouts"] += 1
+                return False
+            self.stats["acquired"] += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self._grant()
+
+    def succeeded(self, latency: Optional[float], method: str):
+        with self.lock:
+            if latency is None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._grant()
+                return
+            baseline = self.baselines.get(method)
+            if self.latency_factor is not None and baseline is not None and latency > self.latency_factor * baseline:
+                self._decrease()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._grant()
+            self.baselines[method] = latency if baseline is None else 0.95 * baseline + 0.05 * latency
+
+    def overloaded(self):
+        with self.lock:
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease >= self.decrease_interval:
+            self.last_decrease = now
+            self.limit = max(self.min_limit, self.limit / 2)
+            self.stats["decreases"] += 1
+
+    def _grant(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.waiters.popleft().set()
+
+    def to_dict(self) -> Dict[str, float]:
+        with self.lock:
+            return {"limit": int(self.limit), "in_flight": self.in_flight, "waiting": len(self.waiters),
+                    "wait_time": self.wait_time, **self.stats}
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the number of calls in flight, with separate budgets for unary calls and streams.
+    Excess calls are queued in FIFO order. The budgets decrease adaptively when the server returns
+    RESOURCE_EXHAUSTED or when the latency of a unary call spikes (latency > latency_factor * average latency of
+    the same method), and slowly increase back to their maximum (AIMD).
+    A stream takes its permit when its first response is requested and keeps it until it is exhausted or cancelled:
+    iterating more than max_streams streams at the same time blocks until one of them is released.
+
+    A limiter can be shared by several clients of the same process (see ConcurrencyLimiter.shared).
+    >>> client.use_limiter(ConcurrencyLimiter.shared(max_streams=4))
+    """
+    _registry: Dict[Tuple[int, str], "ConcurrencyLimiter"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, max_unary: int = 64, max_streams: int = 16, min_limit: int = 1,
+                 latency_factor: Optional[float] = 5., decrease_interval: float = 1.):
+        """
+        Args:
+            max_unary: maximum number of unary calls in flight
+            max_streams: maximum number of streams in flight (e.g. GetCube)
+            min_limit: the budgets are never decreased below min_limit
+            latency_factor: a latency greater than latency_factor * average latency of the method is considered
+                as a spike.
+                None to only adapt on RESOURCE_EXHAUSTED
+            decrease_interval: minimum interval in seconds between two decreases of a budget
+        """
+        self._budgets = {UNARY: _Budget(max_unary, min_limit, latency_factor, decrease_interval),
+                         STREAM: _Budget(max_streams, min_limit, latency_factor, decrease_interval)}
+
+    @classmethod
+    def shared(cls, name: str = "default", **kwargs) -> "ConcurrencyLimiter":
+        """
+        Returns the limiter shared by all the clients of the current process under this name.
+        kwargs are only used to create the limiter the first time.
+        """
+        key = (os.getpid(), name)
+        with cls._registry_lock:
+            if key not in cls._registry:
+                cls._registry[key] = cls(**kwargs)
+            return cls._registry[key]
+
+    def acquire(self, kind: str, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a permit of this kind (UNARY or STREAM). Returns False if the timeout expired
+        (timeout=0: only take a permit if one is available immediately)
+        """
+        return self._budgets[kind].acquire(timeout)
+
+    def release(self, kind: str):
+        self._budgets[kind].release()
+
+    def succeeded(self, kind: str, latency: Optional[float], method: str = ""):
+        """
+        Report a successful call.
+        The latency is compared to the average latency of the same method.
+        None if the latency is not a congestion signal (e.g. time to the first response of a stream, that depends
+        on the size of the request): the budget is only increased.
+        """
+        self._budgets[kind].succeeded(latency, method)
+
+    def overloaded(self, kind: str):
+        """ Report that the server is overloaded (RESOURCE_EXHAUSTED) """
+        self._budgets[kind].overloaded()
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        return {kind: budget.to_dict() for kind, budget in self._budgets.items()}
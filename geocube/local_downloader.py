@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import collections
+import itertools
+import typing
+from concurrent import futures
+from typing import List, Optional
+
+import numpy as np
+
+from geocube import entities
+from geocube.downloader import Downloader, FileFormatRaw, FileFormatGTiff, _global_header
+from geocube.limiter import ConcurrencyLimiter
+from geocube.pb import catalog_pb2, datasetMeta_pb2, records_pb2
+
+# Resampling algorithms of rasterio, by name of entities.Resampling (others have the same name)
+_rasterio_resampling = {
+    entities.Resampling.undefined: "nearest",
+    entities.Resampling.near: "nearest",
+    entities.Resampling.cubicspline: "cubic_spline",
+}
+
+
+class LocalDownloader(Downloader):
+    """
+    Downloader that reads the containers in-process, without any Geocube Downloader.
+    It interprets the metadata of the datasets returned by Client.get_cube_metadata (see entities.CubeMetadata) and,
+    for each slice, reads the containers (windowed reads with rasterio, in a pool of threads), maps the pixels of
+    each dataset to the values of the variable (dformat, range_min, range_max, exponent), reprojects them
+    with the resampling algorithm of the cube and merges them (the first valid pixel wins).
+
+    It is intended to be used next to the data (the containers must be readable by rasterio/GDAL).
+
+    The values of the variable are cast to the dtype of the ref dformat (rounded and clipped for integer dtypes)
+    and the pixels without data are set to its no_data.
+
+    >>> client.use_downloader(LocalDownloader())
+    """
+    def __init__(self, max_workers: int = 8, prefetch: int = 2):
+        """
+        Args:
+            max_workers: number of datasets read concurrently
+            prefetch: number of slices prepared in advance
+        """
+        self.max_workers = max(max_workers, 1)
+        self.prefetch = max(prefetch, 1)
+        self.always_predownload = False
+
+    def version(self) -> str:
+        return "local"
+
+    def use_limiter(self, limiter: typing.Optional[ConcurrencyLimiter]):
+        """ LocalDownloader does not call the Geocube: the limiter is ignored """
+
+    def _get_cube_it(self, metadata: entities.CubeMetadata, file_format=FileFormatRaw, file_pattern: str = None,
+                     predownload: bool = False) -> entities.CubeIterator:
+        return entities.CubeIterator(_LocalStream(self, metadata, file_format), file_format, file_pattern)
+
+
+class _LocalStream:
+    """ Stream of DownloadCube responses, whose slices are merged in a pool of threads """
+    def __init__(self, downloader: LocalDownloader, metadata: entities.CubeMetadata, file_format):
+        self._metadata = metadata
+        self._file_format = file_format
+        self._executor = futures.ThreadPoolExecutor(downloader.max_workers)
+        self._futures = collections.deque()
+        self._slices = iter(metadata.slices)
+        for s in itertools.islice(self._slices, downloader.prefetch):
+            self._futures.append((s, self._submit(s)))
+        self._responses = iter([_global_header(metadata)])
+
+    def _submit(self, s: entities.SliceMetadata) -> List[futures.Future]:
+        return [self._executor.submit(read_dataset, m, self._metadata) for m in s.metadata]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> catalog_pb2.GetCubeMetadataResponse:
+        response = next(self._responses, None)
+        if response is not None:
+            return response
+        if not self._futures:
+            self._executor.shutdown(wait=False)
+            raise StopIteration
+        s, fs = self._futures.popleft()
+        next_slice = next(self._slices, None)
+        if next_slice is not None:
+            self._futures.append((next_slice, self._submit(next_slice)))
+        return self._header(s, fs)
+
+    def _header(self, s: entities.SliceMetadata, fs: List[futures.Future]) -> catalog_pb2.GetCubeMetadataResponse:
+        header = catalog_pb2.ImageHeader(
+            grouped_records=records_pb2.GroupedRecords(records=[r.to_pb() for r in s.grouped_records]),
+            dataset_meta=datasetMeta_pb2.DatasetMeta(internalsMeta=s.metadata))
+        try:
+            image = merge([f.result() for f in fs], self._metadata.dformat)
+            if image is None:
+                image = np.full(self._image_shape(s), self._metadata.dformat.no_data,
+                                dtype=self._metadata.dformat.dtype)
+            data = to_geotiff(image, self._metadata) if self._file_format == FileFormatGTiff \
+                else image.astype(image.dtype.newbyteorder("<"), copy=False).tobytes()
+        except Exception as e:
+            header.error = str(e)
+            return catalog_pb2.GetCubeMetadataResponse(header=header)
+        header.shape.dim1, header.shape.dim2, header.shape.dim3 = image.shape[2], image.shape[1], image.shape[0]
+        header.dtype = entities.dataformat.pb_types.index(image.dtype.name)
+        header.order = catalog_pb2.LittleEndian
+        header.nb_parts = 1
+        header.data = data
+        header.size = len(data)
+        return catalog_pb2.GetCubeMetadataResponse(header=header)
+
+    def _image_shape(self, s: entities.SliceMetadata):
+        bands = max((len(m.bands) for m in s.metadata), default=1) or 1
+        return self._metadata.shape[1], self._metadata.shape[0], bands
+
+    def cancel(self):
+        for _, fs in self._futures:
+            for f in fs:
+                f.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
+
+
+def read_dataset(meta: datasetMeta_pb2.InternalMeta, metadata: entities.CubeMetadata) -> Optional[np.ndarray]:
+    """
+    Reads the part of the dataset covering the cube, reprojected on the grid of the cube and mapped to the values of
+    the variable
+
+    Returns:
+        a float64 array (height, width, bands) with NaN where there is no data, or None if the dataset does not
+        intersect the cube
+    """
+    import rasterio
+    import rasterio.errors
+    from rasterio import warp, windows
+
+    width, height = metadata.shape
+    try:
+        uri = _dataset_uri(meta)
+        with rasterio.open(uri) as ds:
+            bounds = windows.bounds(windows.Window(0, 0, width, height), metadata.transform)
+            if ds.crs is not None and rasterio.crs.CRS.from_user_input(metadata.crs) != ds.crs:
+                bounds = warp.transform_bounds(metadata.crs, ds.crs, *bounds)
+            # Pad the window to get the neighbours required by the resampling
+            window = windows.from_bounds(*bounds, transform=ds.transform)
+            window = windows.Window(window.col_off - 2, window.row_off - 2, window.width + 4, window.height + 4)
+            window = window.round_offsets().round_lengths()
+            try:
+                window = window.intersection(windows.Window(0, 0, ds.width, ds.height))
+            except rasterio.errors.WindowError:
+                return None
+            bands = list(meta.bands) or list(range(1, ds.count + 1))
+            data = ds.read(bands, window=window, out_dtype="float64")
+            src_transform, src_crs = ds.window_transform(window), ds.crs or metadata.crs
+    except rasterio.errors.RasterioIOError as e:
+        raise IOError(f"{meta.container_uri}: {e}") from e
+
+    no_data = meta.dformat.no_data
+    if not np.isnan(no_data):
+        data[data == no_data] = np.nan
+    out = np.full((len(bands), height, width), np.nan)
+    warp.reproject(data, out, src_transform=src_transform, src_crs=src_crs, src_nodata=np.nan,
+                   dst_transform=metadata.transform, dst_crs=metadata.crs, dst_nodata=np.nan,
+                   resampling=getattr(warp.Resampling, _rasterio_resampling.get(
+                       metadata.resampling_alg, metadata.resampling_alg.name)))
+    return np.moveaxis(rescale(out, meta), 0, -1)
+
+
+def rescale(data: np.ndarray, meta: datasetMeta_pb2.InternalMeta) -> np.ndarray:
+    """
+    Maps the internal values of a dataset [dformat.min_value, dformat.max_value] to the values of the variable
+    [range_min, range_max]: (RangeMax - RangeMin) * pow((Value - Min) / (Max - Min), Exponent) + RangeMin
+    """
+    dmin, dmax = meta.dformat.min_value, meta.dformat.max_value
+    if dmin == meta.range_min and dmax == meta.range_max and meta.exponent in (0, 1):
+        return data
+    if dmax == dmin:
+        return np.where(np.isnan(data), np.nan, meta.range_min)
+    data = (data - dmin) / (dmax - dmin)
+    if meta.exponent not in (0, 1):
+        data = np.power(np.clip(data, 0, None), meta.exponent)
+    return meta.range_min + (meta.range_max - meta.range_min) * data
+
+
+def merge(images: List[Optional[np.ndarray]], dformat: entities.DataFormat) -> Optional[np.ndarray]:
+    """ Merges the datasets of a slice (the first valid pixel wins) and casts the result to dformat """
+    result = None
+    for image in images:
+        if image is None:
+            continue
+        if result is None:
+            result = image
+        else:
+            missing = np.isnan(result)
+            result[missing] = image[missing]
+    if result is None:
+        return None
+    dtype = np.dtype(dformat.dtype)
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        result = np.clip(np.rint(result), info.min, info.max)
+    if not np.isnan(dformat.no_data):
+        result[np.isnan(result)] = dformat.no_data
+    return result.astype(dtype)
+
+
+def to_geotiff(image: np.ndarray, metadata: entities.CubeMetadata) -> bytes:
+    from rasterio.io import MemoryFile
+    with MemoryFile() as f:
+        with f.open(driver="GTiff", width=image.shape[1], height=image.shape[0], count=image.shape[2],
+                    dtype=image.dtype.name, crs=metadata.crs, transform=metadata.transform,
+                    nodata=None if np.isnan(metadata.dformat.no_data) else metadata.dformat.no_data) as dst:
+            dst.write(np.moveaxis(image, -1, 0))
+        return f.read()
+
+
+def _dataset_uri(meta: datasetMeta_pb2.InternalMeta) -> str:
+    """ Returns the uri of the dataset opened by rasterio: the container or its subdataset container_subdir """
+    if meta.container_subdir == "":
+        return meta.container_uri
+    import rasterio
+    with rasterio.open(meta.container_uri) as ds:
+        for subdataset in ds.subdatasets:
+            if subdataset.endswith(":" + meta.container_subdir):
+                return subdataset
+    raise IOError(f"{meta.container_uri}: subdataset {meta.container_subdir} not found")
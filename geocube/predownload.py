@@ -0,0 +1,106 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from geocube import entities
+
+logger = logging.getLogger("geocube.predownload")
+
+
+@dataclass
+class PredownloadDecision:
+    """
+    Decision of a PredownloadPlanner and the metrics it is based on (logged for tuning)
+
+    Attributes:
+        predownload: True to predownload the containers before merging the datasets
+        coverage: estimated fraction of the predownloaded pixels that are actually used by the cube
+        threshold: minimum coverage to predownload, adjusted with the throughputs observed for each mode
+        info: metrics of CubeMetadata.info() (datasets, containers, images and temporal/spatial fragmentation)
+    """
+    predownload: bool
+    coverage: float
+    threshold: float
+    info: Dict[str, float]
+
+    def __str__(self):
+        return f"predownload={self.predownload} (coverage: {self.coverage:.2f}, threshold: {self.threshold:.2f}, " \
+               f"{self.info['datasets']} dataset(s) in {self.info['containers']} container(s) " \
+               f"for {self.info['images']} image(s), " \
+               f"temporal fragmentation: {100 * self.info['temporal_fragmentation']:.0f}%, " \
+               f"spatial fragmentation: {100 * self.info['spatial_fragmentation']:.0f}%)"
+
+
+class PredownloadPlanner:
+    """
+    Chooses whether the Geocube Downloader should predownload the containers of a cube (or of a batch of slices).
+
+    Predownloading a container is efficient when most of it is actually used: when the requested window covers a
+    large part of the container or when the container is read several times (several datasets per container).
+    The coverage is estimated with the metrics of CubeMetadata.info() and, if container_shape is defined,
+    with the size of the window compared to the size of the containers:
+      - coverage = datasets * min(window, container) / (containers * container)   if container_shape is defined,
+      - coverage = 1 - containers / datasets                                         otherwise.
+
+    The threshold on the coverage is adjusted with the throughputs (MB/s, exponential moving average) observed with
+    and without predownload: if predownloading has been twice faster, half the coverage is enough.
+
+    Each decision is logged (logger "geocube.predownload") and the throughputs must be recorded (see record()).
+    Downloaders do it when predownload is None (automatic).
+
+    >>> downloader.always_predownload = None  # automatic, using downloader.planner
+    >>> downloader.planner = PredownloadPlanner(container_shape=(10980, 10980), threshold=0.3)
+    """
+    def __init__(self, threshold: float = 0.5, container_shape: Optional[Tuple[int, int]] = None,
+                 alpha: float = 0.3):
+        """
+        Args:
+            threshold: minimum coverage to predownload the containers (before adjustment with the throughputs)
+            container_shape: (optional) shape of the containers (in pixels at the resolution of the cube),
+                e.g. the block shape of the layout of consolidation
+            alpha: smoothing factor of the exponential moving average of the throughputs
+        """
+        self.threshold = threshold
+        self.container_shape = container_shape
+        self.alpha = alpha
+        self.throughputs: Dict[bool, float] = {}
+        self._lock = threading.Lock()
+
+    def decide(self, metadata: entities.CubeMetadata) -> PredownloadDecision:
+        """ Returns whether the slices of metadata should be predownloaded """
+        info = metadata.info(verbose=False)
+        decision = PredownloadDecision(False, self.coverage(metadata, info), self.adjusted_threshold(), info)
+        decision.predownload = info["datasets"] > 0 and decision.coverage >= decision.threshold
+        logger.info(str(decision))
+        return decision
+
+    def coverage(self, metadata: entities.CubeMetadata, info: Dict[str, float]) -> float:
+        """ Estimated fraction of the pixels of the containers that are used by the cube """
+        if info["datasets"] == 0:
+            return 0
+        if self.container_shape is None:
+            return 1 - info["containers"] / info["datasets"]
+        container = self.container_shape[0] * self.container_shape[1]
+        window = metadata.shape[0] * metadata.shape[1]
+        return min(1., info["datasets"] * min(window, container) / (info["containers"] * container))
+
+    def adjusted_threshold(self) -> float:
+        """ Threshold on the coverage, adjusted with the ratio of the throughputs with and without predownload """
+        with self._lock:
+            if len(self.throughputs) < 2 or self.throughputs[False] == 0:
+                return self.threshold
+            ratio = self.throughputs[True] / self.throughputs[False]
+        return min(1., self.threshold / ratio) if ratio > 0 else 1.
+
+    def record(self, predownload: bool, nbytes: int, seconds: float):
+        """ Records the throughput of a download (nbytes received in seconds) """
+        if seconds <= 0:
+            return
+        throughput = nbytes / 2 ** 20 / seconds
+        with self._lock:
+            previous = self.throughputs.get(predownload)
+            self.throughputs[predownload] = throughput if previous is None \
+                else self.alpha * throughput + (1 - self.alpha) * previous
+        logger.debug(f"predownload={predownload}: {throughput:.1f} MB/s "
+                     f"(average: {self.throughputs[predownload]:.1f} MB/s)")
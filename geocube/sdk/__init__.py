@@ -1,13 +1,35 @@
 import os
+import typing
 
-from geocube.sdk.aoi import tile_aoi
-from geocube.sdk.connection_params import ConnectionParams
-from geocube.sdk.collection import Collection
-from geocube.sdk.multiprocess import is_pickleable, MultiProcesses, MessageType, Status, ResultsEncoder, \
-    ProcessAbnormalTermination, ProcessTimeoutError, ProcessPicklingError, message_queue_t
-from geocube.sdk.catalogue import image_callback_t, image_do_nothing, cube_callback_t, cube_do_nothing,\
-    get_cube, get_cubes, is_geocube_error
-from geocube.sdk.retry import retry_on_geocube_error
+from geocube._lazy import lazy_attributes
+
+# Attributes are imported lazily (PEP 562): e.g. a worker only using ConnectionParams does not load dask
+__getattr__, __dir__, __all__ = lazy_attributes(__name__, {
+    ".aoi": ["tile_aoi"],
+    ".connection_params": ["ConnectionParams"],
+    ".collection": ["Collection"],
+    ".multiprocess": ["is_pickleable", "MultiProcesses", "MessageType", "Status", "ResultsEncoder",
+                      "ProcessAbnormalTermination", "ProcessTimeoutError", "ProcessPicklingError", "message_queue_t"],
+    ".catalogue": ["image_callback_t", "image_do_nothing", "cube_callback_t", "cube_do_nothing",
+                   "get_cube", "get_cubes", "reduce_cube", "is_geocube_error", "ImageCallbackError"],
+    ".tiles": ["map_tiles", "tile_id"],
+    ".reducers": ["Reducer", "Count", "MeanVar", "MinMax", "Percentiles"],
+    ".retry": ["retry_on_geocube_error"],
+    ".tile_server": ["TileServer"],
+})
+
+if typing.TYPE_CHECKING:
+    from geocube.sdk.aoi import tile_aoi
+    from geocube.sdk.connection_params import ConnectionParams
+    from geocube.sdk.collection import Collection
+    from geocube.sdk.multiprocess import is_pickleable, MultiProcesses, MessageType, Status, ResultsEncoder, \
+        ProcessAbnormalTermination, ProcessTimeoutError, ProcessPicklingError, message_queue_t
+    from geocube.sdk.catalogue import image_callback_t, image_do_nothing, cube_callback_t, cube_do_nothing,\
+        get_cube, get_cubes, reduce_cube, is_geocube_error, ImageCallbackError
+    from geocube.sdk.tiles import map_tiles, tile_id
+    from geocube.sdk.reducers import Reducer, Count, MeanVar, MinMax, Percentiles
+    from geocube.sdk.retry import retry_on_geocube_error
+    from geocube.sdk.tile_server import TileServer
 
 assert "GRPC_ENABLE_FORK_SUPPORT" in os.environ and os.environ["GRPC_ENABLE_FORK_SUPPORT"] == "1", \
     "To use this functionality, set the **global** environment variable GRPC_ENABLE_FORK_SUPPORT=1"
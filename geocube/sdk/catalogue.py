@@ -1,5 +1,8 @@
+import copy
 import functools
+import multiprocessing
 import time
+from concurrent import futures
 from typing import Union, List, Callable, Any, Dict, Tuple, Optional
 
 import affine
@@ -10,6 +13,7 @@ import geocube
 from geocube import entities, sdk
 from geocube.sdk import ConnectionParams
 from geocube.sdk.multiprocess import _has_parameter
+from geocube.sdk.reducers import Reducer, ReducerResult
 from geocube.utils import GeocubeError
 
 
@@ -74,9 +78,19 @@ def is_geocube_error(error):
     return isinstance(error, GeocubeError)
 
 
+class ImageCallbackError(Exception):
+    """ image_callback failed on some slices of the cube (errors: index of the slice -> exception) """
+    def __init__(self, errors: Dict[int, BaseException]):
+        self.errors = errors
+        super().__init__(f"image_callback failed on {len(errors)} slice(s): " +
+                         "; ".join(f"[{i}] {type(e).__name__}: {e}" for i, e in sorted(errors.items())))
+
+
 def get_cube(connection_params: ConnectionParams, cube_params: entities.CubeParams,
              image_callback: image_callback_t = image_do_nothing, cube_callback: cube_callback_t = cube_do_nothing,
-             compression: int = 0, verbose: bool = False, mp_log_queue: sdk.message_queue_t = None)\
+             compression: int = 0, verbose: bool = False, mp_log_queue: sdk.message_queue_t = None,
+             dtype: Optional[str] = "float64", mask_nodata: bool = False,
+             callback_workers: int = 0, callback_executor: str = "thread")\
         -> Tuple[np.array, List[entities.GroupedRecords]]:
     """
     A wrapper on client.get_cube, adding a call to 'image_callback' on each slice of the cube (cf client.get_cube)
@@ -89,6 +103,17 @@ def get_cube(connection_params: ConnectionParams, cube_params: entities.CubePara
         mp_log_queue: a callable to receive logs and progress updates
         verbose: see geocube.Client.get_cube
         compression: see geocube.Client.get_cube
+        dtype: of the timeseries (each slice is cast on the fly). None to keep the dtype of the slices
+            (returned by image_callback)
+        mask_nodata: mask the pixels equal to the no_data of the cube: they are set to NaN if dtype is a floating
+            type, otherwise a np.ma.MaskedArray is returned. The slices are masked before image_callback, that receives
+            a np.ma.MaskedArray: if it changes the shape of the slice, it must return a np.ma.MaskedArray (or NaN) to
+            keep the mask.
+        callback_workers: if > 0, image_callback is called in a pool of callback_workers workers, while the next
+            slices are received. If image_callback fails on some slices, ImageCallbackError is raised once all the
+            slices are received and processed.
+        callback_executor: "thread" or "process" (image_callback and its arguments must be pickleable and the
+            processes are started with forkserver: the main module must be import-safe)
     """
     geo_params = {
         "crs": cube_params.crs,
@@ -98,7 +123,8 @@ def get_cube(connection_params: ConnectionParams, cube_params: entities.CubePara
 
     image_cb = _partial_func(image_callback, **geo_params)
     images, records = _get_cube(connection_params.new_client(with_downloader=True),
-                                cube_params, image_cb, compression, verbose, mp_log_queue)
+                                cube_params, image_cb, compression, verbose, mp_log_queue, dtype, mask_nodata,
+                                callback_workers, callback_executor)
 
     if cube_callback is not None:
         return _partial_func(cube_callback,
@@ -111,19 +137,30 @@ def get_cube(connection_params: ConnectionParams, cube_params: entities.CubePara
 
 def get_cubes(connection_params: ConnectionParams, cube_params: entities.CubeParams, variables: Dict[str, str],
               image_callback: image_callback_t = image_do_nothing, cube_callback: cube_callback_t = cube_do_nothing,
-              compression: int = 0, verbose: bool = False, mp_log_queue: sdk.message_queue_t = None):
+              compression: int = 0, verbose: bool = False, mp_log_queue: sdk.message_queue_t = None,
+              dtype: Optional[str] = "float64", mask_nodata: bool = False, max_concurrency: int = 1,
+              callback_workers: int = 0, callback_executor: str = "thread"):
     """
-    A loop over a call to client.get_cube for each variable, adding a call to 'image_callback' on each slice of the cube
+    A call to client.get_cube for each variable, adding a call to 'image_callback' on each slice of the cube
     and a call to 'cube_callback' on each cube
     Args:
         connection_params: to connect to the Geocube
         cube_params: see geocube.Client.get_cube
         variables: list of variables (couples of (variable, instance)) to be retrieved
         image_callback: a function called for each slice of the cube (by default: do_nothing)
-        cube_callback: a function called for each cube (by default: do_nothing)
+        cube_callback: a function called for each cube (by default: do_nothing), as soon as it is retrieved
+            (in the calling thread)
         verbose: see geocube.Client.get_cube
         compression: see geocube.Client.get_cube
-        mp_log_queue: a callable to receive logs and progress updates
+        mp_log_queue: a callable to receive logs and progress updates (fraction of the cubes retrieved)
+        dtype: see get_cube
+        mask_nodata: see get_cube
+        max_concurrency: maximum number of cubes retrieved concurrently (image_callback is called concurrently
+            if max_concurrency > 1). The instances are loaded concurrently beforehand.
+        callback_workers: see get_cube (for each cube)
+        callback_executor: see get_cube
+    Returns:
+        a dictionary {"variable.instance": result of cube_callback} (in the order of variables)
     """
     client = connection_params.new_client(with_downloader=True)
 
@@ -133,37 +170,113 @@ def get_cubes(connection_params: ConnectionParams, cube_params: entities.CubePar
         "transform": cube_params.transform
     }
 
-    results = {}
-    for i, (variable, instance) in enumerate(variables.items()):
-        # Load instance
-        vi = client.variable(variable).instance(instance)
-        cube_params.instance = vi
-
-        # Define callback function
+    def get(vi: entities.VariableInstance):
+        params = copy.copy(cube_params)
+        params.instance = vi
         image_cb = _partial_func(image_callback, instance=vi, variable=vi, **geo_params)
+        return _get_cube(client, params, image_cb, compression, verbose, dtype=dtype, mask_nodata=mask_nodata,
+                         callback_workers=callback_workers, callback_executor=callback_executor)
+
+    keys = [f"{variable}.{instance}" for variable, instance in variables.items()]
+    results = dict.fromkeys(keys)
+    with futures.ThreadPoolExecutor(max(max_concurrency, 1)) as executor:
+        # Load instances
+        instances = list(executor.map(lambda v: client.variable(v[0]).instance(v[1]), variables.items()))
+
+        # Get cubes and apply image_callback on each image
+        pending = {executor.submit(get, vi): (key, vi) for key, vi in zip(keys, instances)}
+        try:
+            for i, future in enumerate(futures.as_completed(pending)):
+                key, vi = pending[future]
+                cube, grouped_records = future.result()
+
+                # Apply cube_callback on the result
+                results[key] = _partial_func(cube_callback,
+                                             cube=cube,
+                                             timeseries=cube,
+                                             grouped_records=grouped_records,
+                                             variable=vi,
+                                             instance=vi,
+                                             **geo_params)()
+
+                # log progress
+                if mp_log_queue:
+                    mp_log_queue(sdk.MessageType.PROGRESS, (i + 1) / len(variables))
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    return results
+
+
+def reduce_cube(connection_params: ConnectionParams, cube_params: entities.CubeParams, reducers: Dict[str, Reducer],
+                image_callback: Optional[image_callback_t] = None, compression: int = 0,
+                mp_log_queue: sdk.message_queue_t = None) \
+        -> Tuple[Dict[str, ReducerResult], List[entities.GroupedRecords]]:
+    """
+    Computes temporal statistics of a cube without materialising it: each slice updates the reducers
+    (see sdk.reducers) as soon as it is received, then it is released.
+    The pixels equal to the no_data of the cube (and NaN) are not taken into account.
+
+    >>> results, _ = reduce_cube(connection_params, cube_params, {"stats": MeanVar(), "pct": Percentiles([50])})
+    >>> results["stats"]["mean"], results["pct"]["p50"]
 
-        # Get cube and apply image_callback on each image
-        cube, grouped_records = _get_cube(client, cube_params, image_cb, compression, verbose)
+    Args:
+        connection_params: to connect to the Geocube
+        cube_params: see geocube.Client.get_cube
+        reducers: dictionary of reducers (sdk.reducers.Reducer)
+        image_callback: (optional) a function called for each slice of the cube before the reducers. It receives
+            the slice as a np.ma.MaskedArray (no_data pixels are masked). The pixels that are masked or NaN in its
+            result are not taken into account. If it changes the shape of the slice, it must return a
+            np.ma.MaskedArray (or NaN) to keep the mask. The reducers are not given the data format of the cube
+            (see Reducer.start): e.g. the value_range of Percentiles must be defined.
+        compression: see geocube.Client.get_cube
+        mp_log_queue: a callable to receive logs and progress updates
+
+    Returns:
+        the dictionary of the results of the reducers and the list of the records of the slices
+    """
+    geo_params = {
+        "crs": cube_params.crs,
+        "projection": cube_params.crs,
+        "transform": cube_params.transform
+    }
+    image_cb = _partial_func(image_callback, **geo_params)
+    cube = connection_params.new_client(with_downloader=True).get_cube_it(cube_params, compression=compression)
+    for reducer in reducers.values():
+        # The data format of the cube does not describe the values transformed by image_callback
+        reducer.start(cube.dformat if image_cb is None else None)
 
-        # Apply cube_callback on the result
-        results[f"{variable}.{instance}"] = _partial_func(cube_callback,
-                                                          cube=cube,
-                                                          timeseries=cube,
-                                                          grouped_records=grouped_records,
-                                                          variable=vi,
-                                                          instance=vi,
-                                                          **geo_params)()
+    grouped_records_list = []
+    for image, metadata, err in cube:
+        if err is not None:
+            if err == cubeiterator.NOT_FOUND_ERROR:
+                continue
+            raise ValueError(err)
+        image = _masked_slice(image, cube.dformat.no_data)
+        result = image if image_cb is None else \
+            _partial_func(image_cb, image=image, grouped_records=metadata.grouped_records)()
+        valid = ~_result_mask(image, result)
+        result = np.asarray(np.ma.getdata(result))
+        if np.issubdtype(result.dtype, np.floating):
+            valid &= ~np.isnan(result)
+        for reducer in reducers.values():
+            reducer.update(result, valid, metadata.min_date)
+        grouped_records_list.append(metadata.grouped_records)
 
         # log progress
-        if mp_log_queue:
-            mp_log_queue(sdk.MessageType.PROGRESS, (i + 1) / len(variables))
+        if mp_log_queue is not None:
+            mp_log_queue(sdk.MessageType.PROGRESS, ((cube.index+1) / max(cube.count, 1)))
 
-    return results
+    return {name: reducer.result() for name, reducer in reducers.items()}, grouped_records_list
 
 
 def _get_cube(client: geocube.Client, cube_params: entities.CubeParams,
               callback: image_callback_t, compression: int = 0,
-              verbose: bool = False, mp_log_queue: sdk.message_queue_t = None)\
+              verbose: bool = False, mp_log_queue: sdk.message_queue_t = None,
+              dtype: Optional[str] = "float64", mask_nodata: bool = False,
+              callback_workers: int = 0, callback_executor: str = "thread")\
         -> Tuple[np.array, List[entities.GroupedRecords]]:
     def log(text):
         if mp_log_queue is not None:
@@ -173,6 +286,10 @@ def _get_cube(client: geocube.Client, cube_params: entities.CubeParams,
 
     start_time = time.time()
 
+    executor = None
+    if callback is not None and callback_workers > 0:
+        executor = _new_executor(callback_executor, callback_workers)
+
     # Get cube_iterator
     cube = client.get_cube_it(cube_params, compression=compression)
 
@@ -181,7 +298,38 @@ def _get_cube(client: geocube.Client, cube_params: entities.CubeParams,
     total_size = 0
 
     grouped_records_list = []
-    timeseries = np.empty((0,))
+    timeseries, mask = None, None
+    no_data = cube.dformat.no_data
+
+    def store(index: int, image: np.ndarray, result):
+        nonlocal timeseries, mask
+        data = np.ma.getdata(result)
+        if timeseries is None:
+            # cube.count can only decrease: it is an upper bound of the number of slices
+            timeseries = np.empty((cube.count, *data.shape), dtype=dtype or data.dtype)
+            if mask_nodata and not np.issubdtype(timeseries.dtype, np.floating):
+                mask = np.zeros(timeseries.shape, dtype=bool)
+        if data.shape != timeseries.shape[1:]:
+            raise ValueError(f"The slices must all have the same shape (expected {timeseries.shape[1:]}, "
+                             f"got {data.shape})")
+        timeseries[index] = data
+        if mask_nodata:
+            result_mask = _result_mask(image, result)
+            if mask is None:
+                timeseries[index][result_mask] = np.nan
+            else:
+                mask[index] = result_mask
+
+    pending: Dict[futures.Future, Tuple[int, np.ndarray]] = {}
+    errors: Dict[int, BaseException] = {}
+
+    def collect(done):
+        for future in done:
+            index, image = pending.pop(future)
+            try:
+                store(index, image, future.result())
+            except Exception as e:
+                errors[index] = e
 
     try:
         for image, metadata, err in cube:
@@ -190,15 +338,24 @@ def _get_cube(client: geocube.Client, cube_params: entities.CubeParams,
                     continue
                 raise ValueError(err)
             total_size += metadata.bytes//1024
-            if len(timeseries) == 0:
-                timeseries = np.empty((cube.count, *image.shape))
-            if callback is not None:
-                timeseries[cube.index] = _partial_func(callback,
-                                                       image=image,
-                                                       grouped_records=metadata.grouped_records)()
-            else:
-                timeseries[cube.index] = image
             grouped_records_list.append(metadata.grouped_records)
+            if mask_nodata:
+                image = _masked_slice(image, no_data)
+            if callback is None:
+                store(cube.index, image, image)
+            elif executor is None:
+                store(cube.index, image,
+                      _partial_func(callback, image=image, grouped_records=metadata.grouped_records)())
+            else:
+                # Keep receiving while the callbacks run, with a bounded number of slices in flight
+                if len(pending) >= 2 * callback_workers:
+                    collect(futures.wait(pending, return_when=futures.FIRST_COMPLETED).done)
+                pending[executor.submit(_partial_func(callback, image=image,
+                                                      grouped_records=metadata.grouped_records))] = (cube.index, image)
+        collect(futures.wait(pending).done)
+
+        if errors:
+            raise ImageCallbackError(errors) from next(iter(errors.values()))
 
         # log progress
         if mp_log_queue is not None:
@@ -208,12 +365,53 @@ def _get_cube(client: geocube.Client, cube_params: entities.CubeParams,
             log(f"Received and processed {len(cube)} images in {time.time()-start_time}s ({total_size//1024}Mb ~"
                 f"{(total_size/len(cube)) if len(cube) >0 else 0}kb.im)")
 
-        return np.resize(timeseries, (len(cube), *timeseries.shape[1:])), grouped_records_list
+        if timeseries is None:
+            return np.empty((0,), dtype=dtype or "float64"), grouped_records_list
+        # Views on the received slices (cube.count is decreased by the slices that cannot be retrieved)
+        if mask is not None:
+            return np.ma.MaskedArray(timeseries[:len(cube)], mask=mask[:len(cube)]), grouped_records_list
+        return timeseries[:len(cube)], grouped_records_list
 
     except GeocubeError:
         log(f'Fail to receive all the images ({time.time()-start_time}s)')
         raise
 
+    finally:
+        if executor is not None:
+            # Executor.shutdown(cancel_futures=True) requires python 3.9
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+
+def _new_executor(callback_executor: str, workers: int) -> futures.Executor:
+    if callback_executor == "thread":
+        return futures.ThreadPoolExecutor(workers)
+    if callback_executor == "process":
+        # The pool is started while gRPC streams are running: forking the process is not safe
+        return futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("forkserver"))
+    raise ValueError(f"callback_executor must be 'thread' or 'process' (got {callback_executor})")
+
+
+def _masked_slice(image: np.ndarray, no_data: float) -> np.ma.MaskedArray:
+    """ Returns the slice as a masked array, whose mask is the pixels equal to no_data (or NaN) """
+    if np.isnan(no_data):
+        return np.ma.masked_invalid(image, copy=False) if np.issubdtype(image.dtype, np.floating) \
+            else np.ma.MaskedArray(image, mask=np.zeros(image.shape, dtype=bool))
+    return np.ma.masked_equal(image, no_data, copy=False)
+
+
+def _result_mask(image: np.ma.MaskedArray, result) -> np.ndarray:
+    """
+    Returns the mask of the result of image_callback on the masked slice: its own mask if it is a masked array,
+    the mask of the slice if it has the same shape, otherwise nothing is masked
+    """
+    if isinstance(result, np.ma.MaskedArray):
+        return np.ma.getmaskarray(result)
+    if np.shape(result) == image.shape:
+        return np.ma.getmaskarray(image)
+    return np.zeros(np.shape(result), dtype=bool)
+
 
 def _partial_func(callback_func, **optional_parameters):
     if callback_func is None:
@@ -4,7 +4,7 @@ import warnings
 from dataclasses import dataclass, asdict
 from typing import Union
 
-from geocube import Client, Downloader
+from geocube import Client, Downloader, DownloaderPool
 
 
 @dataclass
@@ -17,6 +17,8 @@ class ConnectionParams:
     >>> cp = ConnectionParams("geocube-server.com", True, "[API_KEY]", downloader=ConnectionParams("127.0.0.1:8080"))
     >>> distant_client = cp.new_client()
     >>> local_downloader  = cp.new_downloader()
+    >>> cp = ConnectionParams("127.0.0.1:8080", downloader="downloader-0:8080,downloader-1:8080")
+    >>> pooled_downloader = cp.new_downloader()
     >>> import pickle
     >>> does_not_raise_error = pickle.loads(pickle.dumps(cp))
     """
@@ -50,10 +52,17 @@ class ConnectionParams:
         self.downloader = params
 
     def new_downloader(self) -> Union[Downloader, None]:
-        """ Create a new downloader connected to the uri, using the ConnectionParams `self.downloader` """
-        if self.downloader is not None:
-            return Downloader(**self.downloader.__as_dict())
-        return None
+        """
+        Create a new downloader connected to the uri, using the ConnectionParams `self.downloader`
+        If the uri is a comma-separated list of uris, returns a DownloaderPool of all the replicas.
+        """
+        if self.downloader is None:
+            return None
+        params = self.downloader.__as_dict()
+        uris = params.pop("uri").split(",")
+        if len(uris) > 1:
+            return DownloaderPool(uris, **params)
+        return Downloader(uris[0], **params)
 
     def __as_dict(self):
         d = asdict(self)
@@ -42,6 +42,13 @@ class Status(Enum):
 
 logger = logging.getLogger("geocube_multiprocess")
 
+# join() waits for status messages at most _MAX_WAIT_SEC before reading the log queue and printing the status
+_MAX_WAIT_SEC = 1
+_STATUS_EVERY_SEC = 100
+_FULL_STATUS_EVERY_SEC = 1800
+# A pending process is considered stuck _TIMEOUT_GRACE_SEC after timeout_sec
+_TIMEOUT_GRACE_SEC = 100
+
 """ message_queue_t can be used for logging or for progress updating in an asynchronous function """
 message_queue_t = Optional[Callable[[MessageType, Any], None]]
 
@@ -246,6 +253,7 @@ class MultiProcesses:
 
         # Configuration
         self.timeout_sec = timeout_sec
+        self._next_timeout_scan = now()
         self.checkpoint_dir = checkpoint_dir
         if checkpoint_dir:
             os.makedirs(checkpoint_dir, exist_ok=True)
@@ -278,16 +286,29 @@ class MultiProcesses:
     def count_active(self) -> int:
         return len([0 for p in self.processes.values() if p.status not in (Status.FAILED, Status.DONE)])
 
-    def update(self):
-        sleep_sec = 1  # timeout_sec/10 if timeout_sec and timeout_sec < 10 else 1
+    def update(self, timeout: float = 0) -> bool:
+        """
+        Updates the status of the processes with the messages of the queues, fails the stuck processes and restarts
+        the processes to retry.
+
+        Args:
+            timeout: time to wait for a status message (a process started or ended), if there is none yet
+
+        Returns:
+            True if the status of a process changed
+        """
         checkpoint, print_status = False, False
+        retry = {}
         # Scan state_queue
-        for message in _QueueIterator(self.state_queue):
+        for message in _QueueIterator(self.state_queue, timeout=timeout):
             if message.type == MessageType.STATUS:
+                process = self.processes[message.id]
                 try:
-                    self.processes[message.id].update_status(message.value, message.date, message.args)
+                    process.update_status(message.value, message.date, message.args)
                 except ValueError as e:
                     logger.error(e)
+                if process.status == Status.RETRY:
+                    retry[process.id] = process
                 checkpoint = True
                 print_status = True
 
@@ -299,20 +320,25 @@ class MultiProcesses:
             elif message.type == MessageType.LOG:
                 logger.info(f'{message.date}: [{message.id}] {message.value}')
 
-        # Scan timeout
-        if self.timeout_sec is not None:
+        # Scan timeout (only when a pending process may have reached its deadline)
+        if self.timeout_sec is not None and now() >= self._next_timeout_scan:
+            max_duration = timedelta(seconds=self.timeout_sec + _TIMEOUT_GRACE_SEC)
+            self._next_timeout_scan = now() + max_duration
             for process in self.processes.values():
-                if process.status == Status.PENDING and \
-                        elapsed(process.start_time) > timedelta(seconds=self.timeout_sec + 100 * sleep_sec):
-                    print_status = True
-                    logger.error(f"[{process.id}] Timeout error !! Process looks stuck ({process.start_time})")
-                    try:
-                        process.update_status(Status.FAILED, now(), ProcessTimeoutError("Unrecoverable timeout"))
-                    except ValueError as e:
-                        logger.error(e)
+                if process.status != Status.PENDING:
+                    continue
+                if elapsed(process.start_time) <= max_duration:
+                    self._next_timeout_scan = min(self._next_timeout_scan, process.start_time + max_duration)
+                    continue
+                print_status = True
+                logger.error(f"[{process.id}] Timeout error !! Process looks stuck ({process.start_time})")
+                try:
+                    process.update_status(Status.FAILED, now(), ProcessTimeoutError("Unrecoverable timeout"))
+                except ValueError as e:
+                    logger.error(e)
 
         # Retry
-        for process in self.processes.values():
+        for process in retry.values():
             if process.status == Status.RETRY:
                 process.start(self.client, self.timeout_sec)
                 logger.info(f"[{process.id}] will restart later")
@@ -332,25 +358,29 @@ class MultiProcesses:
                 logger.error(e)
 
     def join(self):
-        sleep_sec = 1  # timeout_sec/10 if timeout_sec and timeout_sec < 10 else 1
-        c_full_status = c_status = -1
+        """
+        Waits for the end of all the processes. The status is updated as soon as a process starts or ends.
+        A short status is printed at most every 100 seconds (if a status changed) and a full status every 30 minutes.
+        """
         old_progress = 0
+        last_status = next_full_status = time.monotonic()
+        next_status = None
         try:
             while self.count_active() > 0:
-                print_status = self.update()
+                print_status = self.update(timeout=_MAX_WAIT_SEC)
 
-                # Sleep and print status on demand
-                time.sleep(sleep_sec)
-                c_full_status = c_full_status + 1
-                if c_full_status % 1800 == 0:  # Full report every 30 minutes
+                # Print status on demand
+                t = time.monotonic()
+                if t >= next_full_status:
                     self.print_full_status()
+                    next_full_status = t + _FULL_STATUS_EVERY_SEC
 
-                if print_status and c_status < 0:
-                    c_status = max((100+c_status, 1))
+                if print_status and next_status is None:
+                    next_status = max(last_status + _STATUS_EVERY_SEC, t)
 
-                c_status -= 1
-                if c_status == 0:
+                if next_status is not None and t >= next_status:
                     self.print_status()
+                    last_status, next_status = t, None
 
                 progress = int(self.get_progress()*100)
                 if progress > old_progress:
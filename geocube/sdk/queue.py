@@ -1,3 +1,4 @@
+import asyncio
 import multiprocessing as mp
 import pickle
 import queue
@@ -10,10 +11,16 @@ class DaskQueue(distributed.Queue):
     def put(self, o: object, **kwargs):
         return super(DaskQueue, self).put(pickle.dumps(o), **kwargs)
 
-    def get(self, **kwargs):
-        if self.qsize() == 0:
+    def get(self, block: bool = True, timeout: float = None, **kwargs):
+        """ Same interface as queue.Queue.get: raises queue.Empty if no item is available (after timeout) """
+        if not block:
+            if self.qsize() == 0:
+                raise queue.Empty
+            timeout = None
+        try:
+            return pickle.loads(super(DaskQueue, self).get(timeout=timeout, **kwargs))
+        except (TimeoutError, asyncio.TimeoutError):
             raise queue.Empty
-        return pickle.loads(super(DaskQueue, self).get(**kwargs))
 
     def __len__(self):
         return self.qsize()
@@ -27,10 +34,14 @@ class DaskQueue(distributed.Queue):
 
 
 class _QueueIterator:
-    def __init__(self, q: Union[DaskQueue, mp.Queue], timeout=None):
+    """
+    Iterates over the items of the queue until it is empty.
+    If timeout is not None, waits up to timeout seconds for the first item, then the following items are only
+    returned if they are already available.
+    """
+    def __init__(self, q: Union[DaskQueue, mp.Queue], timeout: float = None):
         self.queue = q
         self.timeout = timeout
-        self.kwargs = {} if isinstance(self.queue, DaskQueue) else {"block": False}
 
     def __iter__(self):
         return self
@@ -40,7 +51,11 @@ class _QueueIterator:
 
     def __next__(self):
         try:
-            item = self.queue.get(timeout=self.timeout, **self.kwargs)
+            if self.timeout is not None and self.timeout > 0:
+                item = self.queue.get(block=True, timeout=self.timeout)
+            else:
+                item = self.queue.get(block=False)
+            self.timeout = None
             self.queue.task_done()
             return item
         except queue.Empty:
@@ -0,0 +1,170 @@
+from datetime import datetime
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from geocube import entities
+
+ReducerResult = Union[np.ndarray, Dict[str, np.ndarray]]
+
+
+class Reducer:
+    """
+    Temporal statistic of a cube, updated pixel by pixel with each slice as soon as it is received
+    (see sdk.reduce_cube). The memory only depends on the shape of a slice, not on the number of slices.
+
+    Subclasses implement update() and result(), and may implement start().
+    """
+    def start(self, dformat: Optional[entities.DataFormat]):
+        """
+        Called before the first slice, with the data format of the cube
+        (None if the slices are transformed by an image_callback)
+        """
+
+    def update(self, image: np.ndarray, valid: np.ndarray, date: datetime):
+        """
+        Args:
+            image: slice of the cube (height, width, bands)
+            valid: boolean mask of the pixels of image that are valid (not no_data)
+            date: of the slice
+        """
+        raise NotImplementedError
+
+    def result(self) -> ReducerResult:
+        raise NotImplementedError
+
+
+class Count(Reducer):
+    """ Number of valid values of each pixel """
+    def __init__(self):
+        self.count = None
+
+    def update(self, image: np.ndarray, valid: np.ndarray, date: datetime):
+        if self.count is None:
+            self.count = np.zeros(image.shape, dtype=np.uint32)
+        self.count += valid
+
+    def result(self) -> np.ndarray:
+        return self.count
+
+
+class MeanVar(Reducer):
+    """
+    Mean and variance of the valid values of each pixel (Welford's online algorithm)
+
+    Result: {"count", "mean", "var"} (NaN where there is no valid value, or not enough for the variance)
+    """
+    def __init__(self, ddof: int = 0):
+        """
+        Args:
+            ddof: delta degrees of freedom of the variance (0: population variance, 1: sample variance)
+        """
+        self.ddof = ddof
+        self.count, self.mean, self.m2 = None, None, None
+
+    def update(self, image: np.ndarray, valid: np.ndarray, date: datetime):
+        if self.count is None:
+            self.count = np.zeros(image.shape, dtype=np.uint32)
+            self.mean = np.zeros(image.shape)
+            self.m2 = np.zeros(image.shape)
+        self.count += valid
+        delta = np.subtract(image, self.mean, where=valid, out=np.zeros(image.shape))
+        self.mean += np.divide(delta, self.count, where=valid, out=np.zeros(image.shape))
+        self.m2 += np.multiply(delta, np.subtract(image, self.mean, where=valid, out=np.zeros(image.shape)))
+
+    def result(self) -> Dict[str, np.ndarray]:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {"count": self.count,
+                    "mean": np.where(self.count > 0, self.mean, np.nan),
+                    "var": np.where(self.count > self.ddof, self.m2 / (self.count.astype(float) - self.ddof), np.nan)}
+
+
+class MinMax(Reducer):
+    """
+    Minimum and maximum of the valid values of each pixel and the dates they were reached (the first date if the
+    extremum is reached several times)
+
+    Result: {"min", "max", "argmin_date", "argmax_date"} (NaN and NaT where there is no valid value)
+    """
+    def __init__(self):
+        self.min, self.max, self.argmin_date, self.argmax_date = None, None, None, None
+
+    def update(self, image: np.ndarray, valid: np.ndarray, date: datetime):
+        if self.min is None:
+            self.min = np.full(image.shape, np.inf)
+            self.max = np.full(image.shape, -np.inf)
+            self.argmin_date = np.full(image.shape, np.datetime64("NaT"), dtype="datetime64[us]")
+            self.argmax_date = np.full(image.shape, np.datetime64("NaT"), dtype="datetime64[us]")
+        date = np.datetime64(date, "us")
+        for extremum, argdate, better in [(self.min, self.argmin_date, np.less),
+                                          (self.max, self.argmax_date, np.greater)]:
+            update = better(image, extremum, where=valid, out=np.zeros(image.shape, dtype=bool))
+            extremum[update] = image[update]
+            argdate[update] = date
+
+    def result(self) -> Dict[str, np.ndarray]:
+        found = ~np.isnat(self.argmin_date)
+        return {"min": np.where(found, self.min, np.nan), "max": np.where(found, self.max, np.nan),
+                "argmin_date": self.argmin_date, "argmax_date": self.argmax_date}
+
+
+class Percentiles(Reducer):
+    """
+    Approximate percentiles of the valid values of each pixel, using a histogram per pixel: the precision is
+    the width of a bin ((max - min) / bins). The values out of the range are counted in the first or last bin.
+    The histograms take height * width * bands * bins * 2 bytes (4 bytes beyond 65535 slices).
+
+    Result: {"p<q>": percentile q} for each q (NaN where there is no valid value)
+    """
+    def __init__(self, q: Sequence[float] = (10, 50, 90), bins: int = 100,
+                 value_range: Optional[Tuple[float, float]] = None):
+        """
+        Args:
+            q: percentiles to compute (between 0 and 100)
+            bins: number of bins of the histograms
+            value_range: (min, max) of the values (by default, the min and max values of the dformat of the cube,
+                it is required if the values are transformed by an image_callback)
+        """
+        self.q = q
+        self.bins = bins
+        self.value_range = value_range
+        self.hist = None
+        self._updates = 0
+
+    def start(self, dformat: Optional[entities.DataFormat]):
+        if self.value_range is None:
+            if dformat is None:
+                raise ValueError("Percentiles: value_range must be defined if the values are transformed "
+                                 "(e.g. by an image_callback)")
+            self.value_range = (dformat.min_value, dformat.max_value)
+
+    def update(self, image: np.ndarray, valid: np.ndarray, date: datetime):
+        if self.value_range is None:
+            raise ValueError("Percentiles: value_range is not defined")
+        if self.hist is None:
+            self.hist = np.zeros((*image.shape, self.bins), dtype=np.uint16)
+        if self._updates == np.iinfo(self.hist.dtype).max:
+            self.hist = self.hist.astype(np.uint32)
+        self._updates += 1
+        lo, hi = self.value_range
+        index = np.floor((image[valid] - lo) * (self.bins / (hi - lo)))
+        index = np.clip(index, 0, self.bins - 1).astype(np.intp)
+        # Each pixel is updated once: the indices are unique
+        self.hist.reshape((-1, self.bins))[np.flatnonzero(valid), index] += 1
+
+    def result(self) -> Dict[str, np.ndarray]:
+        lo, hi = self.value_range
+        width = (hi - lo) / self.bins
+        cdf = np.cumsum(self.hist, axis=-1, dtype=np.uint32)
+        count = cdf[..., -1]
+        result = {}
+        for q in self.q:
+            rank = np.maximum(np.ceil(q / 100 * count), 1)
+            b = np.minimum((cdf < rank[..., None]).sum(axis=-1), self.bins - 1)
+            in_bin = np.take_along_axis(self.hist, b[..., None], axis=-1)[..., 0]
+            before = np.take_along_axis(cdf, b[..., None], axis=-1)[..., 0] - in_bin
+            with np.errstate(invalid="ignore", divide="ignore"):
+                # Linear interpolation inside the bin
+                value = lo + width * (b + (rank - before - 0.5) / in_bin)
+            result[f"p{q:g}"] = np.where(count > 0, value, np.nan)
+        return result
@@ -0,0 +1,208 @@
+import collections
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from concurrent import futures
+from http import server as http_server
+from typing import Dict, List, Tuple, Union
+from urllib import parse as urlparse
+
+from geocube import utils
+from geocube.sdk.connection_params import ConnectionParams
+
+logger = logging.getLogger("geocube.tile_server")
+
+
+class _LRUCache:
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class TileServer:
+    """
+    Lightweight HTTP server of web-mercator XYZ tiles rendered by the Geocube (see Client.get_xyz_tile).
+    - GET /{instance_id}/{z}/{x}/{y}.png?records=id1,id2 returns a PNG tile
+    - GET /metrics returns the metrics of the server (hits, misses...) in json
+
+    The tiles are fetched with a pool of clients and kept in an in-memory LRU cache and, optionally,
+    in an on-disk MBTiles cache. Concurrent requests of the same tile are collapsed into one request to the Geocube.
+    >>> with TileServer(ConnectionParams("127.0.0.1:8080"), port=8000, cache="tiles.mbtiles") as tile_server:
+    ...     print(tile_server.url)  # http://127.0.0.1:8000/{instance_id}/{z}/{x}/{y}.png?records={record_ids}
+    ...     tile_server.serve_forever()
+    """
+    def __init__(self, connection_params: ConnectionParams, host: str = "127.0.0.1", port: int = 0,
+                 pool_size: int = 4, memory_cache_size: int = 4096,
+                 cache: Union[str, utils.MBTilesCache, None] = None):
+        """
+        Args:
+            connection_params: to connect to the Geocube
+            host: address of the HTTP server
+            port: port of the HTTP server (0 to choose a free port)
+            pool_size: number of clients (thus, channels) used to fetch the tiles
+            memory_cache_size: maximum number of tiles kept in memory
+            cache: (optional) on-disk cache of tiles (path or MBTilesCache)
+        """
+        self._clients = [connection_params.new_client(with_downloader=False) for _ in range(max(pool_size, 1))]
+        self._next_client = itertools.cycle(self._clients)
+        self._memory_cache = _LRUCache(memory_cache_size)
+        self._own_cache = isinstance(cache, str)
+        self._cache = utils.MBTilesCache(cache) if isinstance(cache, str) else cache
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple, futures.Future] = {}
+        self._metrics = collections.Counter()
+        self._fetch_time = 0.
+        self._httpd = http_server.ThreadingHTTPServer((host, port), _handler(self))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/{{instance_id}}/{{z}}/{{x}}/{{y}}.png?records={{record_ids}}"
+
+    def get_tile(self, instance_id: str, record_ids: List[str], x: int, y: int, z: int) -> bytes:
+        """ Returns the PNG tile from the caches or from the Geocube """
+        layer = utils.xyz_layer(instance_id, record_ids)
+        key = (layer, x, y, z)
+        self._count("requests")
+        data = self._memory_cache.get(key)
+        if data is not None:
+            self._count("memory_hits")
+            return data
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = futures.Future()
+        if not owner:
+            self._count("collapsed")
+            return future.result()
+
+        try:
+            data = self._cache.get(layer, x, y, z) if self._cache is not None else None
+            if data is not None:
+                self._count("disk_hits")
+            else:
+                self._count("misses")
+                start = time.time()
+                data = self._fetch(instance_id, record_ids, x, y, z)
+                with self._lock:
+                    self._fetch_time += time.time() - start
+                if self._cache is not None:
+                    self._cache.put(layer, x, y, z, data)
+            self._memory_cache.put(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            self._count("errors")
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def metrics(self) -> Dict[str, Union[int, float]]:
+        with self._lock:
+            m = {k: self._metrics[k] for k in ("requests", "memory_hits", "disk_hits", "misses", "collapsed", "errors")}
+            m["mean_fetch_time"] = self._fetch_time / m["misses"] if m["misses"] else 0.
+        m["memory_cache_size"] = len(self._memory_cache)
+        return m
+
+    def start(self):
+        """ Start serving in a background thread """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """ Serve in the current thread (blocking) """
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._own_cache:
+            self._cache.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def _fetch(self, instance_id: str, record_ids: List[str], x: int, y: int, z: int) -> bytes:
+        with self._lock:
+            client = next(self._next_client)
+        return client.get_xyz_tile(instance_id, record_ids, x, y, z)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._metrics[name] += 1
+
+
+_tile_path = re.compile(r"^/(?P<instance>[^/]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$")
+
+
+def _handler(tile_server: TileServer):
+    class TileRequestHandler(http_server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse.urlparse(self.path)
+            if url.path == "/metrics":
+                return self._reply(200, "application/json", json.dumps(tile_server.metrics()).encode())
+            m = _tile_path.match(url.path)
+            if m is None:
+                return self._reply(404, "text/plain", b"Not found: expecting /{instance_id}/{z}/{x}/{y}.png")
+            records = urlparse.parse_qs(url.query).get("records", [""])[0]
+            record_ids = [r for r in records.split(",") if r != ""]
+            try:
+                data = tile_server.get_tile(m["instance"], record_ids, int(m["x"]), int(m["y"]), int(m["z"]))
+            except utils.GeocubeError as e:
+                status = 404 if e.is_not_found() else 400 if e.is_not_valid() else 502
+                return self._reply(status, "text/plain", str(e).encode())
+            except Exception as e:
+                logger.exception(f"Unable to serve {self.path}")
+                return self._reply(500, "text/plain", f"Internal error: {e}".encode())
+            self._reply(200, "image/png", data)
+
+        def _reply(self, status: int, content_type: str, data: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *_):
+            pass
+
+    return TileRequestHandler
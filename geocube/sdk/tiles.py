@@ -0,0 +1,215 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent import futures
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from shapely import geometry
+
+import geocube
+from geocube import entities, sdk
+from geocube.sdk import ConnectionParams
+from geocube.sdk.catalogue import image_callback_t, cube_callback_t, cube_do_nothing, _get_cube, _partial_func
+from geocube.sdk.multiprocess import Status
+
+_clients: Dict[Tuple[int, str], geocube.Client] = {}
+_clients_lock = threading.Lock()
+
+
+def map_tiles(connection_params: ConnectionParams, aoi: Union[geometry.Polygon, geometry.MultiPolygon,
+                                                              entities.TileSet, List[entities.Tile]],
+              collection: sdk.Collection, cube_callback: cube_callback_t = cube_do_nothing,
+              image_callback: Optional[image_callback_t] = None, *,
+              layout: Union[str, entities.Layout, None] = None, resolution: Optional[float] = None,
+              crs: Optional[str] = None, shape: Optional[Tuple[int, int]] = None,
+              executor: Union[str, futures.Executor] = "thread", max_workers: int = 4,
+              checkpoint: Optional[str] = None, **get_cube_kwargs) -> Dict[str, Tuple[str, Any]]:
+    """
+    Runs a get_cube on each tile of an AOI, for each instance of the collection, and calls cube_callback on each cube
+    (e.g. to write the outputs). The tiles are processed concurrently and each worker reuses the same connection.
+
+    >>> def write_mean(timeseries, transform, crs, tile_id):
+    ...     utils.image_to_geotiff(np.nanmean(timeseries, axis=0), transform, crs, np.nan, f"{tile_id}.tif")
+    ...     return f"{tile_id}.tif"
+    >>> results = map_tiles(connection_params, aoi, sdk.Collection(instances=[instance], tags={"constellation": "S2"}),
+    ...                     write_mean, layout="S2-UTM", executor="process", checkpoint="job.jsonl")
+
+    Args:
+        connection_params: to connect to the Geocube
+        aoi: in geographic coordinates, tiled with layout or resolution/crs/shape (see Client.tile_aoi),
+            or the tiles themselves (TileSet or list of entities.Tile)
+        collection: instances, records, tags and from_time/to_time of the cubes
+        cube_callback: called with each cube (see sdk.get_cube). In addition to the standard parameters,
+            it can take `tile` and `tile_id`. Its result must be pickleable (and json-serializable to be
+            checkpointed, otherwise a TypeError is raised).
+        image_callback: (optional) called with each slice (see sdk.get_cube), that can also take `tile`
+        layout: name of a layout or layout to tile the AOI
+        resolution, crs, shape: to tile the AOI (if layout is not defined)
+        executor: "thread", "process" or an executor (concurrent.futures.Executor or pebble.ProcessPool)
+        max_workers: number of tiles processed concurrently (if executor is "thread" or "process", otherwise the
+            number of workers of the executor is used)
+        checkpoint: (optional) jsonl file where the completed tiles are recorded. If it exists, the tiles that
+            are already recorded are not processed again (their results are read from the file).
+            The file starts with a fingerprint of the job (instances, records, filters and callbacks): a ValueError
+            is raised if it was written by another job.
+        get_cube_kwargs: other arguments of sdk.get_cube (compression, dtype, mask_nodata, callback_workers...)
+
+    Returns:
+        a dictionary {tile_id: (status, result)} where status is "DONE" or "FAILED" and result is the result of
+        cube_callback ({instance_id: result} if the collection has several instances) or the error
+    """
+    client = connection_params.new_client(with_downloader=False)
+    if isinstance(aoi, (geometry.Polygon, geometry.MultiPolygon)):
+        tiles = client.tile_aoi(aoi, layout_name=layout if isinstance(layout, str) else None,
+                                layout=layout if isinstance(layout, entities.Layout) else None,
+                                resolution=resolution, crs=crs, shape=shape)
+    else:
+        tiles = aoi
+    tiles = {tile_id(tile): tile for tile in tiles}
+    if not tiles:
+        return {}
+
+    # Serialize the requests once: the tasks only change the tile (see entities.CubeTemplate)
+    first = next(iter(tiles.values()))
+    templates = {entities.get_id(vi): (vi, entities.CubeTemplate(entities.CubeParams.from_tile(
+        first, vi, records=collection.records, tags=collection.tags,
+        from_time=collection.from_time, to_time=collection.to_time))) for vi in collection.variables(client)}
+
+    results = _read_checkpoint(checkpoint, _job_fingerprint(templates, image_callback, cube_callback)) \
+        if checkpoint else {}
+    todo = [_id for _id in tiles if _id not in results]
+    if not todo:
+        return {_id: results[_id] for _id in tiles}
+
+    own_executor = isinstance(executor, str)
+    if executor == "thread":
+        executor = futures.ThreadPoolExecutor(max_workers)
+    elif executor == "process":
+        executor = futures.ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("forkserver"))
+    elif own_executor:
+        raise ValueError(f"executor must be 'thread', 'process' or an executor (got {executor})")
+
+    max_in_flight = 2 * _executor_workers(executor, max_workers)
+    pending: Dict[futures.Future, str] = {}
+    todo = iter(todo)
+    try:
+        while True:
+            # Bounded number of tiles in flight
+            for _id in todo:
+                args = (connection_params, templates, tiles[_id], _id, image_callback, cube_callback,
+                        get_cube_kwargs)
+                pending[executor.schedule(_process_tile, args) if hasattr(executor, "schedule")
+                        else executor.submit(_process_tile, *args)] = _id
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            for future in futures.wait(pending, return_when=futures.FIRST_COMPLETED).done:
+                _id = pending.pop(future)
+                try:
+                    results[_id] = (Status.DONE.name, future.result())
+                except Exception as e:
+                    results[_id] = (Status.FAILED.name, e)
+                    continue
+                if checkpoint:
+                    _write_checkpoint(checkpoint, _id, results[_id][1])
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+    return {_id: results[_id] for _id in tiles}
+
+
+def tile_id(tile: entities.Tile) -> str:
+    """ Identifier of a tile, stable across runs: crs, origin, resolution and shape """
+    t = tile.transform
+    return f"{entities.tile.crs_to_str(tile.crs)}_{t.c:.10g}_{t.f:.10g}_{t.a:.10g}_{t.e:.10g}_" \
+           f"{tile.shape[0]}x{tile.shape[1]}"
+
+
+def _executor_workers(executor, default: int) -> int:
+    """ Number of workers of an executor (concurrent.futures or pebble), default if it is unknown """
+    workers = getattr(executor, "_max_workers", None)
+    if workers is None:
+        workers = getattr(getattr(executor, "_context", None), "workers", None)
+    return workers if isinstance(workers, int) and workers > 0 else default
+
+
+def _process_tile(connection_params: ConnectionParams,
+                  templates: Dict[str, Tuple[entities.VariableInstance, entities.CubeTemplate]],
+                  tile: entities.Tile, _id: str, image_callback: Optional[image_callback_t],
+                  cube_callback: cube_callback_t, get_cube_kwargs: Dict[str, Any]):
+    client = _client(connection_params)
+    geo_params = {"crs": tile.crs, "projection": tile.crs, "transform": tile.transform}
+    results = {}
+    for instance_id, (vi, template) in templates.items():
+        image_cb = _partial_func(image_callback, tile=tile, instance=vi, variable=vi, **geo_params)
+        cube, grouped_records = _get_cube(client, template.on(tile), image_cb, **get_cube_kwargs)
+        results[instance_id] = _partial_func(cube_callback, cube=cube, timeseries=cube,
+                                             grouped_records=grouped_records, tile=tile, tile_id=_id,
+                                             instance=vi, variable=vi, **geo_params)()
+    return next(iter(results.values())) if len(results) == 1 else results
+
+
+def _client(connection_params: ConnectionParams) -> geocube.Client:
+    """ Returns the client of this process connected with connection_params (created on the first call) """
+    key = (os.getpid(), repr(connection_params))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = connection_params.new_client(with_downloader=True)
+        return _clients[key]
+
+
+def _job_fingerprint(templates: Dict[str, Tuple[entities.VariableInstance, entities.CubeTemplate]],
+                     image_callback: Optional[image_callback_t], cube_callback: cube_callback_t) -> str:
+    """ Fingerprint of the instances, records, filters and callbacks of a job (the tiles are not included) """
+    h = hashlib.sha256()
+    for instance_id, (_, template) in sorted(templates.items()):
+        params = template.cube_params()
+        records = params.records_pb()
+        h.update(json.dumps([instance_id, sorted((params.tags or {}).items()), str(params.from_time),
+                             str(params.to_time)]).encode())
+        h.update(records.SerializeToString() if records is not None else b"")
+    for callback in (image_callback, cube_callback):
+        h.update(f"{getattr(callback, '__module__', '')}.{getattr(callback, '__qualname__', repr(callback))};".encode())
+    return h.hexdigest()
+
+
+def _read_checkpoint(checkpoint: str, fingerprint: str) -> Dict[str, Tuple[str, Any]]:
+    """ Returns the results recorded in the checkpoint (created with the fingerprint of the job if necessary) """
+    results = {}
+    if not os.path.exists(checkpoint) or os.path.getsize(checkpoint) == 0:
+        with open(checkpoint, "w") as f:
+            f.write(json.dumps({"job": fingerprint}) + "\n")
+        return results
+    with open(checkpoint) as f:
+        try:
+            header = json.loads(f.readline())
+        except json.JSONDecodeError:
+            header = None
+        if not isinstance(header, dict) or header.get("job") != fingerprint:
+            raise ValueError(f"map_tiles: the checkpoint {checkpoint} was written by another job (different "
+                             f"instances, records, filters or callbacks). Remove it or use another file.")
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Incomplete line written during a crash
+            results[record["tile"]] = (Status.DONE.name, record["result"])
+    return results
+
+
+def _write_checkpoint(checkpoint: str, _id: str, result: Any):
+    try:
+        line = json.dumps({"tile": _id, "result": result})
+    except (TypeError, ValueError) as e:
+        raise TypeError(f"map_tiles: the result of the tile {_id} cannot be checkpointed "
+                        f"(it must be json-serializable): {e}") from e
+    with open(checkpoint, "a") as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
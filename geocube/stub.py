@@ -1,18 +1,479 @@
-import functools
-from typing import Union
+import bisect
+import dataclasses
+import queue
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
 
+import grpc
+
+from geocube.limiter import ConcurrencyLimiter, UNARY, STREAM
 from geocube.pb import geocube_pb2_grpc as geocube_grpc, admin_pb2_grpc
 
+RETRYABLE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.RESOURCE_EXHAUSTED)
+
+# RPCs without side effects, that can safely be retried or hedged
+IDEMPOTENT_READS = ("GetVariable", "GetRecords", "GetAOI")
+
+
+@dataclasses.dataclass
+class CallConfig:
+    """
+    Configuration of the calls to an RPC
+
+    Attributes:
+        timeout: deadline of the call in seconds, including the retries (None: use the default timeout of the Stub)
+        retries: maximum number of retries on RETRYABLE_CODES.
+            Streams are only retried if the error occurs before the first response.
+        backoff: initial delay between two retries (the delay is doubled after each retry and jittered)
+        max_backoff: maximum delay between two retries
+        hedge_after: if the call has not returned after hedge_after seconds (for server streams: if the first
+            response has not been received), send a second identical request and keep the first to respond.
+            None to disable hedging. Only use it for idempotent RPCs. The second request takes its own permit
+            of the limiter: it is not sent if none is available. Client-streaming RPCs cannot be hedged.
+    """
+    timeout: Optional[float] = None
+    retries: int = 0
+    backoff: float = 0.1
+    max_backoff: float = 5.
+    hedge_after: Optional[float] = None
+
+
+def default_configs() -> Dict[str, CallConfig]:
+    return {method: CallConfig(retries=3) for method in IDEMPOTENT_READS}
+
+
+class Histogram:
+    """ Histogram with exponential buckets (upper bounds) """
+    def __init__(self, first: float, factor: float = 2, n: int = 24):
+        self.bounds = [first * factor ** i for i in range(n)]
+        self.counts = [0] * (n + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """ Returns the upper bound of the bucket containing the q-quantile """
+        target, cumul = q * self.count, 0
+        for i, count in enumerate(self.counts):
+            cumul += count
+            if count and cumul >= target:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return 0.
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else 0.,
+                "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99)}
+
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "errors": 0, "retries": 0, "hedged": 0}
+        self.latency = Histogram(0.001)
+        self.request_bytes = Histogram(64, 4, 16)
+        self.response_bytes = Histogram(64, 4, 16)
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def observe(self, latency: float, request_bytes: int, response_bytes: int, error: bool):
+        with self.lock:
+            self.counters["calls"] += 1
+            self.counters["errors"] += error
+            self.latency.observe(latency)
+            self.request_bytes.observe(request_bytes)
+            self.response_bytes.observe(response_bytes)
+
+    def to_dict(self):
+        with self.lock:
+            return {**self.counters, "latency": self.latency.to_dict(),
+                    "request_bytes": self.request_bytes.to_dict(), "response_bytes": self.response_bytes.to_dict()}
+
+
+def _byte_size(message) -> int:
+    return message.ByteSize() if hasattr(message, "ByteSize") else len(message) if isinstance(message, bytes) else 0
+
+
+def _is_retryable(e: Exception) -> bool:
+    return isinstance(e, grpc.RpcError) and callable(getattr(e, "code", None)) and e.code() in RETRYABLE_CODES
+
+
+class _WaitTimeout(grpc.RpcError, grpc.Call):
+    """ Raised when the deadline expires while the call is waiting for a permit of the limiter """
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+    def details(self):
+        return "Deadline exceeded while waiting for a permit of the concurrency limiter"
+
+    def initial_metadata(self):
+        return None
+
+    def trailing_metadata(self):
+        return None
+
+    def is_active(self):
+        return False
+
+    def time_remaining(self):
+        return 0
+
+    def cancel(self):
+        return False
+
+    def add_callback(self, callback):
+        return False
+
+
+class _Call:
+    """ Stages applied to a call: concurrency limit, deadline, retries with jittered backoff, hedging and metrics """
+    def __init__(self, method: str, call, config: CallConfig, metrics: _Metrics,
+                 limiter: Optional[ConcurrencyLimiter] = None):
+        self.method = method
+        self.call = call
+        self.config = config
+        self.metrics = metrics
+        self.limiter = limiter
+
+    def acquire(self, kind: str, deadline: Optional[float]):
+        if self.limiter is not None and not self.limiter.acquire(kind, self.remaining(deadline)):
+            raise _WaitTimeout()
+
+    def try_acquire(self, kind: str) -> bool:
+        """ Take a permit if one is available immediately (e.g. for a hedged request) """
+        return self.limiter is None or self.limiter.acquire(kind, 0)
+
+    def release(self, kind: str, latency: Optional[float], e: Optional[Exception] = None):
+        """ Release the permit and report the latency (success) or the error to the limiter """
+        if self.limiter is None:
+            return
+        self.limiter.release(kind)
+        if isinstance(e, grpc.Call) and e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED:
+            self.limiter.overloaded(kind)
+        elif e is None and latency is not None:
+            self.limiter.succeeded(kind, latency, self.method)
+
+    def deadline(self, timeout: Optional[float]) -> Optional[float]:
+        return None if timeout is None else time.monotonic() + timeout
+
+    def remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else max(deadline - time.monotonic(), 0.)
+
+    def backoff(self, attempt: int, deadline: Optional[float], e: Exception):
+        """ Sleep before the next attempt or raise e if there is no more attempt or time left """
+        if attempt >= self.config.retries or not _is_retryable(e):
+            raise e
+        delay = random.uniform(0, min(self.config.max_backoff, self.config.backoff * 2 ** attempt))
+        remaining = self.remaining(deadline)
+        if remaining is not None and remaining <= delay:
+            raise e
+        self.metrics.count("retries")
+        time.sleep(delay)
+
+
+class _UnaryCall(_Call):
+    def __call__(self, request, timeout: Optional[float] = None, **kwargs):
+        deadline = self.deadline(self.config.timeout if timeout is None else timeout)
+        start, error, response = time.monotonic(), True, None
+        try:
+            attempt = 0
+            while True:
+                try:
+                    response = self.attempt(request, deadline, kwargs)
+                    error = False
+                    return response
+                except grpc.RpcError as e:
+                    self.backoff(attempt, deadline, e)
+                    attempt += 1
+        finally:
+            self.metrics.observe(time.monotonic() - start, _byte_size(request), _byte_size(response), error)
+
+    def attempt(self, request, deadline: Optional[float], kwargs):
+        self.acquire(UNARY, deadline)
+        start = time.monotonic()
+        try:
+            response = self.hedged(request, deadline, kwargs)
+        except grpc.RpcError as e:
+            self.release(UNARY, None, e)
+            raise
+        self.release(UNARY, time.monotonic() - start)
+        return response
+
+    def hedged(self, request, deadline: Optional[float], kwargs):
+        if self.config.hedge_after is None or not hasattr(self.call, "future"):
+            return self.call(request, timeout=self.remaining(deadline), **kwargs)
+
+        done = queue.Queue()
+        calls = [self.call.future(request, timeout=self.remaining(deadline), **kwargs)]
+        calls[0].add_done_callback(done.put)
+        try:
+            first = done.get(timeout=self.config.hedge_after)
+        except queue.Empty:
+            if self.try_acquire(UNARY):
+                self.metrics.count("hedged")
+                calls.append(self.call.future(request, timeout=self.remaining(deadline), **kwargs))
+                calls[1].add_done_callback(lambda c: self.release(UNARY, None))
+                calls[1].add_done_callback(done.put)
+            first = done.get()
+            if first.exception() is not None and len(calls) == 2:
+                first = done.get()
+        for c in calls:
+            if c is not first:
+                c.cancel()
+        return first.result()
+
+    def future(self, request, timeout: Optional[float] = None, **kwargs):
+        return self.call.future(request, timeout=self.config.timeout if timeout is None else timeout, **kwargs)
+
+
+class _StreamCall(_Call):
+    def __call__(self, request, timeout: Optional[float] = None, **kwargs):
+        return _ResponseStream(self, request, self.deadline(self.config.timeout if timeout is None else timeout),
+                               kwargs)
+
+
+class _ResponseStream:
+    """
+    Iterator over the responses of a server-streaming call.
+    The call is only sent (and its permit of the limiter taken) when the first response is requested,
+    so that creating an iterator never blocks.
+    The call is retried (if configured) as long as no response has been received.
+    """
+    def __init__(self, call: _StreamCall, request, deadline: Optional[float], kwargs):
+        self._call = call
+        self._request = request
+        self._deadline = deadline
+        self._kwargs = kwargs
+        self._attempt = 0
+        self._received = 0
+        self._start = time.monotonic()
+        self._response_bytes = 0
+        self._finished = False
+        self._permit = False
+        self._stream = None
+
+    def _new_stream(self):
+        self._call.acquire(STREAM, self._deadline)
+        self._permit = True
+        if self._call.config.hedge_after is not None:
+            return _HedgedStream(self._call, self._request, self._deadline, self._kwargs)
+        return self._call.call(self._request, timeout=self._call.remaining(self._deadline), **self._kwargs)
+
+    def _release(self, e: Optional[Exception] = None):
+        if self._permit:
+            self._permit = False
+            self._call.release(STREAM, None, e)
+
+    def __iter__(self):
+        return self
+
+    def _open(self):
+        if self._stream is None:
+            try:
+                self._stream = self._new_stream()
+            except grpc.RpcError:
+                self._finish(True)
+                raise
+
+    def __next__(self):
+        self._open()
+        while True:
+            try:
+                response = next(self._stream)
+                if self._received == 0 and self._call.limiter is not None:
+                    # The time to the first response depends on the size of the request (e.g. GetCube),
+                    # it is not a congestion signal
+                    self._call.limiter.succeeded(STREAM, None, self._call.method)
+                self._received += 1
+                self._response_bytes += _byte_size(response)
+                return response
+            except StopIteration:
+                self._finish(False)
+                raise
+            except grpc.RpcError as e:
+                self._release(e)
+                if self._received > 0:
+                    self._finish(True)
+                    raise
+                try:
+                    self._call.backoff(self._attempt, self._deadline, e)
+                    self._attempt += 1
+                    self._stream = self._new_stream()
+                except grpc.RpcError:
+                    self._finish(True)
+                    raise
+
+    def _finish(self, error: bool):
+        self._release()
+        if not self._finished:
+            self._finished = True
+            self._call.metrics.observe(time.monotonic() - self._start, _byte_size(self._request),
+                                       self._response_bytes, error)
+
+    def cancel(self):
+        self._finish(False)
+        return self._stream is not None and self._stream.cancel()
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        self._open()
+        return getattr(self._stream, item)
+
+    def __del__(self):
+        try:
+            self._release()
+        except AttributeError:
+            pass
+
+
+class _HedgedStream:
+    """
+    Server stream that sends a second identical request if the first response has not been received after
+    hedge_after seconds. The first stream to respond is kept and the other one is cancelled.
+    """
+    def __init__(self, call: _StreamCall, request, deadline: Optional[float], kwargs):
+        self._call = call
+        self._request = request
+        self._deadline = deadline
+        self._kwargs = kwargs
+        self._stream = self._new_stream()
+        self._first = True
+
+    def _new_stream(self):
+        return self._call.call(self._request, timeout=self._call.remaining(self._deadline), **self._kwargs)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._first:
+            return next(self._stream)
+        self._first = False
+
+        results = queue.Queue()
+        streams = [self._stream]
+        _next_in_thread(self._stream, results)
+        try:
+            stream, response, error = results.get(timeout=self._call.config.hedge_after)
+        except queue.Empty:
+            if self._call.try_acquire(STREAM):
+                self._call.metrics.count("hedged")
+                streams.append(self._new_stream())
+                _next_in_thread(streams[1], results)
+            stream, response, error = results.get()
+            if isinstance(error, grpc.RpcError) and len(streams) == 2:
+                stream, response, error = results.get()
+        for s in streams:
+            if s is not stream:
+                s.cancel()
+        if len(streams) == 2:
+            self._call.release(STREAM, None)
+        self._stream = stream
+        if error is not None:
+            raise error
+        return response
+
+    def cancel(self):
+        return self._stream.cancel()
+
+    def __getattr__(self, item):
+        return getattr(self._stream, item)
+
+
+def _next_in_thread(stream, results: queue.Queue):
+    """ Put (stream, first response, error) in results """
+    def _next():
+        try:
+            results.put((stream, next(stream), None))
+        except BaseException as e:
+            results.put((stream, None, e))
+    threading.Thread(target=_next, daemon=True).start()
+
 
 class Stub:
-    def __init__(self, stub: Union[geocube_grpc.GeocubeStub, admin_pb2_grpc.AdminStub], timeout: float = None):
+    """
+    Wrapper of a gRPC stub that applies per-RPC stages to each call (see CallConfig):
+    concurrency limit (optional, see ConcurrencyLimiter), deadline, retries with jittered backoff, hedging
+    and latency/bytes metrics.
+    >>> client.stub.configure("GetVariable", hedge_after=0.2)
+    >>> client.stub.metrics()["GetVariable"]["latency"]
+    """
+    def __init__(self, stub: Union[geocube_grpc.GeocubeStub, admin_pb2_grpc.AdminStub], timeout: float = None,
+                 configs: Dict[str, CallConfig] = None, limiter: Optional[ConcurrencyLimiter] = None):
         self._stub = stub
-        self.timeout = timeout
+        self._limiter = limiter
+        self._timeout = timeout
+        self._configs = default_configs() if configs is None else dict(configs)
+        self._calls: Dict[str, Tuple] = {}
+        self._metrics: Dict[str, _Metrics] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> Optional[float]:
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, timeout: Optional[float]):
+        self._timeout = timeout
+        self._calls = {}
+
+    @property
+    def limiter(self) -> Optional[ConcurrencyLimiter]:
+        return self._limiter
+
+    @limiter.setter
+    def limiter(self, limiter: Optional[ConcurrencyLimiter]):
+        self._limiter = limiter
+        self._calls = {}
+
+    def config(self, method: str) -> CallConfig:
+        """ Returns the configuration of the method (the timeout defaults to the timeout of the stub) """
+        config = self._configs.get(method, CallConfig())
+        if config.timeout is None:
+            config = dataclasses.replace(config, timeout=self._timeout)
+        return config
+
+    def configure(self, *methods: str, **kwargs):
+        """ Update the configuration of the methods (see CallConfig for the available arguments) """
+        for method in methods:
+            if kwargs.get("hedge_after") is not None and isinstance(
+                    getattr(self._stub, method, None), (grpc.StreamUnaryMultiCallable, grpc.StreamStreamMultiCallable)):
+                raise ValueError(f"{method}: client-streaming RPCs cannot be hedged")
+            self._configs[method] = dataclasses.replace(self._configs.get(method, CallConfig()), **kwargs)
+        self._calls = {}
+
+    def metrics(self) -> Dict[str, Dict]:
+        """ Returns the metrics (calls, errors, retries, hedged, latency & bytes histograms) of each method """
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {method: m.to_dict() for method, m in metrics.items()}
 
     def __getattr__(self, item):
-        if hasattr(self._stub, item):
-            item = getattr(object.__getattribute__(self, "_stub"), item)
-            if callable(item):
-                return functools.partial(item, timeout=self.timeout)
-            return item
-        return object.__getattribute__(self, item)
+        calls = object.__getattribute__(self, "_calls")
+        if item in calls:
+            return calls[item]
+        stub = object.__getattribute__(self, "_stub")
+        if not hasattr(stub, item):
+            return object.__getattribute__(self, item)
+        attr = getattr(stub, item)
+        if callable(attr):
+            with self._lock:
+                metrics = self._metrics.setdefault(item, _Metrics())
+            config = self.config(item)
+            if isinstance(attr, (grpc.StreamUnaryMultiCallable, grpc.StreamStreamMultiCallable)):
+                # The request iterator cannot be replayed
+                attr = _UnaryCall(item, attr, CallConfig(timeout=config.timeout), metrics, self._limiter)
+            elif isinstance(attr, grpc.UnaryStreamMultiCallable):
+                attr = _StreamCall(item, attr, config, metrics, self._limiter)
+            else:
+                attr = _UnaryCall(item, attr, config, metrics, self._limiter)
+        calls[item] = attr
+        return attr
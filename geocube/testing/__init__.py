@@ -0,0 +1,2 @@
+from geocube.testing.server import FakeCube, FakeCatalog, FakeGeocube, FakeDownloader, FakeAdmin, FakeServer, \
+    xyz_tile_data
@@ -0,0 +1,343 @@
+import collections
+import dataclasses
+import threading
+import time
+import zlib
+from concurrent import futures
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import grpc
+import numpy as np
+
+from geocube.pb import admin_pb2, admin_pb2_grpc, catalog_pb2, dataformat_pb2, datasetMeta_pb2, \
+    geocube_pb2_grpc, geocubeDownloader_pb2_grpc, layouts_pb2, records_pb2, variables_pb2, version_pb2
+
+VERSION = "fake"
+
+_pb_types = ["undefined", "uint8", "uint16", "uint32", "int8", "int16", "int32", "float32", "float64", "complex64"]
+
+
+@dataclasses.dataclass
+class FakeCube:
+    """
+    Synthetic cube served by GetCube and DownloadCube
+
+    Attributes:
+        slices: number of slices (if the request does not define the grouped records)
+        shape: (width, height) of the slices (None: use the size of the request)
+        bands: number of bands of the slices
+        dtype: numpy dtype of the slices
+        chunk_size: maximum size in bytes of the data of a message (header or chunk)
+        compression: deflate level of the data (None: use the compression_level of the request, -1: default level)
+        latency: delay in seconds before the first message
+        slice_latency: delay in seconds before each slice
+        slice_errors: indices of the slices returned with an error in their header
+        fail_after: abort the stream with fail_code after this number of slices (None: never)
+        fail_code: status code used by fail_after
+    """
+    slices: int = 10
+    shape: Optional[Tuple[int, int]] = None
+    bands: int = 1
+    dtype: str = "uint16"
+    chunk_size: int = 1024 * 1024
+    compression: Optional[int] = None
+    latency: float = 0.
+    slice_latency: float = 0.
+    slice_errors: Tuple[int, ...] = ()
+    fail_after: Optional[int] = None
+    fail_code: grpc.StatusCode = grpc.StatusCode.UNAVAILABLE
+
+    def payload(self, width: int, height: int, compression: int) -> List[bytes]:
+        """ Returns the data of a slice, (compressed and) split in parts of chunk_size bytes """
+        return _payload(width, height, self.bands, self.dtype, compression, self.chunk_size)
+
+    def image(self, width: int, height: int) -> np.ndarray:
+        """ Returns the content of a slice, as decoded by CubeIterator """
+        return _image(width, height, self.bands, self.dtype)
+
+    def responses(self, width: int, height: int, compression: int = 0) -> List[catalog_pb2.GetCubeResponse]:
+        """ Returns the messages of a GetCube stream of self.slices slices (without latency nor errors) """
+        cube = dataclasses.replace(self, latency=0., slice_latency=0., slice_errors=(), fail_after=None)
+        return list(_cube_stream(cube, None, [[FakeCatalog().record(i)] for i in range(self.slices)],
+                                 layouts_pb2.GeoTransform(), "", layouts_pb2.Size(width=width, height=height),
+                                 compression, False, FakeCatalog(dtype=self.dtype).variable_pb().dformat, 0))
+
+
+def _image(width: int, height: int, bands: int, dtype: str) -> np.ndarray:
+    return (np.arange(width * height * bands) % 251).astype(dtype).reshape((height, width, bands))
+
+
+_payloads: Dict[Tuple, List[bytes]] = {}
+_payloads_lock = threading.Lock()
+
+
+def _payload(width: int, height: int, bands: int, dtype: str, compression: int, chunk_size: int) -> List[bytes]:
+    key = (width, height, bands, dtype, compression, chunk_size)
+    with _payloads_lock:
+        if key not in _payloads:
+            data = _image(width, height, bands, dtype).astype(np.dtype(dtype).newbyteorder("<")).tobytes()
+            if compression != 0:
+                # Raw deflate stream (no header nor trailer), as the Geocube (-2: huffman-only)
+                c = zlib.compressobj(-1, zlib.DEFLATED, -15, 8, zlib.Z_HUFFMAN_ONLY) if compression == -2 \
+                    else zlib.compressobj(compression, zlib.DEFLATED, -15)
+                data = c.compress(data) + c.flush()
+            _payloads[key] = [data[i:i + chunk_size] for i in range(0, max(len(data), 1), max(chunk_size, 1))]
+        return _payloads[key]
+
+
+@dataclasses.dataclass
+class FakeCatalog:
+    """
+    Synthetic records, AOIs and variable served by the fake Geocube.
+    Records are generated on demand, so that millions of them can be listed.
+
+    Attributes:
+        records: number of records
+        aois: number of AOIs (record i is linked to AOI i % aois)
+        start: date of the first record (record i is one hour after record i-1)
+        variable: name of the variable
+        dtype: dtype of the variable
+        latency: delay in seconds before each response
+    """
+    records: int = 1000
+    aois: int = 10
+    start: datetime = datetime(2020, 1, 1)
+    variable: str = "fake/variable"
+    dtype: str = "uint16"
+    latency: float = 0.
+
+    def record_index(self, record_id: str) -> int:
+        try:
+            return int(record_id.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return -1
+
+    def aoi(self, aoi_id: str) -> Optional[records_pb2.AOI]:
+        try:
+            i = int(aoi_id.rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            return None
+        if not 0 <= i < self.aois:
+            return None
+        x, y = -180 + (i % 360), -80 + (i // 360) % 160
+        ring = [(x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1), (x, y)]
+        return records_pb2.AOI(polygons=[records_pb2.Polygon(linearrings=[records_pb2.LinearRing(
+            points=[records_pb2.Coord(lon=lon, lat=lat) for lon, lat in ring])])])
+
+    def record(self, i: int, with_aoi: bool = False) -> records_pb2.Record:
+        r = records_pb2.Record(id=f"record-{i}", name=f"record-{i % 100}", aoi_id=f"aoi-{i % self.aois}",
+                               tags={"source": "fake", "index": str(i)})
+        r.time.FromDatetime(self.start + timedelta(hours=i))
+        if with_aoi:
+            r.aoi.CopyFrom(self.aoi(r.aoi_id))
+        return r
+
+    def list_records(self, limit: int, page: int, with_aoi: bool) -> Iterator[records_pb2.Record]:
+        start, stop = (0, self.records) if limit <= 0 else (page * limit, min((page + 1) * limit, self.records))
+        return (self.record(i, with_aoi) for i in range(start, stop))
+
+    def variable_pb(self) -> variables_pb2.Variable:
+        return variables_pb2.Variable(
+            id="variable-0", name=self.variable, unit="", description="fake variable", bands=[""],
+            dformat=dataformat_pb2.DataFormat(dtype=_pb_types.index(self.dtype), no_data=0, min_value=0,
+                                              max_value=float(np.iinfo(self.dtype).max)
+                                              if np.dtype(self.dtype).kind in "ui" else 1),
+            instances=[variables_pb2.Instance(id="instance-0", name="master")])
+
+
+class _FakeServicer:
+    """ Common behaviour of the fake servicers: call counters and error injection """
+    def __init__(self):
+        self.calls = collections.Counter()
+        self._errors: Dict[str, List[Tuple[grpc.StatusCode, str]]] = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def inject_error(self, method: str, code: grpc.StatusCode = grpc.StatusCode.UNAVAILABLE, count: int = 1,
+                     details: str = "injected error"):
+        """ The next count calls to method will fail with this code """
+        with self._lock:
+            self._errors[method] += [(code, details)] * count
+
+    def _call(self, method: str, context, latency: float = 0.):
+        with self._lock:
+            self.calls[method] += 1
+            error = self._errors[method].pop(0) if self._errors[method] else None
+        if latency > 0:
+            time.sleep(latency)
+        if error is not None:
+            context.abort(*error)
+
+
+class FakeGeocube(_FakeServicer, geocube_pb2_grpc.GeocubeServicer):
+    """
+    Stand-in of the Geocube server, serving synthetic cubes (see FakeCube) and records (see FakeCatalog).
+    The RPCs that are not implemented return UNIMPLEMENTED.
+    """
+    def __init__(self, cube: FakeCube = None, catalog: FakeCatalog = None):
+        super().__init__()
+        self.cube = cube if cube is not None else FakeCube()
+        self.catalog = catalog if catalog is not None else FakeCatalog()
+        self.grids: Dict[str, int] = {}  # Number of cells of the grids created with CreateGrid
+
+    def Version(self, request, context):
+        self._call("Version", context)
+        return version_pb2.GetVersionResponse(Version=VERSION)
+
+    def GetVariable(self, request, context):
+        self._call("GetVariable", context, self.catalog.latency)
+        return variables_pb2.GetVariableResponse(variable=self.catalog.variable_pb())
+
+    def ListVariables(self, request, context):
+        self._call("ListVariables", context, self.catalog.latency)
+        yield variables_pb2.ListVariablesResponseItem(variable=self.catalog.variable_pb())
+
+    def ListRecords(self, request, context):
+        self._call("ListRecords", context, self.catalog.latency)
+        for record in self.catalog.list_records(request.limit, request.page, request.with_aoi):
+            yield records_pb2.ListRecordsResponseItem(record=record)
+
+    def GetRecords(self, request, context):
+        self._call("GetRecords", context, self.catalog.latency)
+        for record_id in request.ids:
+            i = self.catalog.record_index(record_id)
+            if not 0 <= i < self.catalog.records:
+                context.abort(grpc.StatusCode.NOT_FOUND, f"record {record_id} not found")
+            yield records_pb2.GetRecordsResponseItem(record=self.catalog.record(i, with_aoi=True))
+
+    def GetAOI(self, request, context):
+        self._call("GetAOI", context, self.catalog.latency)
+        aoi = self.catalog.aoi(request.id)
+        if aoi is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, f"aoi {request.id} not found")
+        return records_pb2.GetAOIResponse(aoi=aoi)
+
+    def GetXYZTile(self, request, context):
+        self._call("GetXYZTile", context, self.catalog.latency)
+        if not 0 <= request.z <= 22 or not 0 <= request.x < 2 ** request.z or not 0 <= request.y < 2 ** request.z:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"invalid tile {request.x}/{request.y}/{request.z}")
+        return catalog_pb2.GetTileResponse(image=catalog_pb2.ImageFile(data=xyz_tile_data(
+            request.instance_id, list(request.records.ids), request.x, request.y, request.z)))
+
+    def CreateGrid(self, request_iterator, context):
+        self._call("CreateGrid", context, self.catalog.latency)
+        for request in request_iterator:
+            self.grids[request.grid.name] = self.grids.get(request.grid.name, 0) + len(request.grid.cells)
+        return layouts_pb2.CreateGridResponse()
+
+    def GetCube(self, request, context):
+        self._call("GetCube", context, self.cube.latency)
+        if request.HasField("grouped_records"):
+            grouped_records = [[self.catalog.record(max(self.catalog.record_index(i), 0)) for i in g.ids]
+                               for g in request.grouped_records.records]
+        else:
+            grouped_records = [[self.catalog.record(i)] for i in range(self.cube.slices)]
+        yield from _cube_stream(self.cube, context, grouped_records, request.pix_to_crs, request.crs, request.size,
+                                request.compression_level, request.headers_only,
+                                self.catalog.variable_pb().dformat, request.resampling_alg)
+
+
+class FakeDownloader(_FakeServicer, geocubeDownloader_pb2_grpc.GeocubeDownloaderServicer):
+    """ Stand-in of the Geocube Downloader, serving synthetic cubes (see FakeCube) """
+    def __init__(self, cube: FakeCube = None):
+        super().__init__()
+        self.cube = cube if cube is not None else FakeCube()
+
+    def Version(self, request, context):
+        self._call("Version", context)
+        return version_pb2.GetVersionResponse(Version=VERSION)
+
+    def DownloadCube(self, request, context):
+        self._call("DownloadCube", context, self.cube.latency)
+        yield from _cube_stream(self.cube, context, [list(g.records) for g in request.grouped_records],
+                                request.pix_to_crs, request.crs, request.size,
+                                self.cube.compression or 0, False, request.ref_dformat, request.resampling_alg,
+                                message=catalog_pb2.GetCubeMetadataResponse)
+
+
+class FakeAdmin(_FakeServicer, admin_pb2_grpc.AdminServicer):
+    """ Stand-in of the Admin service of the Geocube (does nothing) """
+    def TidyDB(self, request, context):
+        self._call("TidyDB", context)
+        return admin_pb2.TidyDBResponse()
+
+    def UpdateDatasets(self, request, context):
+        self._call("UpdateDatasets", context)
+        return admin_pb2.UpdateDatasetsResponse()
+
+    def DeleteDatasets(self, request, context):
+        self._call("DeleteDatasets", context)
+        return admin_pb2.DeleteDatasetsResponse()
+
+
+def xyz_tile_data(instance_id: str, record_ids: List[str], x: int, y: int, z: int) -> bytes:
+    """ Returns the content of the XYZ tile served by FakeGeocube.GetXYZTile """
+    return f"{instance_id}:{','.join(record_ids)}:{x},{y},{z}".encode()
+
+
+def _cube_stream(cube: FakeCube, context, grouped_records: List[List[records_pb2.Record]],
+                 pix_to_crs: layouts_pb2.GeoTransform, crs: str, size: layouts_pb2.Size, compression: int,
+                 headers_only: bool, dformat: dataformat_pb2.DataFormat, resampling_alg: int,
+                 message=catalog_pb2.GetCubeResponse):
+    width, height = cube.shape if cube.shape is not None else (size.width, size.height)
+    compression = compression if cube.compression is None else cube.compression
+    parts = [] if headers_only else cube.payload(width, height, compression)
+    nbytes = width * height * cube.bands * np.dtype(cube.dtype).itemsize
+
+    yield message(global_header=catalog_pb2.GetCubeResponseHeader(
+        count=len(grouped_records), nb_datasets=sum(len(g) for g in grouped_records), ref_dformat=dformat,
+        resampling_alg=resampling_alg, geotransform=pix_to_crs, crs=crs))
+
+    for i, records in enumerate(grouped_records):
+        if cube.fail_after is not None and i >= cube.fail_after:
+            context.abort(cube.fail_code, f"stream aborted after {i} slices")
+        if cube.slice_latency > 0:
+            time.sleep(cube.slice_latency)
+        if i in cube.slice_errors:
+            yield message(header=catalog_pb2.ImageHeader(error=f"slice {i}: injected error"))
+            continue
+        yield message(header=catalog_pb2.ImageHeader(
+            shape=catalog_pb2.Shape(dim1=cube.bands, dim2=width, dim3=height),
+            dtype=_pb_types.index(cube.dtype), nb_parts=len(parts), data=parts[0] if parts else b"",
+            size=nbytes, order=catalog_pb2.LittleEndian, compression=compression != 0 and not headers_only,
+            grouped_records=records_pb2.GroupedRecords(records=records),
+            dataset_meta=datasetMeta_pb2.DatasetMeta(internalsMeta=[datasetMeta_pb2.InternalMeta(
+                container_uri=f"fake://container/{r.id}.tif", bands=list(range(1, cube.bands + 1)), dformat=dformat,
+                range_min=dformat.min_value, range_max=dformat.max_value, exponent=1) for r in records])))
+        for part, data in enumerate(parts[1:], 1):
+            yield message(chunk=catalog_pb2.ImageChunk(part=part, data=data))
+
+
+class FakeServer:
+    """
+    In-process gRPC server running a FakeGeocube, a FakeAdmin and a FakeDownloader on a free local port.
+    >>> with FakeServer(FakeGeocube(FakeCube(slices=100, dtype="float32"))) as server:
+    ...     client = Client(server.uri, verbose=False)
+    ...     client.use_downloader(Downloader(server.uri, verbose=False))
+    """
+    def __init__(self, geocube: FakeGeocube = None, downloader: FakeDownloader = None, admin: FakeAdmin = None,
+                 max_workers: int = 16, host: str = "127.0.0.1", port: int = 0):
+        self.geocube = geocube if geocube is not None else FakeGeocube()
+        self.downloader = downloader if downloader is not None else FakeDownloader(self.geocube.cube)
+        self.admin = admin if admin is not None else FakeAdmin()
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers),
+                                   options=[("grpc.max_send_message_length", -1),
+                                            ("grpc.max_receive_message_length", -1)])
+        geocube_pb2_grpc.add_GeocubeServicer_to_server(self.geocube, self._server)
+        geocubeDownloader_pb2_grpc.add_GeocubeDownloaderServicer_to_server(self.downloader, self._server)
+        admin_pb2_grpc.add_AdminServicer_to_server(self.admin, self._server)
+        self.port = self._server.add_insecure_port(f"{host}:{port}")
+        self.uri = f"{host}:{self.port}"
+
+    def start(self):
+        self._server.start()
+        return self
+
+    def stop(self, grace: float = None):
+        self._server.stop(grace)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
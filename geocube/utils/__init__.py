@@ -1,5 +1,23 @@
-from geocube.utils.image import image_to_geotiff, timeseries_to_animation
-from geocube.utils.exceptions import catch_rpc_error, GeocubeError
-from geocube.utils.aoi import read_aoi, plot_aoi
-from geocube.utils.pb import pb_string, pb_null_timestamp
+import typing
 
+from geocube._lazy import lazy_attributes
+
+# Utils are imported lazily (PEP 562): geopandas, rasterio... are only loaded when a util that needs them is used
+__getattr__, __dir__, __all__ = lazy_attributes(__name__, {
+    ".image": ["image_to_geotiff", "timeseries_to_animation"],
+    ".exceptions": ["catch_rpc_error", "GeocubeError"],
+    ".aoi": ["read_aoi", "plot_aoi"],
+    ".pb": ["pb_string", "pb_null_timestamp"],
+    ".aoi_index": ["AOIIndex"],
+    ".mbtiles": ["MBTilesCache", "xyz_layer"],
+    ".mosaic": ["MosaicWriter"],
+})
+
+if typing.TYPE_CHECKING:
+    from geocube.utils.image import image_to_geotiff, timeseries_to_animation
+    from geocube.utils.exceptions import catch_rpc_error, GeocubeError
+    from geocube.utils.aoi import read_aoi, plot_aoi
+    from geocube.utils.pb import pb_string, pb_null_timestamp
+    from geocube.utils.aoi_index import AOIIndex
+    from geocube.utils.mbtiles import MBTilesCache, xyz_layer
+    from geocube.utils.mosaic import MosaicWriter
@@ -1,14 +1,19 @@
+import typing
 import warnings
 
-import geopandas
 from shapely import ops
 try:
     from shapely.errors import GEOSException
 except ImportError:
     GEOSException = ValueError
 
+if typing.TYPE_CHECKING:
+    import geopandas
+
+
 def read_aoi(aoi_file):
     """ Read an AOI from file in geographic coordinates """
+    import geopandas
     df = geopandas.read_file(aoi_file).to_crs("epsg:4326")
     try:
         return ops.unary_union(list(df.geometry))
@@ -18,10 +23,11 @@ def read_aoi(aoi_file):
 
 def gpd_read_remote_file(url):
     import fsspec
+    import geopandas
     with fsspec.open(f"simplecache::{url}") as file:
         return geopandas.read_file(file)
 
-def plot_aoi(aoi: geopandas.GeoSeries,
+def plot_aoi(aoi: "geopandas.GeoSeries",
              world_path: str = "https://www.naturalearthdata.com/http//www.naturalearthdata.com/"
                                "download/110m/cultural/ne_110m_admin_0_countries.zip",
              ax=None, margin_pc=5, color=None):
@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+from typing import Dict, Optional, Union
+
+import shapely
+from shapely import geometry
+
+
+class AOIIndex:
+    """
+    Client-side index mapping the normalised geometry of an AOI to its id in the Geocube.
+    It is used by Client.create_aoi(exist_ok=True) to resolve known AOIs without uploading their geometry.
+    The index can be persisted in a file (one "hash aoi_id uri" per line), appended each time a new AOI is added.
+    As the ids are only valid in the Geocube they come from, the index only loads the lines of its uri
+    (a file can be shared by the indices of several Geocubes).
+    If an AOI is deleted from the Geocube, the index must be cleared.
+    >>> index = AOIIndex("aois.idx", uri=geocube_uri)
+    >>> client.use_aoi_index(index)
+    """
+    def __init__(self, path: Optional[str] = None, uri: Optional[str] = None):
+        """
+        Args:
+            path: (optional) file where the index is persisted
+            uri: of the Geocube the AOIs come from (required if path is defined)
+        """
+        if path is not None and not uri:
+            raise ValueError("AOIIndex: the uri of the Geocube is required to persist the index")
+        self.path = path
+        self.uri = uri
+        self._ids: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 3 and parts[2] == uri:
+                        self._ids[parts[0]] = parts[1]
+
+    @staticmethod
+    def key(aoi: Union[geometry.Polygon, geometry.MultiPolygon]) -> str:
+        """ Returns the hash of the normalised geometry (Polygons are converted to MultiPolygons) """
+        if isinstance(aoi, geometry.Polygon):
+            aoi = geometry.MultiPolygon([aoi])
+        return hashlib.sha1(shapely.to_wkb(shapely.normalize(aoi), hex=False)).hexdigest()
+
+    def get(self, aoi: Union[geometry.Polygon, geometry.MultiPolygon]) -> Optional[str]:
+        """ Returns the id of the AOI or None if it is unknown """
+        return self._ids.get(self.key(aoi))
+
+    def add(self, aoi: Union[geometry.Polygon, geometry.MultiPolygon], aoi_id: str):
+        """ Add the AOI to the index (and to the file, if any) """
+        key = self.key(aoi)
+        with self._lock:
+            if self._ids.get(key) == aoi_id:
+                return
+            self._ids[key] = aoi_id
+            if self.path is not None:
+                with open(self.path, "a") as f:
+                    f.write(f"{key} {aoi_id} {self.uri}\n")
+
+    def clear(self):
+        """ Clear the index (and remove the lines of its uri from the file, if any) """
+        with self._lock:
+            self._ids.clear()
+            if self.path is not None and os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    others = [line for line in f if line.split()[2:] != [self.uri]]
+                with open(self.path, "w") as f:
+                    f.writelines(others)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, aoi: Union[geometry.Polygon, geometry.MultiPolygon]) -> bool:
+        return self.key(aoi) in self._ids
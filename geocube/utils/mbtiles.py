@@ -0,0 +1,77 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+XYZ = Tuple[int, int, int]
+
+
+def xyz_layer(instance_id: str, record_ids: List[str]) -> str:
+    """ Returns the key of the layer of tiles rendered from an instance and a list of records """
+    return f"{instance_id}/{hashlib.sha1(','.join(record_ids).encode()).hexdigest()}"
+
+
+class MBTilesCache:
+    """
+    Cache of XYZ tiles stored in a SQLite database, following the MBTiles layout
+    (tile_row is in the TMS convention, i.e. y is flipped).
+    The table "tiles" has an additional column "layer" to store the tiles of several (instance, records).
+    It can be shared between threads.
+    >>> with MBTilesCache("tiles.mbtiles") as cache:
+    ...     client.get_xyz_tiles(instance, records, [(x, y, 12) for x in range(2090, 2100) for y in range(1400, 1410)],
+    ...                          cache=cache)
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("INSERT OR IGNORE INTO metadata (name, value) VALUES ('format', 'png')")
+            self._db.execute("CREATE TABLE IF NOT EXISTS tiles (layer TEXT, zoom_level INTEGER, "
+                             "tile_column INTEGER, tile_row INTEGER, tile_data BLOB, "
+                             "PRIMARY KEY (layer, zoom_level, tile_column, tile_row))")
+
+    def get(self, layer: str, x: int, y: int, z: int) -> Optional[bytes]:
+        """ Returns the tile or None if it is not in the cache """
+        with self._lock:
+            row = self._db.execute("SELECT tile_data FROM tiles WHERE layer=? AND zoom_level=? AND tile_column=? "
+                                   "AND tile_row=?", (layer, z, x, _tms_row(y, z))).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def get_many(self, layer: str, tiles: Iterable[XYZ]) -> Dict[XYZ, bytes]:
+        """ Returns the tiles that are in the cache """
+        found = {}
+        for x, y, z in tiles:
+            data = self.get(layer, x, y, z)
+            if data is not None:
+                found[(x, y, z)] = data
+        return found
+
+    def put(self, layer: str, x: int, y: int, z: int, data: bytes):
+        self.put_many(layer, {(x, y, z): data})
+
+    def put_many(self, layer: str, tiles: Dict[XYZ, bytes]):
+        with self._lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO tiles (layer, zoom_level, tile_column, tile_row, tile_data) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 [(layer, z, x, _tms_row(y, z), sqlite3.Binary(data))
+                                  for (x, y, z), data in tiles.items()])
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _tms_row(y: int, z: int) -> int:
+    return (1 << z) - 1 - y
@@ -0,0 +1,203 @@
+import math
+import os
+import queue
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import affine
+import numpy as np
+
+from geocube import entities
+
+
+class MosaicWriter:
+    """
+    Assembles the results of a tile-parallel processing (e.g. sdk.map_tiles) into a single tiled and compressed
+    GeoTIFF (or Cloud Optimized GeoTIFF), instead of writing one file per tile and mosaicking them afterwards.
+
+    The tiles can be written in any order and from any thread: the images are queued and written by a single writer
+    thread (windowed writes), so the workers do not wait for the disk, except if the queue is full.
+    The tiles must be aligned on the pixel grid of the mosaic. The blocks that are never written are not allocated
+    and are read as no_data. If tiles overlap, the last tile written wins.
+    For better performance, the shape of the tiles should be a multiple of block_size.
+    At the end (close()), the overviews are built and the file is optionally converted to a COG.
+
+    >>> with MosaicWriter.from_tiles("mean.tif", tiles, dtype="float32", no_data=np.nan, cog=True) as mosaic:
+    ...     sdk.map_tiles(connection_params, tiles, collection, executor="thread",
+    ...                   cube_callback=lambda timeseries, tile: mosaic.write(tile, np.nanmean(timeseries, axis=0)))
+    """
+    def __init__(self, path: str, crs: Union[str, int], transform: affine.Affine, shape: Tuple[int, int],
+                 dtype: str, bands: int = 1, no_data: Optional[float] = None, block_size: int = 512,
+                 compression: str = "deflate", overviews: Union[str, Sequence[int], None] = "auto",
+                 resampling: str = "average", cog: bool = False, queue_size: int = 16):
+        """
+        Args:
+            path: of the output GeoTIFF
+            crs: of the mosaic
+            transform: geotransform of the mosaic (pixel to crs)
+            shape: (width, height) of the mosaic in pixels (same convention as entities.Tile)
+            dtype: of the mosaic
+            bands: number of bands
+            no_data: value of the pixels that are not covered by a tile
+            block_size: size of the internal tiles of the GeoTIFF (multiple of 16)
+            compression: of the GeoTIFF ("deflate", "lzw", "zstd"...)
+            overviews: decimation factors of the overviews, "auto" to build overviews until the mosaic fits in a
+                block, or None
+            resampling: method to compute the overviews ("average", "nearest", "mode"...)
+            cog: convert the file to a Cloud Optimized GeoTIFF at the end (GDAL >= 3.1)
+            queue_size: maximum number of tiles waiting to be written (write() blocks if the queue is full)
+        """
+        import rasterio
+        if block_size % 16 != 0:
+            raise ValueError(f"MosaicWriter: block_size must be a multiple of 16 (got {block_size})")
+        self.path = path
+        self.crs = entities.tile.crs_to_str(crs)
+        self.transform = transform
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.bands = bands
+        self.no_data = no_data
+        self.block_size = block_size
+        self.compression = compression
+        self.overviews = overviews
+        self.resampling = resampling
+        self.cog = cog
+
+        self._tmp_path = path + ".tmp.tif" if cog else path
+        self._dst = rasterio.open(self._tmp_path, "w", driver="GTiff", dtype=self.dtype.name, nodata=no_data,
+                                  count=bands, width=self.shape[0], height=self.shape[1], crs=self.crs,
+                                  transform=transform, tiled=True, blockxsize=block_size, blockysize=block_size,
+                                  compress=compression, interleave="pixel" if bands > 1 else "band",
+                                  sparse_ok=True, bigtiff="if_safer")
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="MosaicWriter", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_tiles(cls, path: str, tiles: Union[Iterable[entities.Tile], entities.TileSet], dtype: str,
+                   **kwargs) -> "MosaicWriter":
+        """
+        Creates a MosaicWriter that covers the tiles (that must share the same crs and resolution)
+
+        Args:
+            path: of the output GeoTIFF
+            tiles: the mosaic is the bounding box of the tiles
+            dtype: of the mosaic
+            kwargs: other arguments of MosaicWriter (bands, no_data, compression, cog...)
+        """
+        tiles: List[entities.Tile] = list(tiles)
+        if not tiles:
+            raise ValueError("MosaicWriter: at least one tile is required")
+        crs, (a, b, _, d, e, _) = tiles[0].crs, tiles[0].transform[:6]
+        if b != 0 or d != 0:
+            raise ValueError("MosaicWriter: rotated tiles are not supported")
+        for tile in tiles:
+            if entities.tile.crs_to_str(tile.crs) != entities.tile.crs_to_str(crs) \
+                    or not np.allclose((tile.transform.a, tile.transform.e), (a, e)):
+                raise ValueError(f"MosaicWriter: all the tiles must have the same crs and resolution ({tile})")
+        # Corners in pixels of the first tile
+        corners = np.array([(~tiles[0].transform) * (tile.transform * corner) for tile in tiles
+                            for corner in [(0, 0), tile.shape]])
+        i1, j1 = np.floor(corners.min(axis=0) + 1e-6)
+        i2, j2 = np.ceil(corners.max(axis=0) - 1e-6)
+        transform = tiles[0].transform * affine.Affine.translation(i1, j1)
+        return cls(path, crs, transform, (int(i2 - i1), int(j2 - j1)), dtype, **kwargs)
+
+    def window(self, tile: entities.Tile) -> Tuple[int, int, int, int]:
+        """
+        Returns the window (col_off, row_off, width, height) of the tile in the mosaic.
+        Raises ValueError if the tile is not aligned on the pixel grid or is out of the mosaic.
+        """
+        t, m = tile.transform, self.transform
+        if entities.tile.crs_to_str(tile.crs) != self.crs \
+                or not np.allclose((t.a, t.b, t.d, t.e), (m.a, m.b, m.d, m.e)):
+            raise ValueError(f"MosaicWriter: the tile must have the same crs and resolution as the mosaic ({tile})")
+        col, row = ~self.transform * (tile.transform.c, tile.transform.f)
+        if not math.isclose(col, round(col), abs_tol=1e-6) or not math.isclose(row, round(row), abs_tol=1e-6):
+            raise ValueError(f"MosaicWriter: the tile is not aligned on the pixel grid of the mosaic ({tile})")
+        col, row = int(round(col)), int(round(row))
+        width, height = tile.shape
+        if col < 0 or row < 0 or col + width > self.shape[0] or row + height > self.shape[1]:
+            raise ValueError(f"MosaicWriter: the tile is out of the mosaic ({tile})")
+        return col, row, width, height
+
+    def write(self, tile: entities.Tile, image: np.ndarray):
+        """
+        Queues an image to be written at the location of the tile.
+
+        Args:
+            tile: location of the image
+            image: (height, width) or (height, width, bands) (as returned by sdk.get_cube), cast to the dtype
+                of the mosaic.
+        """
+        if self._closed:
+            raise ValueError("MosaicWriter is closed")
+        self._raise_error()
+        window = self.window(tile)
+        if image.ndim == 2:
+            image = image[..., None]
+        if image.shape != (window[3], window[2], self.bands):
+            raise ValueError(f"MosaicWriter: expected an image of shape {(window[3], window[2], self.bands)}, "
+                             f"got {image.shape}")
+        self._queue.put((window, image))
+
+    def close(self):
+        """ Waits for the queued tiles to be written, builds the overviews and converts the file to COG """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._raise_error()
+            self._finalize()
+        finally:
+            if not self._dst.closed:
+                self._dst.close()
+            if self.cog and os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _run(self):
+        from rasterio.windows import Window
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue  # Drain the queue so that the writers are not blocked
+            (col, row, width, height), image = item
+            try:
+                self._dst.write(np.moveaxis(image, -1, 0).astype(self.dtype, copy=False),
+                                window=Window(col, row, width, height))
+            except BaseException as e:
+                self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _finalize(self):
+        from rasterio.enums import Resampling
+        factors = self.overviews
+        if factors == "auto":
+            factors, size = [], max(self.shape)
+            while size > self.block_size:
+                factors.append(2 ** (len(factors) + 1))
+                size = math.ceil(size / 2)
+        if factors:
+            self._dst.build_overviews(list(factors), Resampling[self.resampling])
+            self._dst.update_tags(ns="rio_overview", resampling=self.resampling)
+        self._dst.close()
+        if self.cog:
+            import rasterio.shutil
+            rasterio.shutil.copy(self._tmp_path, self.path, driver="COG", compress=self.compression,
+                                 blocksize=self.block_size, overviews="FORCE_USE_EXISTING" if factors else "NONE",
+                                 bigtiff="if_safer")
@@ -22,7 +22,7 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://www.github.com/airbusgeo/geocube-client-python",
-    packages=['geocube', 'geocube.utils', 'geocube.pb', 'geocube.entities', 'geocube.sdk'],
+    packages=['geocube', 'geocube.utils', 'geocube.pb', 'geocube.entities', 'geocube.sdk', 'geocube.testing'],
     install_requires=parse_requirements('requirements.txt'),
     classifiers=[
         "Programming Language :: Python :: 3",
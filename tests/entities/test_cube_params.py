@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import numpy as np
+
+from geocube import Client, entities
+from geocube.pb import catalog_pb2, layouts_pb2, records_pb2
+from geocube.testing import FakeCube, FakeGeocube, FakeServer
+
+
+def tile(x=0, shape=(64, 32)):
+    return entities.Tile.from_geotransform(entities.geo_transform(x, 0, 10), "epsg:3857", shape)
+
+
+class TestCubeParams:
+    def test_eq(self):
+        def grouped(*ids):
+            return records_pb2.GroupedRecordIdsList(records=[records_pb2.GroupedRecordIds(ids=[i]) for i in ids])
+        a = entities.CubeParams.from_tile(tile(), "instance", records=grouped("a"))
+        assert a != entities.CubeParams.from_tile(tile(), "instance", records=grouped("b"))
+        assert a == entities.CubeParams.from_tile(tile(), "instance", records=grouped("a"))
+        assert a == entities.CubeParams.from_tile(tile(), "instance", records=["a"])
+        assert a != entities.CubeParams.from_tile(tile(), "instance")
+        assert a._records_pb is not None
+
+
+class TestCubeTemplate:
+    def test_serialize_records(self):
+        params = entities.CubeParams.from_tile(tile(), "instance", records=[["a", "b"], ["c"]])
+        template = entities.CubeTemplate(params)
+        req = catalog_pb2.GetCubeRequest.FromString(
+            template.on(tile(100, (16, 8))).serialize(compression=1, file_format=catalog_pb2.GTiff))
+        assert req == catalog_pb2.GetCubeRequest(
+            instances_id=["instance"], crs="epsg:3857",
+            pix_to_crs=layouts_pb2.GeoTransform(a=100, b=10, c=0, d=0, e=0, f=-10),
+            size=layouts_pb2.Size(width=16, height=8), compression_level=1, format=catalog_pb2.GTiff,
+            grouped_records=records_pb2.GroupedRecordIdsList(records=[
+                records_pb2.GroupedRecordIds(ids=["a", "b"]), records_pb2.GroupedRecordIds(ids=["c"])]))
+        assert template.tile == params.tile
+        assert template.on(tile(100)).cube_params().tile == tile(100)
+
+    def test_serialize_filters(self):
+        params = entities.CubeParams.from_tile(tile(), "instance", tags={"k": "v"}, from_time=datetime(2021, 1, 1))
+        req = catalog_pb2.GetCubeRequest.FromString(entities.CubeTemplate(params).serialize(headers_only=True))
+        assert req.WhichOneof("records_lister") == "filters" and req.headers_only
+        assert dict(req.filters.tags) == {"k": "v"}
+        assert req.filters.from_time.ToDatetime() == datetime(2021, 1, 1)
+
+    def test_get_cube(self):
+        cube = FakeCube()
+        with FakeServer(FakeGeocube(cube)) as server:
+            client = Client(server.uri, verbose=False)
+            params = entities.CubeParams.from_tile(tile(), "instance-0", records=[f"record-{i}" for i in range(3)])
+            template = entities.CubeTemplate(params)
+            for shape in [(16, 8), (8, 4)]:
+                images, records = client.get_cube(template.on(tile(shape=shape)), verbose=False)
+                assert len(images) == 3 and records[2][0].id == "record-2"
+                np.testing.assert_array_equal(images[0], cube.image(*shape))
+            assert client.get_cube_metadata(template).shape == (64, 32)
+            assert client.stub.metrics()["GetCube"]["calls"] == 3
@@ -0,0 +1,68 @@
+import geopandas as gpd
+import numpy as np
+from shapely import geometry
+
+from geocube import entities
+from geocube.pb import layouts_pb2
+
+
+class TestGrid:
+    @staticmethod
+    def grid(n):
+        polygons = [geometry.box(i, 0, i + 1, 1) for i in range(n)]
+        gdf = gpd.GeoDataFrame({"id": [f"cell{i}" for i in range(n)]}, geometry=polygons, crs="epsg:32631")
+        return entities.Grid.from_geodataframe("grid", "test grid", gdf)
+
+    def test_input_unchanged(self):
+        polygons = [geometry.box(i, 0, i + 1, 1) for i in range(3)]
+        gdf = gpd.GeoDataFrame({"id": ["a", "b", "c"]}, geometry=polygons, crs="epsg:32631")
+        entities.Grid.from_geodataframe("grid", "test grid", gdf)
+        assert all(g.geom_type == "Polygon" for g in gdf.geometry) and list(gdf.geometry) == polygons
+        rings = np.array([p.exterior for p in polygons] + [polygons[0]], dtype=object)
+        entities.Cells.from_geometries(["a", "b", "c", "d"], "epsg:32631", rings)
+        assert rings[-1].geom_type == "Polygon"
+
+    def test_create_requests(self):
+        grid = self.grid(10)
+        requests = [layouts_pb2.CreateGridRequest.FromString(r) for r in grid.iter_create_requests(1 << 20)]
+        assert len(requests) == 1
+        assert requests[0].grid == grid.to_pb()
+
+        legacy = entities.Grid("grid", "test grid", list(grid.cells))
+        assert requests[0].grid == legacy.to_pb()
+
+    def test_create_requests_max_bytes(self):
+        grid = self.grid(1000)
+        max_bytes = 4096
+        requests = list(grid.iter_create_requests(max_bytes))
+        assert len(requests) > 1
+        cells = []
+        for r in requests:
+            assert len(r) <= max_bytes + 8
+            pb = layouts_pb2.CreateGridRequest.FromString(r)
+            assert pb.grid.name == "grid"
+            cells.extend(pb.grid.cells)
+        assert [c.id for c in cells] == list(grid.cells.ids)
+        np.testing.assert_allclose([(p.lon, p.lat) for p in cells[10].coordinates.points],
+                                   grid.cells.ring(10))
+
+    def test_from_pb(self):
+        grid = self.grid(100)
+        pb = layouts_pb2.CreateGridRequest.FromString(next(grid.iter_create_requests(1 << 20))).grid
+        # Coords of the first cell have null values that are not serialized: it is decoded point by point
+        loaded = entities.Grid.from_pb(pb)
+        assert loaded.cells._pb_cells is not None
+        assert len(loaded.cells) == 100
+        assert list(loaded.cells.ids) == list(grid.cells.ids)
+        np.testing.assert_allclose(loaded.cells.coordinates, grid.cells.coordinates)
+        assert entities.Cell.from_pb(pb.cells[3]) == grid.cells[3]
+
+    def test_spatial_index(self):
+        grid = self.grid(100)
+        cells = grid.cells_intersecting(geometry.box(10.5, 0.2, 12.5, 0.8), crs=32631)
+        assert list(cells.ids) == ["cell10", "cell11", "cell12"]
+        assert grid.cell_containing(42.5, 0.5, crs="epsg:32631").id == "cell42"
+        assert grid.cell_containing(142.5, 0.5, crs="epsg:32631") is None
+
+        lon, lat = entities.tile.to_crs(geometry.Point(42.5, 0.5), 32631, 4326).coords[0]
+        assert grid.cell_containing(lon, lat).id == "cell42"
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import shapely
+from shapely import geometry
+
+from geocube import Client, entities
+from geocube.pb import layouts_pb2
+
+
+class FakeLayoutStub:
+    def __init__(self):
+        self.layouts = {}
+
+    def ListLayouts(self, req):
+        return layouts_pb2.ListLayoutsResponse(layouts=[self.layouts[req.name_like]])
+
+    def CreateLayout(self, req):
+        self.layouts[req.layout.name] = req.layout
+        return layouts_pb2.CreateLayoutResponse()
+
+    def DeleteLayout(self, req):
+        del self.layouts[req.name]
+        return layouts_pb2.DeleteLayoutResponse()
+
+
+class TestLayout:
+    def test_tile_aoi_regular(self):
+        layout = entities.Layout.regular("utm", "epsg:32631", cell_size=100, resolution=10)
+        aoi = geometry.box(2.1, 45.1, 2.3, 45.2)
+        tiles = layout.tile_aoi(aoi)
+        assert len(tiles) > 0
+        assert np.all(tiles.shapes == 100)
+        assert np.all(np.mod(tiles.transforms[:, [2, 5]], 1000) == 0)
+
+        # All the tiles intersect the AOI and the tiles cover the AOI
+        aoi_utm = entities.tile.to_crs(shapely.segmentize(aoi, 0.01), 4326, "epsg:32631")
+        footprints = tiles.footprints()
+        assert np.all(shapely.intersects(footprints, aoi_utm))
+        assert shapely.union_all(footprints).buffer(1).contains(aoi_utm)
+
+    def test_tile_aoi_web_mercator(self):
+        z = 10
+        layout = entities.Layout.web_mercator("wm", z_level=z, cell_size=256)
+        aoi = geometry.box(2.2, 48.8, 2.5, 48.9)
+        tiles = layout.tile_aoi(aoi)
+        # XYZ tiles covering Paris at zoom 10
+        xs = np.round((tiles.transforms[:, 2] + 20037508.342789244) / (2 * 20037508.342789244) * (1 << z))
+        ys = np.round((20037508.342789244 - tiles.transforms[:, 5]) / (2 * 20037508.342789244) * (1 << z))
+        assert sorted(zip(xs, ys)) == [(518, 352), (519, 352)]
+
+    def test_tile_aoi_singlecell(self):
+        layout = entities.Layout.single_cell("single", "epsg:4326", resolution=0.1)
+        tiles = layout.tile_aoi(geometry.box(2, 45, 3, 46))
+        assert len(tiles) == 1
+        assert tiles[0].shape == (10, 10)
+
+    def test_tile_aoi_undefined_cell_size(self):
+        layout = entities.Layout("utm", [], {"grid": "regular", "crs": "epsg:32631", "resolution": "10"}, (256, 256))
+        assert not layout.can_tile_locally()
+        with pytest.raises(ValueError):
+            layout.tile_aoi(geometry.box(2.1, 45.1, 2.3, 45.2))
+
+    def test_client_layout_cache(self):
+        client = Client("127.0.0.1:0", verbose=False)
+        client.stub = FakeLayoutStub()
+        aoi = geometry.box(2.1, 45.1, 2.3, 45.2)
+        client.create_layout(entities.Layout.regular("utm", "epsg:32631", cell_size=100, resolution=10))
+        assert np.all(client.tile_aoi(aoi, layout_name="utm").shapes == 100)
+
+        client.delete_layout("utm")
+        client.create_layout(entities.Layout.regular("utm", "epsg:32631", cell_size=200, resolution=10))
+        assert np.all(client.tile_aoi(aoi, layout_name="utm").shapes == 200)
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from geocube.entities import Record
+
+
+def records(n=50, tzinfo=None):
+    start = datetime(2021, 1, 1, tzinfo=tzinfo)
+    return [Record(id=f"id{i}", name="name", datetime=start + timedelta(hours=17 * i),
+                   tags={"sat": f"S2{'AB'[i % 2]}"} if i % 3 else {}, aoi_id="aoi") for i in range(n)]
+
+
+def group_by_dict(rs, func_key):
+    """ Reference implementation of Record.group_by """
+    groups = {}
+    for r in rs:
+        groups.setdefault(func_key(r), []).append(r)
+    return list(groups.values())
+
+
+class TestRecord:
+    @pytest.mark.parametrize("func_key", [Record.key_date, Record.key_datetime, Record.key_week, Record.key_month,
+                                          Record.key_tag("sat")])
+    def test_group_by(self, func_key):
+        rs = records()
+        assert Record.group_by(rs, func_key) == group_by_dict(rs, func_key)
+        assert Record.group_by([rs[:10], rs[10:]], func_key) == group_by_dict(rs, func_key)
+
+    def test_group_by_aware_datetimes(self):
+        rs = records(tzinfo=timezone(timedelta(hours=10)))
+        assert Record.group_by(rs, Record.key_week) == group_by_dict(rs, Record.key_week)
+        assert Record.group_by(rs[:5] + records(), Record.key_month) == \
+            group_by_dict(rs[:5] + records(), Record.key_month)
+
+    def test_key_functions(self):
+        r = records()[10]
+        assert r.datetime == datetime(2021, 1, 8, 2)
+        assert Record.key_week(r) == datetime(2021, 1, 4).date()
+        assert Record.key_month(r) == datetime(2021, 1, 1).date()
+        assert Record.key_tag("sat")(r) == "S2A" and Record.key_tag("sat")(records()[0]) is None
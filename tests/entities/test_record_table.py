@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from geocube import Client, entities
+from geocube.entities import Record, RecordTable
+from geocube.testing import FakeCatalog, FakeGeocube, FakeServer
+
+
+class TestRecordTable:
+    @staticmethod
+    def records(n=10):
+        start = datetime(2021, 1, 1)
+        return [Record(id=f"id{i}", name=f"name{i % 3}", datetime=start + timedelta(hours=7 * i),
+                       tags={"sat": "S2A" if i % 2 else "S2B", **({"cloud": str(i)} if i < 5 else {})},
+                       aoi_id=f"aoi{i % 2}") for i in range(n)]
+
+    def test_from_records(self):
+        records = self.records()
+        table = RecordTable.from_records(records)
+        assert len(table) == 10
+        assert table[3].id == "id3" and table[3].name == "name0" and table[-1].id == "id9"
+        assert [row.to_record() for row in table] == records
+        assert table[7].tags == {"sat": "S2A"}
+        assert list(table.tag("cloud")) == ["0", "1", "2", "3", "4"] + [None] * 5
+        assert table.names_column.categories.tolist() == ["name0", "name1", "name2"]
+        assert table.to_records() == records
+
+    def test_filter(self):
+        table = RecordTable.from_records(self.records())
+        assert table.filter(name="name1").ids.tolist() == ["id1", "id4", "id7"]
+        assert table.filter(name="name[12]", aoi_id="aoi0").ids.tolist() == ["id2", "id4", "id8"]
+        assert table.filter(tags={"sat": "S2A", "cloud": "*"}).ids.tolist() == ["id1", "id3"]
+        assert len(table.filter(tags={"unknown": "*"})) == 0
+        assert table.filter(from_time=datetime(2021, 1, 2), to_time=datetime(2021, 1, 3)).ids.tolist() == \
+            ["id4", "id5", "id6"]
+        assert table[np.array([1, 3])][1].id == "id3"
+
+    def test_group_by(self):
+        records = self.records()
+        table = RecordTable.from_records(records)
+        for by, func_key in [("date", Record.key_date), ("datetime", Record.key_datetime),
+                             ("name", lambda r: r.name), ("tag:sat", lambda r: r.tags["sat"])]:
+            expected = [entities.get_ids(rs) for rs in Record.group_by(records, func_key)]
+            assert table.grouped_ids(by) == expected
+            assert [entities.get_ids(t) for t in table.group_by(by)] == expected
+        assert table.grouped_ids(np.arange(10) // 4) == [["id0", "id1", "id2", "id3"], ["id4", "id5", "id6", "id7"],
+                                                         ["id8", "id9"]]
+        assert table.grouped_ids() == [[f"id{i}"] for i in range(10)]
+
+    def test_concat(self):
+        records = self.records()
+        table = RecordTable.concat([RecordTable.from_records(records[:3]), RecordTable.from_records(records[6:])])
+        assert table.to_records() == records[:3] + records[6:]
+
+    def test_cube_params(self):
+        table = RecordTable.from_records(self.records())
+        params = entities.CubeParams.from_records(table, "epsg:3857", entities.geo_transform(0, 0, 10), (10, 10), "i")
+        assert params.records == [[f"id{i}"] for i in range(10)]
+        params.records = table.group_by("date")
+        assert params.records == [["id0", "id1", "id2", "id3"], ["id4", "id5", "id6"], ["id7", "id8", "id9"]]
+        assert entities.get_id(table[2]) == "id2"
+
+    def test_list_record_table(self):
+        with FakeServer(FakeGeocube(catalog=FakeCatalog(records=500))) as server:
+            client = Client(server.uri, verbose=False)
+            table = client.list_record_table()
+            assert len(table) == 500
+            assert table.to_records() == client.list_records(limit=0)
+            assert len(table.filter(name="record-1")) == 5
+
+    def test_grouped_records_pb(self):
+        records = self.records(100)
+        table = RecordTable.from_records(records)
+        for by in ["week", "month", Record.key_week, Record.key_tag("sat")]:
+            pb = table.grouped_records_pb(by)
+            assert [list(g.ids) for g in pb.records] == table.grouped_ids(by)
+        assert [list(g.ids) for g in table.grouped_records_pb().records] == table.grouped_ids()
+
+        params = entities.CubeParams.from_records(table.grouped_records_pb("week"), "epsg:3857",
+                                                  entities.geo_transform(0, 0, 10), (10, 10), "i")
+        assert params.records_pb() == table.grouped_records_pb("week")
+        assert params.records == [entities.get_ids(rs) for rs in Record.group_by(records, Record.key_week)]
+        params.records[0].append("id99")
+        assert list(params.records_pb().records[0].ids)[-1] == "id99"
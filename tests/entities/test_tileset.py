@@ -0,0 +1,42 @@
+import affine
+import numpy as np
+
+from geocube.entities import Tile, TileSet
+from geocube.pb import layouts_pb2
+
+
+class TestTileSet:
+    @staticmethod
+    def tiles():
+        return [Tile.from_bbox((i*100, 0, (i+1)*100, 50), "epsg:32631", resolution=10) for i in range(5)] + \
+               [Tile.from_bbox((0, 0, 100, 50), "epsg:32632", resolution=(10, 10))]
+
+    def test_tiles(self):
+        tiles = self.tiles()
+        tileset = TileSet.from_tiles(tiles)
+        assert len(tileset) == 6
+        assert list(tileset) == tiles
+        assert tileset[2] == tiles[2]
+        assert len(tileset[1:3]) == 2
+        np.testing.assert_allclose(tileset.bounds()[3], (300, 0, 400, 50))
+        np.testing.assert_allclose(tileset.bounds()[5], (0, 0, 100, 50))
+
+    def test_geoseries(self):
+        tiles = self.tiles()
+        gs = TileSet.from_tiles(tiles).geoseries("epsg:4326")
+        for tile, geom in zip(tiles, gs):
+            assert geom.equals_exact(tile.geometry(4326), 1e-9)
+        assert Tile.to_geoseries(tiles).crs == gs.crs
+
+    def test_expand(self):
+        tiles = self.tiles()
+        expanded = TileSet.from_tiles(tiles).expand(4, center=True)
+        for tile, e in zip(tiles, expanded):
+            assert e.shape == (tile.shape[0] + 4, tile.shape[1] + 4)
+            assert e.transform.almost_equals(tile.transform * affine.Affine.translation(-2, -2))
+
+    def test_from_pb(self):
+        pb = [layouts_pb2.Tile(crs="epsg:3857", transform=layouts_pb2.GeoTransform(
+            a=10, b=1, c=0, d=20, e=0, f=-1), size_px=layouts_pb2.Size(width=3, height=4))]
+        tileset = TileSet.from_pb(pb)
+        assert tileset[0] == Tile.from_pb(pb[0])
@@ -0,0 +1,119 @@
+import time
+
+import numpy as np
+import pytest
+
+from geocube import entities, sdk
+from geocube.testing import FakeCatalog, FakeCube, FakeGeocube, FakeServer
+
+
+@pytest.fixture
+def server():
+    cube = FakeCube(dtype="uint8", bands=2)
+    with FakeServer(FakeGeocube(cube, FakeCatalog(dtype="uint8"))) as server:
+        yield server
+
+
+def cube_params(n=4, shape=(16, 8)):
+    return entities.CubeParams.from_records([f"record-{i}" for i in range(n)], "epsg:3857",
+                                            entities.geo_transform(0, 0, 10), shape, "instance-0")
+
+
+def slow_callback(image, grouped_records):
+    time.sleep(0.05)
+    if grouped_records[0].id == "record-2":
+        raise ValueError("invalid image")
+    return image.astype("float32") * np.float32(2)
+
+
+class TestGetCube:
+    def test_dtype(self, server):
+        expected = server.geocube.cube.image(16, 8)
+        timeseries, records = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params())
+        assert timeseries.shape == (4, 8, 16, 2) and timeseries.dtype == np.float64 and len(records) == 4
+        np.testing.assert_array_equal(timeseries[2], expected)
+
+        timeseries, _ = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params(), dtype=None)
+        assert timeseries.dtype == np.uint8
+        np.testing.assert_array_equal(timeseries[3], expected)
+
+        timeseries, _ = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params(), dtype="float32",
+                                     image_callback=lambda image: image / 2)
+        np.testing.assert_array_equal(timeseries[0], expected / 2)
+
+    def test_mask_nodata(self, server):
+        expected = server.geocube.cube.image(16, 8)
+        timeseries, _ = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params(), dtype="float32",
+                                     mask_nodata=True)
+        assert timeseries.dtype == np.float32
+        np.testing.assert_array_equal(np.isnan(timeseries[1]), expected == 0)
+        np.testing.assert_array_equal(np.nan_to_num(timeseries[1]), expected)
+
+        timeseries, _ = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params(), dtype=None, mask_nodata=True)
+        assert isinstance(timeseries, np.ma.MaskedArray) and timeseries.dtype == np.uint8
+        np.testing.assert_array_equal(timeseries.mask[2], expected == 0)
+        assert timeseries.mean() == expected[expected != 0].mean()
+
+    def test_mask_nodata_callback(self, server):
+        image = server.geocube.cube.image(16, 8).astype("float64")
+        expected = np.where((image[..., 0] == 0) | (image[..., 1] == 0), np.nan, image[..., 0] - image[..., 1])
+
+        def difference(image):
+            assert isinstance(image, np.ma.MaskedArray)
+            return image[..., 0] - image[..., 1].astype("float64")
+
+        timeseries, _ = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params(), image_callback=difference,
+                                     mask_nodata=True)
+        assert timeseries.shape == (4, 8, 16)
+        np.testing.assert_array_equal(timeseries[1], expected)
+
+        timeseries, _ = sdk.get_cube(sdk.ConnectionParams(server.uri), cube_params(), dtype="int16", mask_nodata=True,
+                                     image_callback=lambda image: image[..., 0].astype("int16") - image[..., 1])
+        assert isinstance(timeseries, np.ma.MaskedArray) and timeseries.shape == (4, 8, 16)
+        np.testing.assert_array_equal(timeseries.mask[2], np.isnan(expected))
+        np.testing.assert_array_equal(timeseries[2].filled(0), np.nan_to_num(expected))
+
+    def test_get_cubes(self, server):
+        results = sdk.get_cubes(sdk.ConnectionParams(server.uri), cube_params(), {"fake/variable": "master"},
+                                dtype=None, mask_nodata=True)
+        cube, records = results["fake/variable.master"]
+        assert isinstance(cube, np.ma.MaskedArray) and len(records) == 4
+
+    def test_get_cubes_concurrency(self):
+        with FakeServer(FakeGeocube(FakeCube(latency=0.2))) as server:
+            progress = []
+            variables = {f"variable-{i}": "master" for i in range(4)}
+            start = time.time()
+            results = sdk.get_cubes(sdk.ConnectionParams(server.uri), cube_params(), variables, max_concurrency=4,
+                                    cube_callback=lambda cube, variable: (len(cube), variable.instance_name),
+                                    mp_log_queue=lambda _, value: progress.append(value))
+            assert time.time() - start < 0.6
+            assert results == {f"variable-{i}.master": (4, "master") for i in range(4)}
+            assert list(results) == [f"variable-{i}.master" for i in range(4)]
+            assert progress == [0.25, 0.5, 0.75, 1]
+            assert server.geocube.calls["GetCube"] == 4
+
+    @pytest.mark.parametrize("executor", ["thread", "process"])
+    def test_callback_workers(self, server, executor):
+        expected = server.geocube.cube.image(16, 8)
+        params = cube_params(8)
+        with pytest.raises(sdk.ImageCallbackError) as e:
+            sdk.get_cube(sdk.ConnectionParams(server.uri), params, image_callback=slow_callback,
+                         callback_workers=4, callback_executor=executor)
+        assert list(e.value.errors) == [2] and "invalid image" in str(e.value)
+
+        params.records = [[f"record-{i}"] for i in range(8) if i != 2]
+        start = time.time()
+        timeseries, records = sdk.get_cube(sdk.ConnectionParams(server.uri), params, image_callback=slow_callback,
+                                           callback_workers=4, callback_executor=executor, dtype=None,
+                                           mask_nodata=True)
+        if executor == "thread":
+            assert time.time() - start < 7 * 0.05
+        assert timeseries.dtype == np.float32 and [rs[0].id for rs in records] == [f"record-{i}" for i in range(8)
+                                                                                   if i != 2]
+        for image in timeseries:
+            np.testing.assert_array_equal(np.nan_to_num(image), expected.astype("float32") * 2)
+            np.testing.assert_array_equal(np.isnan(image), expected == 0)
+
+        with pytest.raises(ValueError):
+            sdk.get_cube(sdk.ConnectionParams(server.uri), params, callback_workers=1, callback_executor="unknown")
@@ -1,12 +1,15 @@
 import functools
 import logging
+import queue
 import sys
+import threading
 import time
 from random import random
 import pebble
 
 from geocube.sdk import MessageType, multiprocess, Status, ProcessAbnormalTermination, ProcessTimeoutError, \
     ProcessPicklingError
+from geocube.sdk.queue import _QueueIterator
 
 
 def rand_sleep_success(max_time):
@@ -14,6 +17,11 @@ def rand_sleep_success(max_time):
     return True
 
 
+def rand_sleep_end_time(max_time):
+    time.sleep(random()*max_time)
+    return time.time()
+
+
 def rand_sleep_failed(max_time):
     time.sleep(random()*max_time)
     raise NameError("Rand Error")
@@ -170,3 +178,25 @@ class TestMultiProcess:
         for i, r in mprocesses.results().items():
             assert r[0] == Status.FAILED.name
             assert isinstance(r[1][0], ProcessPicklingError)
+
+    def test_join_latency(self):
+        funcs = {str(i): functools.partial(rand_sleep_end_time, 0.01) for i in range(40)}
+        with pebble.ProcessPool(4) as pool:
+            mprocesses = multiprocess.MultiProcesses(pool, funcs, timeout_sec=10, log_lvl=logging.DEBUG)
+            mprocesses.join()
+            end = time.time()
+        results = mprocesses.results().values()
+        assert all(status == Status.DONE.name for status, _ in results)
+        # join returns as soon as the last process ends (it used to poll every second)
+        assert end - max(end_time for _, end_time in results) < 0.5
+
+    def test_queue_iterator(self):
+        q = queue.Queue()
+        threading.Timer(0.1, q.put, [0]).start()
+        start = time.time()
+        assert list(_QueueIterator(q, timeout=5)) == [0]
+        assert time.time() - start < 1
+        q.put(1)
+        q.put(2)
+        assert list(_QueueIterator(q, timeout=5)) == [1, 2]
+        assert list(_QueueIterator(q, timeout=0.1)) == []
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from geocube import entities, sdk
+from geocube.testing import FakeCatalog, FakeCube, FakeGeocube, FakeServer
+
+
+def reduce(reducer, cube, no_data=0):
+    start = datetime(2021, 1, 1)
+    for i, image in enumerate(cube):
+        reducer.update(image, image != no_data, start + timedelta(days=i))
+    return reducer.result()
+
+
+@pytest.fixture
+def cube():
+    rng = np.random.default_rng(0)
+    cube = rng.integers(0, 200, size=(30, 8, 6, 2)).astype("uint8")
+    cube[:, 0, 0] = 0
+    return cube
+
+
+class TestReducers:
+    def test_count(self, cube):
+        np.testing.assert_array_equal(reduce(sdk.Count(), cube), (cube != 0).sum(axis=0))
+
+    def test_mean_var(self, cube):
+        masked = np.ma.masked_equal(cube.astype(float), 0)
+        result = reduce(sdk.MeanVar(ddof=1), cube)
+        np.testing.assert_allclose(result["mean"], masked.mean(axis=0).filled(np.nan))
+        np.testing.assert_allclose(result["var"], masked.var(axis=0, ddof=1).filled(np.nan))
+        np.testing.assert_array_equal(result["count"][0, 0], 0)
+
+    def test_min_max(self, cube):
+        masked = np.ma.masked_equal(cube.astype(float), 0)
+        result = reduce(sdk.MinMax(), cube)
+        np.testing.assert_array_equal(result["min"], masked.min(axis=0).filled(np.nan))
+        np.testing.assert_array_equal(result["max"], masked.max(axis=0).filled(np.nan))
+        expected = np.datetime64("2021-01-01", "us") + masked.argmax(axis=0) * np.timedelta64(1, "D")
+        assert np.isnat(result["argmax_date"][0, 0]).all()
+        np.testing.assert_array_equal(result["argmax_date"][1:], expected[1:])
+
+    def test_percentiles(self, cube):
+        result = reduce(sdk.Percentiles(q=[10, 50, 90], bins=200, value_range=(0, 200)), cube)
+        masked = np.where(cube == 0, np.nan, cube.astype(float))
+        for q in [10, 50, 90]:
+            assert np.isnan(result[f"p{q}"][0, 0]).all()
+            expected = np.nanpercentile(masked[:, 1:], q, axis=0, method="inverted_cdf")
+            assert np.abs(result[f"p{q}"][1:] - expected).max() <= 1
+
+    def test_percentiles_range(self):
+        reducer = sdk.Percentiles()
+        with pytest.raises(ValueError):
+            reducer.update(np.zeros((1, 1, 1)), np.ones((1, 1, 1), dtype=bool), datetime(2021, 1, 1))
+        reducer.start(entities.DataFormat.from_user(("u1", 0, 0, 100)))
+        assert reducer.value_range == (0, 100)
+
+    def test_reduce_cube(self):
+        cube = FakeCube(dtype="uint8", bands=2)
+        with FakeServer(FakeGeocube(cube, FakeCatalog(dtype="uint8"))) as server:
+            params = entities.CubeParams.from_records([f"record-{i}" for i in range(5)], "epsg:3857",
+                                                      entities.geo_transform(0, 0, 10), (16, 8), "instance-0")
+            progress = []
+            results, records = sdk.reduce_cube(sdk.ConnectionParams(server.uri), params,
+                                               {"count": sdk.Count(), "stats": sdk.MeanVar(), "minmax": sdk.MinMax()},
+                                               image_callback=lambda image: image * 2.,
+                                               mp_log_queue=lambda _, value: progress.append(value))
+        image = cube.image(16, 8)
+        assert len(records) == 5 and progress[-1] == 1
+        np.testing.assert_array_equal(results["count"], np.where(image == 0, 0, 5))
+        np.testing.assert_array_equal(results["stats"]["mean"], np.where(image == 0, np.nan, image * 2.))
+        assert results["minmax"]["argmin_date"][0, 1, 0] == np.datetime64(records[0][0].datetime, "us")
+
+    def test_reduce_cube_callback(self):
+        cube = FakeCube(dtype="uint8", bands=2)
+        with FakeServer(FakeGeocube(cube, FakeCatalog(dtype="uint8"))) as server:
+            params = entities.CubeParams.from_records([f"record-{i}" for i in range(3)], "epsg:3857",
+                                                      entities.geo_transform(0, 0, 10), (16, 8), "instance-0")
+            with pytest.raises(ValueError):
+                sdk.reduce_cube(sdk.ConnectionParams(server.uri), params, {"pct": sdk.Percentiles()},
+                                image_callback=lambda image: image * 2.)
+
+            # The callback changes the shape of the slices and the range of the values
+            results, _ = sdk.reduce_cube(sdk.ConnectionParams(server.uri), params,
+                                         {"count": sdk.Count(), "pct": sdk.Percentiles([50], bins=502,
+                                                                                       value_range=(0, 502))},
+                                         image_callback=lambda image: image[..., 0] * 2.)
+        image = cube.image(16, 8)[..., 0]
+        np.testing.assert_array_equal(results["count"], np.where(image == 0, 0, 3))
+        np.testing.assert_allclose(results["pct"]["p50"], np.where(image == 0, np.nan, image * 2.), atol=1)
@@ -0,0 +1,58 @@
+import urllib.request
+from concurrent import futures
+
+import pytest
+
+from geocube import sdk
+from geocube.testing import FakeCatalog, FakeGeocube, FakeServer
+
+
+@pytest.fixture
+def server():
+    with FakeServer(FakeGeocube(catalog=FakeCatalog(latency=0.2))) as server:
+        yield server
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+class TestTileServer:
+    def test_tiles(self, server, tmp_path):
+        cache = str(tmp_path / "tiles.mbtiles")
+        with sdk.TileServer(sdk.ConnectionParams(server.uri), pool_size=2, cache=cache) as tile_server:
+            url = tile_server.url.format(instance_id="inst", z=3, x=1, y=2, record_ids="r1,r2")
+            assert get(url) == (200, b"inst:r1,r2:1,2,3")
+            assert get(url) == (200, b"inst:r1,r2:1,2,3")
+            assert get(tile_server.url.format(instance_id="inst", z=30, x=1, y=2, record_ids="r1"))[0] == 400
+            assert get(url.replace(".png", ".jpg"))[0] == 404
+            metrics = tile_server.metrics()
+            assert (metrics["requests"], metrics["memory_hits"], metrics["misses"], metrics["errors"]) == (3, 1, 2, 1)
+
+        # Served from the disk cache
+        with sdk.TileServer(sdk.ConnectionParams(server.uri), cache=cache) as tile_server:
+            assert tile_server.get_tile("inst", ["r1", "r2"], 1, 2, 3) == b"inst:r1,r2:1,2,3"
+            assert tile_server.metrics()["disk_hits"] == 1
+        assert server.geocube.calls["GetXYZTile"] == 2
+
+    def test_collapse(self, server):
+        with sdk.TileServer(sdk.ConnectionParams(server.uri)) as tile_server:
+            url = tile_server.url.format(instance_id="inst", z=3, x=1, y=2, record_ids="r1")
+            with futures.ThreadPoolExecutor(max_workers=10) as executor:
+                results = list(executor.map(get, [url] * 10))
+            assert all(r == (200, b"inst:r1:1,2,3") for r in results)
+            assert server.geocube.calls["GetXYZTile"] == 1
+            assert tile_server.metrics()["collapsed"] + tile_server.metrics()["memory_hits"] == 9
+
+    def test_internal_error(self, server, monkeypatch):
+        with sdk.TileServer(sdk.ConnectionParams(server.uri)) as tile_server:
+            def fetch(*_):
+                raise RuntimeError("unexpected")
+            monkeypatch.setattr(tile_server, "_fetch", fetch)
+            url = tile_server.url.format(instance_id="inst", z=3, x=1, y=2, record_ids="r1")
+            assert get(url) == (500, b"Internal error: unexpected")
+            assert tile_server.metrics()["errors"] == 1
@@ -0,0 +1,99 @@
+import json
+from concurrent import futures
+
+import pytest
+
+from geocube import entities, sdk
+from geocube.sdk import tiles as sdk_tiles
+from geocube.testing import FakeCube, FakeGeocube, FakeServer
+
+
+@pytest.fixture
+def server():
+    with FakeServer(FakeGeocube(FakeCube(slices=3))) as server:
+        yield server
+
+
+def tiles(n=4):
+    return [entities.Tile.from_geotransform(entities.geo_transform(100 * i, 0, 10), "epsg:3857", (16, 8))
+            for i in range(n)]
+
+
+def collection():
+    return sdk.Collection(instances=["instance-0"], records=[f"record-{i}" for i in range(3)])
+
+
+def shape_callback(timeseries):
+    return list(timeseries.shape)
+
+
+def double(image):
+    return image * 2
+
+
+class TestMapTiles:
+    def test_map_tiles(self, server):
+        sdk_tiles._clients.clear()
+        results = sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), shape_callback,
+                                max_workers=2)
+        assert list(results) == [sdk.tile_id(t) for t in tiles()]
+        assert all(r == ("DONE", [3, 8, 16, 1]) for r in results.values())
+        assert server.geocube.calls["GetCube"] == 4
+        # One connection per worker process
+        assert len(sdk_tiles._clients) == 1
+
+    def test_checkpoint(self, server, tmp_path):
+        checkpoint = str(tmp_path / "checkpoint.jsonl")
+        calls = []
+
+        def callback(cube, tile_id, instance):
+            calls.append(tile_id)
+            if len(calls) == 2:
+                raise ValueError("failure")
+            return instance.instance_name
+
+        results = sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), callback,
+                                checkpoint=checkpoint, max_workers=1)
+        assert [r[0] for r in results.values()] == ["DONE", "FAILED", "DONE", "DONE"]
+        with open(checkpoint) as f:
+            assert "job" in json.loads(f.readline())
+            assert [json.loads(line)["tile"] for line in f] == [sdk.tile_id(t) for t in tiles()[0:1] + tiles()[2:]]
+
+        calls.clear()
+        with futures.ThreadPoolExecutor(2) as executor:
+            results = sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), callback,
+                                    checkpoint=checkpoint, executor=executor)
+        assert calls == [sdk.tile_id(tiles()[1])]
+        assert all(r == ("DONE", "master") for r in results.values())
+
+    def test_checkpoint_another_job(self, server, tmp_path):
+        checkpoint = str(tmp_path / "checkpoint.jsonl")
+        sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), shape_callback, checkpoint=checkpoint)
+        other = sdk.Collection(instances=["instance-0"], records=["record-0"])
+        with pytest.raises(ValueError):
+            sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), other, shape_callback, checkpoint=checkpoint)
+        with pytest.raises(ValueError):
+            sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), checkpoint=checkpoint)
+        assert server.geocube.calls["GetCube"] == 4
+
+    def test_checkpoint_not_serializable(self, server, tmp_path):
+        with pytest.raises(TypeError):
+            sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), lambda cube: object(),
+                          checkpoint=str(tmp_path / "checkpoint.jsonl"))
+
+    def test_process_executor(self, server):
+        results = sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), shape_callback,
+                                image_callback=double, executor="process", max_workers=2)
+        assert all(r == ("DONE", [3, 8, 16, 1]) for r in results.values())
+        assert server.geocube.calls["GetCube"] == 4
+
+    def test_tile_id(self):
+        tile = tiles(1)[0]
+        other = entities.Tile.from_geotransform(entities.geo_transform(0, 0, 20), "epsg:3857", (16, 8))
+        assert sdk.tile_id(tile) == sdk.tile_id(tiles(1)[0]) and sdk.tile_id(tile) != sdk.tile_id(other)
+        assert sdk_tiles._executor_workers(futures.ThreadPoolExecutor(3), 8) == 3
+        assert sdk_tiles._executor_workers(object(), 8) == 8
+
+    def test_errors(self, server):
+        with pytest.raises(ValueError):
+            sdk.map_tiles(sdk.ConnectionParams(server.uri), tiles(), collection(), executor="unknown")
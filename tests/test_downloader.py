@@ -0,0 +1,55 @@
+import grpc
+import numpy as np
+import pytest
+
+from geocube import Client, DownloaderPool, entities, utils
+from geocube.sdk import ConnectionParams
+from geocube.testing import FakeCube, FakeGeocube, FakeServer
+
+
+@pytest.fixture
+def servers():
+    cube = FakeCube(bands=2, dtype="float32", chunk_size=1000)
+    with FakeServer(FakeGeocube(cube)) as s1, FakeServer(FakeGeocube(cube)) as s2:
+        yield s1, s2
+
+
+def get_cube(client, n=10):
+    params = entities.CubeParams.from_records([f"record-{i}" for i in range(n)], "epsg:3857",
+                                              entities.geo_transform(0, 0, 10), (16, 8), "instance-0")
+    return client.get_cube(params, verbose=False)
+
+
+class TestDownloaderPool:
+    def test_get_cube(self, servers):
+        client = Client(servers[0].uri, verbose=False)
+        pool = DownloaderPool([s.uri for s in servers], verbose=False, batch_size=3)
+        client.use_downloader(pool)
+        images, records = get_cube(client)
+        assert [rs[0].id for rs in records] == [f"record-{i}" for i in range(10)]
+        for image in images:
+            np.testing.assert_array_equal(image, servers[0].geocube.cube.image(16, 8))
+        assert sum(s.downloader.calls["DownloadCube"] for s in servers) == 4
+        assert all(s.downloader.calls["DownloadCube"] > 0 for s in servers)
+        assert sum(m["batches"] for m in pool.metrics().values()) == 4
+
+    def test_retry_on_another_replica(self, servers):
+        client = Client(servers[0].uri, verbose=False)
+        pool = DownloaderPool([s.uri for s in servers], verbose=False, batch_size=2)
+        client.use_downloader(pool)
+        servers[1].downloader.inject_error("DownloadCube", grpc.StatusCode.UNAVAILABLE, count=2)
+        _, records = get_cube(client)
+        assert [rs[0].id for rs in records] == [f"record-{i}" for i in range(10)]
+        assert pool.metrics()[servers[1].uri]["failures"] == 2
+
+    def test_errors(self, servers):
+        client = Client(servers[0].uri, verbose=False)
+        client.use_downloader(DownloaderPool([s.uri for s in servers], verbose=False, batch_size=2, max_attempts=2))
+        for s in servers:
+            s.downloader.inject_error("DownloadCube", grpc.StatusCode.UNAVAILABLE, count=10)
+        with pytest.raises(utils.GeocubeError):
+            get_cube(client)
+
+    def test_connection_params(self, servers):
+        pool = ConnectionParams(servers[0].uri, downloader=",".join(s.uri for s in servers)).new_downloader()
+        assert isinstance(pool, DownloaderPool) and len(pool.replicas) == 2
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ["geopandas", "pandas", "rasterio", "parse", "pyproj", "dask", "distributed", "matplotlib"]
+
+
+def loaded_modules(code: str):
+    """ Returns the heavy modules loaded by code, in a fresh interpreter """
+    code += f"\nimport sys\nprint(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                         env={**os.environ, "GRPC_ENABLE_FORK_SUPPORT": "1"}).stdout
+    return [m for m in out.strip().split(",") if m]
+
+
+class TestImports:
+    def test_lazy_imports(self):
+        assert loaded_modules("import geocube") == []
+        assert loaded_modules("from geocube import Client, entities, utils\n"
+                              "from geocube.sdk import ConnectionParams\n"
+                              "entities.CubeParams, entities.Record, entities.Tile, entities.get_ids, "
+                              "utils.GeocubeError") == []
+
+    def test_lazy_attributes(self):
+        import geocube
+        from geocube import entities, sdk
+        assert geocube.Client.__name__ == "Client"
+        assert "Client" in dir(geocube) and "Record" in dir(entities)
+        assert entities.tile.Tile is entities.Tile
+        assert sdk.ConnectionParams.__name__ == "ConnectionParams"
+        with pytest.raises(AttributeError):
+            geocube.NotAnAttribute
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from geocube.limiter import ConcurrencyLimiter, UNARY, STREAM
+
+
+class TestConcurrencyLimiter:
+    def test_fifo(self):
+        limiter = ConcurrencyLimiter(max_unary=1)
+        assert limiter.acquire(UNARY)
+        order = []
+
+        def wait(i):
+            limiter.acquire(UNARY)
+            order.append(i)
+            limiter.release(UNARY)
+
+        threads = []
+        for i in range(5):
+            threads.append(threading.Thread(target=wait, args=(i,)))
+            threads[-1].start()
+            while limiter.metrics()[UNARY]["waiting"] <= i:
+                time.sleep(0.001)
+        assert not limiter.acquire(UNARY, timeout=0.01)
+        limiter.release(UNARY)
+        for t in threads:
+            t.join()
+        assert order == list(range(5))
+        assert limiter.metrics()[UNARY]["in_flight"] == 0
+
+    def test_aimd(self):
+        limiter = ConcurrencyLimiter(max_streams=8, min_limit=2, decrease_interval=0)
+        limiter.overloaded(STREAM)
+        assert limiter.metrics()[STREAM]["limit"] == 4
+        for _ in range(3):
+            limiter.overloaded(STREAM)
+        assert limiter.metrics()[STREAM]["limit"] == 2
+        for _ in range(100):
+            limiter.succeeded(STREAM, 0.01)
+        assert limiter.metrics()[STREAM]["limit"] == 8
+        limiter.succeeded(STREAM, 1)
+        assert limiter.metrics()[STREAM]["limit"] == 4
+        assert limiter.metrics()[UNARY]["limit"] == 64
+
+    def test_latency_per_method(self):
+        limiter = ConcurrencyLimiter(max_unary=8, decrease_interval=0)
+        for _ in range(100):
+            limiter.succeeded(UNARY, 0.001, "GetVariable")
+        # A slower method is not a spike of a fast one
+        limiter.succeeded(UNARY, 0.5, "ListRecords")
+        limiter.succeeded(UNARY, 0.4, "ListRecords")
+        assert limiter.metrics()[UNARY]["limit"] == 8
+        limiter.succeeded(UNARY, 0.1, "GetVariable")
+        assert limiter.metrics()[UNARY]["limit"] == 4
+        # Not a congestion signal (time to the first response of a stream)
+        limiter.succeeded(UNARY, None, "GetVariable")
+        assert limiter.metrics()[UNARY]["limit"] == 4
+
+    def test_shared(self):
+        assert ConcurrencyLimiter.shared("test", max_unary=2) is ConcurrencyLimiter.shared("test")
+        assert ConcurrencyLimiter.shared("test").metrics()[UNARY]["limit"] == 2
+        assert ConcurrencyLimiter.shared("other") is not ConcurrencyLimiter.shared("test")
@@ -0,0 +1,93 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+import rasterio
+
+from geocube import FileFormatGTiff, LocalDownloader, entities
+from geocube.pb import datasetMeta_pb2
+
+TRANSFORM = entities.geo_transform(0, 100, 10)
+
+
+def write_geotiff(filename, image, transform=TRANSFORM, crs="epsg:3857", no_data=None):
+    with rasterio.open(filename, "w", driver="GTiff", width=image.shape[2], height=image.shape[1],
+                       count=image.shape[0], dtype=image.dtype.name, crs=crs, transform=transform,
+                       nodata=no_data) as dst:
+        dst.write(image)
+    return filename
+
+
+def internal_meta(uri, dformat, range_min, range_max, exponent=1., bands=()):
+    return datasetMeta_pb2.InternalMeta(container_uri=uri, bands=bands, dformat=dformat.to_pb(),
+                                        range_min=range_min, range_max=range_max, exponent=exponent)
+
+
+def cube_metadata(slices, dformat, transform=TRANSFORM, shape=(10, 10), crs="epsg:3857",
+                  resampling_alg=entities.Resampling.near):
+    record = entities.Record(id="record", name="name", datetime=datetime(2021, 1, 1), tags={}, aoi_id="aoi")
+    return entities.CubeMetadata(
+        slices=[entities.SliceMetadata(grouped_records=[record], metadata=metas, bytes=0) for metas in slices],
+        crs=crs, transform=transform, shape=shape, dformat=entities.DataFormat.from_user(dformat),
+        resampling_alg=resampling_alg)
+
+
+class TestLocalDownloader:
+    def test_rescale(self, tmp_path):
+        image = np.arange(200, dtype="uint8").reshape((2, 10, 10))
+        uri = write_geotiff(str(tmp_path / "a.tif"), image)
+        dformat = entities.DataFormat("uint8", 0, 200, 255)
+        metadata = cube_metadata([[internal_meta(uri, dformat, 0, 1, bands=[2])],
+                                  [internal_meta(uri, dformat, 0, 1, exponent=2)]], ("f4", np.nan, 0, 1))
+        images, records = LocalDownloader().get_cube(metadata, verbose=False)
+        assert len(images) == 2 and records[0][0].id == "record"
+        assert images[0].shape == (10, 10, 1) and images[0].dtype == np.float32
+        np.testing.assert_allclose(images[0][..., 0], image[1] / 200, rtol=1e-6)
+        np.testing.assert_allclose(np.moveaxis(images[1], -1, 0), (image / 200) ** 2, rtol=1e-6)
+
+    def test_merge(self, tmp_path):
+        dformat = entities.DataFormat("int16", 0, 1000, -1)
+        left = write_geotiff(str(tmp_path / "left.tif"), np.full((1, 10, 6), 100, dtype="int16"), no_data=-1)
+        right = np.full((1, 10, 6), 200, dtype="int16")
+        right[0, :5] = -1
+        right = write_geotiff(str(tmp_path / "right.tif"), right, entities.geo_transform(40, 100, 10), no_data=-1)
+        metas = [internal_meta(left, dformat, 0, 10), internal_meta(right, dformat, 0, 10)]
+        images, _ = LocalDownloader().get_cube(cube_metadata([metas], ("u1", 255, 0, 10)), verbose=False)
+        expected = np.full((10, 10), 255)
+        expected[:, :6] = 1
+        expected[5:, 6:] = 2
+        np.testing.assert_array_equal(images[0][..., 0], expected)
+
+    def test_reproject(self, tmp_path):
+        image = np.arange(400, dtype="float32").reshape((1, 20, 20))
+        uri = write_geotiff(str(tmp_path / "a.tif"), image, entities.geo_transform(0, 100, 5))
+        dformat = entities.DataFormat("float32", 0, 400, np.nan)
+        metas = [internal_meta(uri, dformat, 0, 400)]
+        images, _ = LocalDownloader().get_cube(cube_metadata([metas], ("f4", np.nan, 0, 400),
+                                                             resampling_alg=entities.Resampling.average),
+                                               verbose=False)
+        np.testing.assert_allclose(images[0][..., 0], image[0].reshape((10, 2, 10, 2)).mean(axis=(1, 3)))
+
+        # Outside the container
+        metadata = cube_metadata([metas], ("f4", -1, 0, 400), transform=entities.geo_transform(1000, 100, 10))
+        images, _ = LocalDownloader().get_cube(metadata, verbose=False)
+        np.testing.assert_array_equal(images[0], -1)
+
+    def test_get_cube_it(self, tmp_path):
+        image = np.arange(100, dtype="uint16").reshape((1, 10, 10))
+        uri = write_geotiff(str(tmp_path / "a.tif"), image)
+        dformat = entities.DataFormat("uint16", 0, 100, 65535)
+        metadata = cube_metadata([[internal_meta(uri, dformat, 0, 100)],
+                                  [internal_meta(str(tmp_path / "missing.tif"), dformat, 0, 100)]], "u2")
+        cube = LocalDownloader().get_cube_it(metadata, file_format=FileFormatGTiff,
+                                             file_pattern=str(tmp_path / "out" / "{#}_{id}.tif"))
+        results = list(cube)
+        assert results[0][0] == str(tmp_path / "out" / "1_record.tif") and results[0][2] is None
+        with rasterio.open(results[0][0]) as ds:
+            np.testing.assert_array_equal(ds.read(), image)
+            assert ds.transform == TRANSFORM
+        assert "missing.tif" in results[1][2]
+        assert not os.path.exists(tmp_path / "out" / "2_record.tif")
+        with pytest.raises(ValueError):
+            LocalDownloader().get_cube(metadata, verbose=False)
@@ -0,0 +1,59 @@
+import logging
+from datetime import datetime
+
+from geocube import Client, DownloaderPool, PredownloadPlanner, entities
+from geocube.pb import datasetMeta_pb2
+from geocube.testing import FakeCube, FakeGeocube, FakeServer
+
+
+def cube_metadata(containers, shape=(100, 100)):
+    """ One slice per item of containers, made of one dataset per container uri """
+    record = entities.Record(id="record", name="name", datetime=datetime(2021, 1, 1), tags={}, aoi_id="aoi")
+    return entities.CubeMetadata(
+        slices=[entities.SliceMetadata(grouped_records=[record], bytes=0,
+                                       metadata=[datasetMeta_pb2.InternalMeta(container_uri=uri) for uri in uris])
+                for uris in containers],
+        crs="epsg:3857", transform=entities.geo_transform(0, 0, 10), shape=shape,
+        dformat=entities.DataFormat.from_user("u1"), resampling_alg=entities.Resampling.near)
+
+
+class TestPredownloadPlanner:
+    def test_decide(self):
+        planner = PredownloadPlanner()
+        # One container per dataset
+        assert not planner.decide(cube_metadata([["a"], ["b"], ["c"]])).predownload
+        # Each container is read by four slices
+        decision = planner.decide(cube_metadata([["a"], ["b"]] * 4))
+        assert decision.predownload and decision.coverage == 0.75 and decision.info["containers"] == 2
+        assert not planner.decide(cube_metadata([])).predownload
+
+    def test_container_shape(self):
+        planner = PredownloadPlanner(container_shape=(200, 200))
+        assert planner.decide(cube_metadata([["a"]] * 2)).coverage == 0.5
+        assert planner.decide(cube_metadata([["a"]] * 2, shape=(400, 400))).coverage == 1
+        assert not planner.decide(cube_metadata([["a"], ["b"]], shape=(20, 20))).predownload
+
+    def test_throughput(self):
+        planner = PredownloadPlanner(threshold=0.6, alpha=0.5)
+        metadata = cube_metadata([["a"], ["b"], ["c"]] * 2)
+        assert not planner.decide(metadata).predownload
+        planner.record(False, 2 ** 20, 1)
+        planner.record(True, 2 ** 20, 1)
+        planner.record(True, 5 * 2 ** 20, 1)
+        assert planner.throughputs == {False: 1, True: 3}
+        decision = planner.decide(metadata)
+        assert decision.threshold == 0.6 / 3 and decision.predownload
+
+    def test_downloader(self, caplog):
+        with FakeServer(FakeGeocube(FakeCube())) as server:
+            client = Client(server.uri, verbose=False)
+            pool = DownloaderPool([server.uri], verbose=False, batch_size=2)
+            pool.always_predownload = None
+            client.use_downloader(pool)
+            params = entities.CubeParams.from_records([f"record-{i}" for i in range(5)], "epsg:3857",
+                                                      entities.geo_transform(0, 0, 10), (16, 8), "instance-0")
+            with caplog.at_level(logging.INFO, logger="geocube.predownload"):
+                images, _ = client.get_cube(params, verbose=False)
+            assert len(images) == 5
+            assert sum("predownload=" in r.message for r in caplog.records) == 3
+            assert list(pool.planner.throughputs) == [False]
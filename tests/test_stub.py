@@ -0,0 +1,157 @@
+import threading
+import time
+from concurrent import futures
+
+import grpc
+import pytest
+
+from geocube.pb import geocube_pb2_grpc, records_pb2, variables_pb2
+from geocube.limiter import ConcurrencyLimiter, STREAM, UNARY
+from geocube.stub import Stub, Histogram
+
+
+class FlakyServicer(geocube_pb2_grpc.GeocubeServicer):
+    """ Fails the first calls of each method with UNAVAILABLE """
+    def __init__(self, failures=0, delays=()):
+        self.failures = failures
+        self.delays = list(delays)
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def _call(self, method, context):
+        with self.lock:
+            n = self.calls[method] = self.calls.get(method, 0) + 1
+            delay = self.delays[n-1] if n <= len(self.delays) else 0
+        time.sleep(delay)
+        if n <= self.failures:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "unavailable")
+        return n
+
+    def GetVariable(self, request, context):
+        n = self._call("GetVariable", context)
+        return variables_pb2.GetVariableResponse(variable=variables_pb2.Variable(id=request.id, name=str(n)))
+
+    def GetRecords(self, request, context):
+        self._call("GetRecords", context)
+        for i in request.ids:
+            yield records_pb2.GetRecordsResponseItem(record=records_pb2.Record(id=i))
+
+    def DeleteRecords(self, request, context):
+        self._call("DeleteRecords", context)
+        return records_pb2.DeleteRecordsResponse()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def _serve(servicer):
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        geocube_pb2_grpc.add_GeocubeServicer_to_server(servicer, server)
+        port = server.add_insecure_port("127.0.0.1:0")
+        server.start()
+        servers.append(server)
+        return Stub(geocube_pb2_grpc.GeocubeStub(grpc.insecure_channel(f"127.0.0.1:{port}")), timeout=5)
+    yield _serve
+    for server in servers:
+        server.stop(0)
+
+
+class TestStub:
+    def test_retries(self, serve):
+        servicer = FlakyServicer(failures=2)
+        stub = serve(servicer)
+        stub.configure("GetVariable", "GetRecords", backoff=0.01)
+        assert stub.GetVariable(variables_pb2.GetVariableRequest(id="v")).variable.name == "3"
+        assert [r.record.id for r in stub.GetRecords(records_pb2.GetRecordsRequest(ids=["a", "b"]))] == ["a", "b"]
+        metrics = stub.metrics()
+        assert metrics["GetVariable"]["retries"] == 2 and metrics["GetVariable"]["calls"] == 1
+        assert metrics["GetRecords"]["retries"] == 2 and metrics["GetRecords"]["errors"] == 0
+
+        # Not retried (not idempotent)
+        with pytest.raises(grpc.RpcError) as e:
+            stub.DeleteRecords(records_pb2.DeleteRecordsRequest(ids=["a"]))
+        assert e.value.code() == grpc.StatusCode.UNAVAILABLE
+        assert stub.metrics()["DeleteRecords"]["errors"] == 1
+
+    def test_hedging(self, serve):
+        servicer = FlakyServicer(delays=[2])
+        stub = serve(servicer)
+        stub.configure("GetVariable", hedge_after=0.1)
+        start = time.time()
+        assert stub.GetVariable(variables_pb2.GetVariableRequest(id="v")).variable.name == "2"
+        assert time.time() - start < 1
+        assert stub.metrics()["GetVariable"]["hedged"] == 1
+
+    def test_hedging_stream(self, serve):
+        servicer = FlakyServicer(delays=[2])
+        stub = serve(servicer)
+        stub.limiter = ConcurrencyLimiter()
+        stub.configure("GetRecords", hedge_after=0.1)
+        start = time.time()
+        assert [r.record.id for r in stub.GetRecords(records_pb2.GetRecordsRequest(ids=["a", "b"]))] == ["a", "b"]
+        assert time.time() - start < 1
+        assert stub.metrics()["GetRecords"]["hedged"] == 1
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+
+        with pytest.raises(ValueError):
+            stub.configure("CreateGrid", hedge_after=0.1)
+
+    def test_hedging_permits(self, serve):
+        stub = serve(FlakyServicer(delays=[0.5]))
+        stub.limiter = ConcurrencyLimiter(max_unary=1)
+        stub.configure("GetVariable", hedge_after=0.1)
+        # No permit left for the hedged request
+        assert stub.GetVariable(variables_pb2.GetVariableRequest(id="v")).variable.name == "1"
+        assert stub.metrics()["GetVariable"]["hedged"] == 0
+        assert stub.limiter.metrics()[UNARY]["in_flight"] == 0
+
+    def test_cached_calls(self, serve):
+        stub = serve(FlakyServicer(delays=[0.5]))
+        assert stub.GetVariable is stub.GetVariable
+        assert stub.config("GetVariable").timeout == 5
+        stub.timeout = 0.1
+        assert stub.config("GetVariable").timeout == 0.1
+        with pytest.raises(grpc.RpcError) as e:
+            stub.GetVariable(variables_pb2.GetVariableRequest(id="v"))
+        assert e.value.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+
+    def test_limiter(self, serve):
+        stub = serve(FlakyServicer())
+        stub.limiter = ConcurrencyLimiter(max_streams=1)
+        req = records_pb2.GetRecordsRequest(ids=["a", "b"])
+
+        # The permit is taken on the first response: creating streams never blocks
+        stream, other = stub.GetRecords(req), stub.GetRecords(req)
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+        next(stream)
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 1
+        assert len(list(stream)) == 1
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+        assert len(list(other)) == 2
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+
+        stream = stub.GetRecords(req)
+        next(stream)
+        stream.cancel()
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+
+        stub.GetRecords(req).cancel()
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+
+        # Timeout while waiting for the permit held by another stream
+        stub.timeout = 0.1
+        stream = stub.GetRecords(req)
+        next(stream)
+        with pytest.raises(grpc.RpcError) as e:
+            next(stub.GetRecords(req))
+        assert e.value.code() == grpc.StatusCode.DEADLINE_EXCEEDED
+        stream.cancel()
+        assert stub.limiter.metrics()[STREAM]["in_flight"] == 0
+
+    def test_histogram(self):
+        h = Histogram(1)
+        for v in [0.5, 1.5, 3, 3, 100]:
+            h.observe(v)
+        assert h.counts[:3] == [1, 1, 2]
+        assert h.quantile(0.5) == 4 and h.to_dict()["count"] == 5
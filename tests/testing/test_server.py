@@ -0,0 +1,66 @@
+import geopandas as gpd
+import grpc
+import numpy as np
+import pytest
+from shapely import geometry
+
+from geocube import Client, Downloader, entities, utils
+from geocube.testing import FakeCatalog, FakeCube, FakeGeocube, FakeServer
+
+
+def cube_params(client, n=5, shape=(64, 32)):
+    records = client.get_records([f"record-{i}" for i in range(n)])
+    return entities.CubeParams.from_records(records, "epsg:3857", entities.geo_transform(0, 0, 10), shape,
+                                            client.variable("fake/variable").instance("master"))
+
+
+class TestFakeServer:
+    @pytest.mark.parametrize("compression", [0, 1, -2])
+    def test_get_cube(self, compression):
+        cube = FakeCube(bands=3, dtype="float32", chunk_size=1000)
+        with FakeServer(FakeGeocube(cube)) as server:
+            client = Client(server.uri, verbose=False)
+            assert client.version() == "fake"
+            images, records = client.get_cube(cube_params(client), compression=compression, verbose=False)
+            assert len(images) == 5 and [rs[0].id for rs in records] == [f"record-{i}" for i in range(5)]
+            np.testing.assert_array_equal(images[0], cube.image(64, 32))
+
+            client.use_downloader(Downloader(server.uri, verbose=False))
+            images, _ = client.get_cube(cube_params(client), verbose=False)
+            np.testing.assert_array_equal(images[4], cube.image(64, 32))
+            assert server.downloader.calls["DownloadCube"] == 1
+
+    def test_errors(self):
+        with FakeServer(FakeGeocube(FakeCube(slice_errors=(1,), fail_after=3))) as server:
+            client = Client(server.uri, verbose=False)
+            params = cube_params(client)
+            cube_it = client.get_cube_it(params)
+            assert next(cube_it)[2] is None
+            assert next(cube_it)[2] == "slice 1: injected error"
+            next(cube_it)
+            with pytest.raises(utils.GeocubeError) as e:
+                next(cube_it)
+            assert e.value.codename == "UNAVAILABLE"
+
+            server.geocube.inject_error("GetAOI", grpc.StatusCode.UNAVAILABLE, count=2)
+            assert not client.load_aoi("aoi-1").is_empty
+            assert server.geocube.calls["GetAOI"] == 3
+            with pytest.raises(utils.GeocubeError):
+                client.load_aoi("aoi-10")
+
+    def test_list_records(self):
+        with FakeServer(FakeGeocube(catalog=FakeCatalog(records=10**7))) as server:
+            client = Client(server.uri, verbose=False)
+            records = client.list_records(limit=1000, page=5000)
+            assert len(records) == 1000 and records[0].id == "record-5000000"
+            assert [r.id for r in client.get_records(["record-3", "record-9"])] == ["record-3", "record-9"]
+
+    def test_create_grid(self):
+        gdf = gpd.GeoDataFrame({"id": [f"cell{i}" for i in range(1000)]},
+                               geometry=[geometry.box(i, 0, i + 1, 1) for i in range(1000)], crs="epsg:32631")
+        with FakeServer(FakeGeocube()) as server:
+            client = Client(server.uri, verbose=False)
+            client.create_grid(entities.Grid.from_geodataframe("grid", "test grid", gdf), max_request_bytes=4096)
+            assert server.geocube.grids == {"grid": 1000}
+            # Through the stub pipeline (metrics)
+            assert client.stub.metrics()["CreateGrid"]["calls"] == 1
@@ -0,0 +1,40 @@
+import pytest
+from shapely import geometry
+
+from geocube.utils import AOIIndex
+
+
+class TestAOIIndex:
+    def test_normalisation(self):
+        index = AOIIndex()
+        square = geometry.Polygon([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])
+        index.add(square, "aoi_1")
+
+        # Same geometry with another starting point and orientation, as a MultiPolygon
+        other = geometry.MultiPolygon([geometry.Polygon([(1, 1), (1, 0), (0, 0), (0, 1), (1, 1)])])
+        assert index.get(other) == "aoi_1"
+        assert index.get(geometry.Polygon([(0, 0), (2, 0), (2, 2), (0, 0)])) is None
+
+    def test_persistence(self, tmp_path):
+        path = str(tmp_path / "aois.idx")
+        square = geometry.Polygon([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])
+        index = AOIIndex(path, uri="geocube:8080")
+        index.add(square, "aoi_1")
+        index.add(square, "aoi_1")
+        AOIIndex(path, uri="other:8080").add(square, "aoi_2")
+
+        index = AOIIndex(path, uri="geocube:8080")
+        assert len(index) == 1
+        assert square in index
+        assert index.get(square) == "aoi_1"
+
+        # The ids of another Geocube are not returned
+        assert AOIIndex(path, uri="other:8080").get(square) == "aoi_2"
+        assert AOIIndex(path, uri="unknown:8080").get(square) is None
+
+        index.clear()
+        assert AOIIndex(path, uri="geocube:8080").get(square) is None
+        assert AOIIndex(path, uri="other:8080").get(square) == "aoi_2"
+
+        with pytest.raises(ValueError):
+            AOIIndex(path)
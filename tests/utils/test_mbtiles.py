@@ -0,0 +1,51 @@
+import threading
+
+from geocube import Client
+from geocube.pb import catalog_pb2
+from geocube.utils import MBTilesCache, xyz_layer
+
+
+class FakeTileStub:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def GetXYZTile(self, req):
+        with self.lock:
+            self.calls += 1
+        return catalog_pb2.GetTileResponse(image=catalog_pb2.ImageFile(data=f"{req.x},{req.y},{req.z}".encode()))
+
+
+class TestMBTiles:
+    def test_cache(self, tmp_path):
+        path = str(tmp_path / "tiles.mbtiles")
+        layer = xyz_layer("instance", ["r1", "r2"])
+        with MBTilesCache(path) as cache:
+            cache.put(layer, 1, 2, 3, b"png")
+            assert cache.get(layer, 1, 2, 3) == b"png"
+            assert cache.get(layer, 1, 2, 4) is None
+            assert cache.get(xyz_layer("instance", ["r1"]), 1, 2, 3) is None
+
+        with MBTilesCache(path) as cache:
+            assert len(cache) == 1
+            assert cache.get_many(layer, [(1, 2, 3), (0, 0, 0)]) == {(1, 2, 3): b"png"}
+
+    def test_get_xyz_tiles(self, tmp_path):
+        client = Client("127.0.0.1:0", verbose=False)
+        client.stub = FakeTileStub()
+        tiles = [(x, y, 5) for x in range(4) for y in range(4)]
+        with MBTilesCache(str(tmp_path / "tiles.mbtiles")) as cache:
+            results = client.get_xyz_tiles("instance", ["r1"], tiles, concurrency=4, cache=cache)
+            assert results == {t: "{},{},{}".format(*t).encode() for t in tiles}
+            assert client.stub.calls == 16
+
+            assert client.get_xyz_tiles("instance", ["r1"], tiles + [(0, 0, 0)], cache=cache)[(3, 2, 5)] == b"3,2,5"
+            assert client.stub.calls == 17
+            assert len(cache) == 17
+
+    def test_get_xyz_tile(self, tmp_path):
+        client = Client("127.0.0.1:0", verbose=False)
+        client.stub = FakeTileStub()
+        assert client.get_xyz_tile("instance", ["r1"], 1, 2, 3) == b"1,2,3"
+        assert client.get_xyz_tile("instance", ["r1"], 1, 2, 3, str(tmp_path / "tile.png")) is None
+        assert (tmp_path / "tile.png").read_bytes() == b"1,2,3"
@@ -0,0 +1,58 @@
+from concurrent import futures
+
+import numpy as np
+import pytest
+import rasterio
+
+from geocube import entities
+from geocube.utils import MosaicWriter
+
+
+def tiles(n=3, size=32):
+    return [entities.Tile.from_geotransform(entities.geo_transform(1000 + 10 * size * i, 2000 - 10 * size * j, 10),
+                                            "epsg:3857", (size, size))
+            for j in range(n) for i in range(n)]
+
+
+class TestMosaicWriter:
+    def test_write(self, tmp_path):
+        path = str(tmp_path / "mosaic.tif")
+        images = [np.full((32, 32, 2), i + 1, dtype="uint16") for i in range(9)]
+        with MosaicWriter.from_tiles(path, tiles()[:-1], dtype="uint8", bands=2, no_data=0, block_size=32,
+                                     overviews=[2, 4]) as mosaic:
+            assert mosaic.shape == (96, 96) and mosaic.transform == tiles()[0].transform
+            # In any order, from several threads
+            with futures.ThreadPoolExecutor(4) as executor:
+                list(executor.map(mosaic.write, tiles()[:-1][::-1], images[:-1][::-1]))
+
+        with rasterio.open(path) as src:
+            assert src.count == 2 and src.dtypes[0] == "uint8" and src.nodata == 0
+            assert src.block_shapes[0] == (32, 32) and src.overviews(1) == [2, 4]
+            assert src.compression.name.lower() == "deflate"
+            data = src.read()
+        for i, tile in enumerate(tiles()):
+            col, row, _, _ = mosaic.window(tile)
+            np.testing.assert_array_equal(data[:, row:row+32, col:col+32], 0 if i == 8 else i + 1)
+
+    def test_cog(self, tmp_path):
+        path = str(tmp_path / "mosaic.tif")
+        with MosaicWriter.from_tiles(path, tiles(4, 64), dtype="float32", no_data=np.nan, block_size=64,
+                                     cog=True) as mosaic:
+            for tile in tiles(4, 64):
+                mosaic.write(tile, np.ones((64, 64), dtype="float64"))
+        with rasterio.open(path) as src:
+            assert src.overviews(1) == [2, 4] and src.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+            assert np.all(src.read(1) == 1)
+        assert not (tmp_path / "mosaic.tif.tmp.tif").exists()
+
+    def test_errors(self, tmp_path):
+        with MosaicWriter.from_tiles(str(tmp_path / "mosaic.tif"), tiles(2), dtype="uint8", block_size=32) as mosaic:
+            with pytest.raises(ValueError):
+                mosaic.write(tiles(4)[-1], np.zeros((32, 32)))
+            unaligned = entities.Tile.from_geotransform(entities.geo_transform(1005, 2000, 10), "epsg:3857", (8, 8))
+            with pytest.raises(ValueError):
+                mosaic.write(unaligned, np.zeros((8, 8)))
+            with pytest.raises(ValueError):
+                mosaic.write(tiles(2)[0], np.zeros((16, 16)))
+        with pytest.raises(ValueError):
+            mosaic.write(tiles(2)[0], np.zeros((32, 32)))